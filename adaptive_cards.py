@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import json
+
+from urllib.parse import quote
+
+from config import DNAC_URL
+
+ADAPTIVE_CARD = 'application/vnd.microsoft.card.adaptive'
+ADAPTIVE_CARD_SCHEMA = 'http://adaptivecards.io/schemas/adaptive-card.json'
+CLIENT_360_URL = DNAC_URL + '/dna/assurance/client/details?macAddress='
+
+
+def placeholder(name):
+    """
+    This function will return the placeholder for the field {name} in a card skeleton
+    :param name: field name
+    :return: placeholder string
+    """
+    return '\x00' + name + '\x00'
+
+
+class CardTemplate:
+    """
+    Adaptive card skeleton, serialized to JSON once. The placeholder strings in the skeleton are replaced
+    by the field values when rendered: each value is converted to a string and JSON escaped, the rest of the
+    card is not serialized again.
+    A placeholder used as a list item, with the name in {raw_fields}, is replaced by pre-serialized JSON,
+    the items of a variable length list.
+    """
+
+    def __init__(self, skeleton, raw_fields=()):
+        """
+        :param skeleton: the card message dict, with placeholder() strings for the values
+        :param raw_fields: the names of the placeholders replaced by pre-serialized JSON list items
+        """
+        serialized = json.dumps(skeleton, separators=(',', ':'))
+        # split the JSON at each quoted placeholder: static, field, static, field, ..., static
+        self._parts = []
+        self._fields = []
+        for index, part in enumerate(serialized.split('"\\u0000')):
+            if index == 0:
+                self._parts.append(part)
+                continue
+            name, static = part.split('\\u0000"', 1)
+            self._fields.append((name, name in raw_fields))
+            self._parts.append(static)
+
+    def render(self, **values):
+        """
+        This function will render the card with the field {values}
+        :param values: the field name -> value, the raw fields are lists of pre-serialized JSON items
+        :return: the card message JSON
+        """
+        chunks = [self._parts[0]]
+        for (name, raw), static in zip(self._fields, self._parts[1:]):
+            if raw:
+                items = ','.join(values[name])
+                if not items:
+                    # empty list, remove the separator before the placeholder
+                    if chunks[-1].endswith(','):
+                        chunks[-1] = chunks[-1][:-1]
+                    elif static.startswith(','):
+                        static = static[1:]
+                chunks.append(items)
+            else:
+                value = values[name]
+                chunks.append(json.dumps(value if isinstance(value, str) else str(value)))
+            chunks.append(static)
+        return ''.join(chunks)
+
+
+def with_room_id(card_body, room_id):
+    """
+    This function will add the Webex Teams {room_id} to the rendered card message {card_body}
+    :param card_body: the card message JSON, without the roomId
+    :param room_id: the Webex Teams room Id
+    :return: the card message JSON
+    """
+    rest = card_body[1:]
+    return '{"roomId":' + json.dumps(room_id) + ('' if rest.lstrip() == '}' else ',') + rest
+
+
+def _card_message(title, body, actions=None):
+    content = {
+        "$schema": ADAPTIVE_CARD_SCHEMA,
+        "type": "AdaptiveCard",
+        "version": "1.0",
+        "body": [
+            {
+                "type": "TextBlock",
+                "text": title,
+                "weight": "bolder",
+                "size": "large"
+            }
+        ] + body
+    }
+    if actions is not None:
+        content['actions'] = actions
+    return {
+        "markdown": title,
+        "attachments": [
+            {
+                "contentType": ADAPTIVE_CARD,
+                "content": content
+            }
+        ]
+    }
+
+
+def _fact_set(facts):
+    return {
+        "type": "FactSet",
+        "facts": [{"title": title, "value": placeholder(name)} for title, name in facts]
+    }
+
+
+def _client_360_action():
+    return [
+        {
+            "type": "Action.openURL",
+            "title": "Cisco DNA Center Client 360",
+            "url": placeholder('client_360_url')
+        }
+    ]
+
+
+NOTIFICATION_CARD = CardTemplate(_card_message('Wireless Client Notification', [
+    {
+        "type": "TextBlock",
+        "text": "Cisco DNA Center identified low wireless performance for this client:",
+        "wrap": True
+    },
+    _fact_set([('Username: ', 'username'), ('MAC Address:', 'mac_address'), ('Location:', 'location'),
+               ('Access Point:', 'access_point'), ('SSID:', 'ssid'), ('Health Score:', 'client_health'),
+               ('Total data:', 'total_data'), ('SNR:', 'snr')])
+], _client_360_action()))
+
+STATUS_CARD = CardTemplate(_card_message('Wireless Client Status', [
+    {
+        "type": "TextBlock",
+        "text": placeholder('status_text'),
+        "wrap": True
+    },
+    _fact_set([('Username: ', 'username'), ('MAC Address:', 'mac_address'), ('Location:', 'location'),
+               ('Access Point:', 'access_point'), ('SSID:', 'ssid'), ('Health Score:', 'client_health'),
+               ('SNR:', 'snr')])
+], _client_360_action()))
+
+DIGEST_COLUMNS = (('Username', 'username'), ('Health Score', 'client_health'), ('SNR', 'snr'),
+                  ('Access Point', 'access_point'))
+
+
+def _digest_row(cells, weight=None):
+    columns = []
+    for cell in cells:
+        text_block = {"type": "TextBlock", "text": cell, "wrap": True}
+        if weight is not None:
+            text_block['weight'] = weight
+        columns.append({"type": "Column", "items": [text_block]})
+    return {"type": "ColumnSet", "columns": columns}
+
+
+DIGEST_CARD = CardTemplate(_card_message('Wireless Clients Notification', [
+    {
+        "type": "TextBlock",
+        "text": placeholder('summary'),
+        "wrap": True
+    },
+    _digest_row([title for title, _ in DIGEST_COLUMNS], weight='bolder'),
+    placeholder('rows')
+]), raw_fields=('rows',))
+
+DIGEST_ROW = CardTemplate(_digest_row([placeholder(name) for _, name in DIGEST_COLUMNS]))
+
+
+def get_client_360_url(mac_address):
+    """
+    This function will return the Cisco DNA Center Client 360 url for the client with the {mac_address}
+    :param mac_address: client MAC address
+    :return: url
+    """
+    return CLIENT_360_URL + quote(str(mac_address), safe=':')
+
+
+def render_notification_card(client_state):
+    """
+    This function will render the low performance notification card for the client {client_state}
+    :param client_state: the client state, with the last collected metrics
+    :return: the card message JSON, without the roomId
+    """
+    metrics = client_state['metrics']
+    return NOTIFICATION_CARD.render(
+        username=client_state['username'], mac_address=client_state['mac_address'], location=metrics['location'],
+        access_point=metrics['access_point'], ssid=metrics['ssid'], client_health=metrics['client_health'],
+        total_data=metrics['total_data'], snr=metrics['snr'],
+        client_360_url=get_client_360_url(client_state['mac_address']))
+
+
+def render_status_card(username, details):
+    """
+    This function will render the status card for the client {username}, from the last client report
+    :param username: client username
+    :param details: the client report details
+    :return: the card message JSON, without the roomId
+    """
+    return STATUS_CARD.render(
+        status_text='Last collected status for this client, ' + str(details['timestamp']) + ':',
+        username=username, mac_address=details['mac_address'], location=details['location'],
+        access_point=details['access_point'], ssid=details['ssid'],
+        client_health=details['health_score'][0]['score'], snr=details['snr'],
+        client_360_url=get_client_360_url(details['mac_address']))
+
+
+def render_digest_card(group_field, group_value, client_states):
+    """
+    This function will render the digest card, one table row for each client with low performance,
+    for the clients connected to the same access point, SSID or location
+    :param group_field: the metrics field the clients are grouped by: access_point, ssid or location
+    :param group_value: the common value
+    :param client_states: list of client states, with the last collected metrics
+    :return: the card message JSON, without the roomId
+    """
+    rows = [DIGEST_ROW.render(username=client_state['username'],
+                              client_health=client_state['metrics']['client_health'],
+                              snr=client_state['metrics']['snr'],
+                              access_point=client_state['metrics']['access_point'])
+            for client_state in client_states]
+    summary = 'Cisco DNA Center identified low wireless performance for %s clients, %s: %s' % (
+        len(client_states), group_field.replace('_', ' ').title(), group_value)
+    return DIGEST_CARD.render(summary=summary, rows=rows)
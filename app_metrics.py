@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import bisect
+import logging
+import functools
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_HOST, METRICS_PORT
+
+from dnac_token import get_error_status_code
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# in seconds, the outbound API call latency
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_sample(name, labels, value):
+    """
+    This function will format one sample in the Prometheus text format
+    :param name: the sample name
+    :param labels: list of (label name, label value) tuples
+    :param value: the sample value
+    :return: the sample line
+    """
+    if labels:
+        return '%s{%s} %s' % (name, ','.join('%s="%s"' % (label, _escape(label_value))
+                                             for label, label_value in labels), _format_value(value))
+    return '%s %s' % (name, _format_value(value))
+
+
+class Metric:
+    """
+    One metric family, with one value for each combination of the {labelnames} values
+    """
+
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: the metric name
+        :param documentation: the metric help text
+        :param labelnames: tuple with the label names
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('%s labels required: %s' % (self.name, ', '.join(self.labelnames)))
+        return tuple(str(labels[label]) for label in self.labelnames)
+
+    def get(self, **labels):
+        """
+        This function will return the metric value for the {labels}
+        :param labels: the label values
+        :return: the value, None if not recorded
+        """
+        return self._values.get(self._key(labels))
+
+    def collect(self):
+        """
+        This function will return the metric samples
+        :return: list of (sample name, list of (label name, label value), value)
+        """
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in sorted(items)]
+
+
+class Counter(Metric):
+    """
+    Counter, only increased
+    """
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        This function will increase the counter for the {labels} by {amount}
+        :param amount: the increment, not negative
+        :param labels: the label values
+        :return: none
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Gauge, set to the current value, or read from a function when collected
+    """
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}  # label values tuple -> function returning the value
+
+    def set(self, value, **labels):
+        """
+        This function will set the gauge for the {labels} to {value}
+        :param value: the gauge value
+        :param labels: the label values
+        :return: none
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels):
+        """
+        This function will read the gauge for the {labels} from {function}, each time the metrics are collected
+        :param function: function called without arguments, returns the gauge value
+        :param labels: the label values
+        :return: none
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def collect(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        samples = super().collect()
+        for key, function in sorted(functions, key=lambda item: item[0]):
+            try:
+                value = function()
+            except Exception:
+                logging.exception('Gauge %s not collected', self.name)
+                continue
+            samples.append((self.name, list(zip(self.labelnames, key)), value))
+        return samples
+
+
+class Histogram(Metric):
+    """
+    Histogram, the observed values counted in cumulative {buckets}, with their sum and count
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        This function will count the {value} for the {labels}
+        :param value: the observed value
+        :param labels: the label values
+        :return: none
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count for each bucket, the +Inf bucket, the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def collect(self):
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        samples = []
+        for key, counts in sorted(items):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((self.name + '_bucket', labels + [('le', _format_value(bound))], cumulative))
+            samples.append((self.name + '_sum', labels, counts[-1]))
+            samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+    The collectors are functions called when the metrics are rendered, returning metrics built from the
+    statistics the components already keep, the rate limiters, the queues.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        This function will add the {metric} to the registry
+        :param metric: Counter, Gauge or Histogram
+        :return: the metric
+        """
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        This function will create and register a Counter
+        :return: the Counter
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """
+        This function will create and register a Gauge
+        :return: the Gauge
+        """
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        This function will create and register a Histogram
+        :return: the Histogram
+        """
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """
+        This function will add the {collector}, called each time the metrics are rendered
+        :param collector: function called without arguments, returns a list of metrics
+        :return: none
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """
+        This function will render all the metrics, the metrics with the same name are merged in one family
+        :return: the metrics in the Prometheus text format
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception:
+                logging.exception('Metrics collector failed')
+        families = {}
+        for metric in metrics:
+            family = families.setdefault(metric.name, (metric, []))
+            family[1].extend(metric.collect())
+        lines = []
+        for name, (metric, samples) in families.items():
+            lines.append('# HELP %s %s' % (name, _escape(metric.documentation)))
+            lines.append('# TYPE %s %s' % (name, metric.metric_type))
+            lines.extend(format_sample(*sample) for sample in samples)
+        return '\n'.join(lines) + '\n'
+
+
+# the metrics of this process, exposed on /metrics
+REGISTRY = MetricsRegistry()
+
+API_CALL_SECONDS = REGISTRY.histogram('wireless_api_call_seconds', 'Outbound API call latency in seconds', ('api',))
+API_CALLS = REGISTRY.counter('wireless_api_calls_total', 'Outbound API calls, by response status code',
+                             ('api', 'status'))
+SWEEPS = REGISTRY.counter('wireless_poller_sweeps_total', 'Poller sweeps completed')
+SWEEP_SECONDS = REGISTRY.gauge('wireless_poller_sweep_duration_seconds', 'Duration of the last poller sweep')
+POLLED_CLIENTS = REGISTRY.gauge('wireless_poller_clients', 'Clients polled in the last sweep')
+CLIENTS_IN_ALERT = REGISTRY.gauge('wireless_poller_clients_in_alert',
+                                  'Clients with low performance in the last sweep, alert counter above zero')
+ALERTS = REGISTRY.counter('wireless_poller_alerts_total', 'Clients reaching their counter max, notified')
+SCHEDULED_RATE = REGISTRY.gauge('wireless_poller_scheduled_calls_per_minute',
+                                'Client detail calls/minute planned by the poll scheduler')
+POLL_FAILURES = REGISTRY.counter('wireless_poller_failures_total', 'Client polls failed with an exception')
+HTTP_RETRIES = REGISTRY.counter('wireless_http_retries_total', 'HTTP requests retried by the connection pool',
+                                ('host', 'reason'))
+QUEUE_DEPTH = REGISTRY.gauge('wireless_queue_depth', 'Items waiting in the in-memory queues', ('queue',))
+
+
+# the HTTP status code of the last response received by each thread, recorded by http_transport
+_call_status = threading.local()
+
+
+def record_status_code(status_code):
+    """
+    This function will record the HTTP {status_code} of the last response received by the current thread
+    :param status_code: the HTTP status code
+    :return: none
+    """
+    _call_status.status_code = status_code
+
+
+def get_status(result=None, error=None):
+    """
+    This function will return the status label for an API call
+    :param result: the API call result, a requests Response or the SDK response
+    :param error: the exception raised by the API call
+    :return: the HTTP status code: of the {result} Response, or of the last response received by the thread,
+    for the REST functions returning the JSON, '2xx' for the SDK functions, the SDK raises for the other status
+    codes, 'error' for an exception without status code
+    """
+    if error is not None:
+        return str(get_error_status_code(error) or 'error')
+    status_code = getattr(result, 'status_code', None) or getattr(_call_status, 'status_code', None)
+    return '2xx' if status_code is None else str(status_code)
+
+
+def instrumented(api):
+    """
+    Decorator to record the latency and the response status of the decorated API call function
+    Used below @rate_limited, to record each call attempt, without the rate limit wait time
+    :param api: the API name, the {api} label
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            _call_status.status_code = None
+            try:
+                result = function(*args, **kwargs)
+            except Exception as error:
+                API_CALL_SECONDS.observe(time.perf_counter() - start_time, api=api)
+                API_CALLS.inc(api=api, status=get_status(error=error))
+                raise
+            API_CALL_SECONDS.observe(time.perf_counter() - start_time, api=api)
+            API_CALLS.inc(api=api, status=get_status(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def collect_rate_limiter(rate_limiter):
+    """
+    This function will build the metrics from the {rate_limiter} wait statistics
+    :param rate_limiter: RateLimiter
+    :return: list of metrics
+    """
+    calls = Counter('wireless_rate_limit_calls_total', 'API calls through the rate limiter', ('endpoint',))
+    waits = Counter('wireless_rate_limit_waits_total', 'API calls that waited for the rate limit', ('endpoint',))
+    wait_seconds = Counter('wireless_rate_limit_wait_seconds_total', 'Time waited for the rate limit, in seconds',
+                           ('endpoint',))
+    blocked = Counter('wireless_rate_limit_blocked_total', 'Endpoint blocked after a 429 response', ('endpoint',))
+    retries = Counter('wireless_rate_limit_retries_total', 'API calls retried after a 429 response', ('endpoint',))
+    for endpoint, stats in rate_limiter.get_wait_stats().items():
+        calls.inc(stats['calls'], endpoint=endpoint)
+        waits.inc(stats['waits'], endpoint=endpoint)
+        wait_seconds.inc(stats['wait_seconds'], endpoint=endpoint)
+        blocked.inc(stats['blocked'], endpoint=endpoint)
+        retries.inc(stats.get('retries', 0), endpoint=endpoint)
+    return [calls, waits, wait_seconds, blocked, retries]
+
+
+def collect_stats(prefix, stats, counters):
+    """
+    This function will build the metrics from the {stats} dict of a component
+    :param prefix: the metric name prefix
+    :param stats: dict with the statistics, as returned by the get_stats() of the queues
+    :param counters: the names of the counters in {stats}, the other numeric values are gauges
+    :return: list of metrics
+    """
+    metrics = []
+    for name, value in sorted(stats.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if name in counters:
+            metric = Counter('%s_%s_total' % (prefix, name), '%s %s' % (prefix, name))
+            metric.inc(value)
+        else:
+            metric = Gauge('%s_%s' % (prefix, name), '%s %s' % (prefix, name))
+            metric.set(value)
+        metrics.append(metric)
+    return metrics
+
+
+def register_poller_metrics(notification_queue, report_sender=None, registry=REGISTRY):
+    """
+    This function will add the poller components metrics to the {registry}: the Cisco DNA Center and Webex Teams
+    rate limiters, the notification queue and the optional report sender
+    :param notification_queue: the NotificationQueue
+    :param report_sender: optional ReportSender
+    :param registry: the MetricsRegistry
+    :return: none
+    """
+    from rate_limiter import get_rate_limiter
+
+    registry.add_collector(lambda: collect_rate_limiter(get_rate_limiter()))
+    registry.add_collector(lambda: collect_rate_limiter(notification_queue.rate_limiter))
+    registry.add_collector(lambda: collect_stats('wireless_notifications', notification_queue.get_stats(),
+                                                 ('alerts', 'cards', 'digests', 'retries', 'failed')))
+    QUEUE_DEPTH.set_function(lambda: notification_queue.get_stats()['queued'], queue='notifications')
+    if report_sender is not None:
+        registry.add_collector(lambda: collect_stats('wireless_reports', {
+            'sent': report_sender.sent_count, 'dropped': report_sender.dropped_count}, ('sent', 'dropped')))
+        QUEUE_DEPTH.set_function(report_sender.depth, queue='reports')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    HTTP request handler for the standalone /metrics endpoint
+    """
+
+    def log_message(self, format, *args):
+        # no access log, scraped every few seconds
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST, registry=REGISTRY):
+    """
+    This function will start the standalone /metrics endpoint, for the pollers, in a background thread
+    :param port: the listening port, 0 to select a free port
+    :param host: the listening address
+    :param registry: the MetricsRegistry
+    :return: the HTTP server, None if the {port} is None or the endpoint could not be started
+    """
+    if port is None:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as error:
+        # the poller runs without the metrics endpoint, for example if another poller uses the port
+        logging.warning('Metrics endpoint not started on %s:%s: %s', host, port, error)
+        return None
+    server.daemon_threads = True
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logging.info('Metrics endpoint listening on %s:%s', *server.server_address[:2])
+    return server
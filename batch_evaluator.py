@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import numpy as np
+
+from config import BW_LOW, HEALTH_LOW, COUNTER_MAX, SNR
+
+NAN = float('nan')
+
+
+class BatchEvaluator:
+    """
+    Threshold evaluation for all the monitored clients, in one vectorized pass for each sweep.
+    Each client is one row of the NumPy arrays: the last collected metrics, the client thresholds and
+    the consecutive low performance counter. The pollers store the metrics of each sample in the arrays,
+    evaluate() updates all the counters at the end of the sweep:
+     - a client with a sample below any threshold increases its counter
+     - a client with a good sample resets its counter
+     - a client without a sample this sweep keeps its counter
+    """
+
+    def __init__(self, health_low=HEALTH_LOW, snr_low=SNR, bw_low=BW_LOW, counter_max=COUNTER_MAX, capacity=1024):
+        """
+        :param health_low: default minimum health score
+        :param snr_low: default minimum SNR
+        :param bw_low: default minimum total data transfer, in bytes
+        :param counter_max: default number of consecutive low performance samples to alert
+        :param capacity: initial number of rows, doubled when full
+        """
+        self.default_thresholds = (health_low, snr_low, bw_low)
+        self.counter_max = counter_max
+        self._rows = {}  # client key -> row
+        self._keys = []
+        self.health = np.full(capacity, NAN)
+        self.snr = np.full(capacity, NAN)
+        self.total_data = np.full(capacity, NAN)
+        self.sampled = np.zeros(capacity, dtype=bool)
+        self.health_low = np.full(capacity, float(health_low))
+        self.snr_low = np.full(capacity, float(snr_low))
+        self.bw_low = np.full(capacity, float(bw_low))
+        self.counter_limit = np.full(capacity, counter_max, dtype=np.int32)
+        self.counters = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _grow(self, capacity):
+        for name, fill in (('health', NAN), ('snr', NAN), ('total_data', NAN), ('sampled', False),
+                           ('health_low', self.default_thresholds[0]), ('snr_low', self.default_thresholds[1]),
+                           ('bw_low', self.default_thresholds[2]), ('counter_limit', self.counter_max),
+                           ('counters', 0)):
+            array = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add_clients(self, keys):
+        """
+        This function will add a row for each new client in {keys}, not thread safe, called before the sweep
+        :param keys: the client keys, the usernames
+        :return: none
+        """
+        for key in keys:
+            if key in self._rows:
+                continue
+            if len(self._keys) == len(self.counters):
+                self._grow(len(self.counters) * 2)
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+
+    def set_thresholds(self, key, thresholds):
+        """
+        This function will set the thresholds for the client {key}
+        :param key: the client key
+        :param thresholds: Thresholds, with the health_low, snr_low, bw_low and counter_max
+        :return: none
+        """
+        row = self._rows[key]
+        self.health_low[row] = thresholds.health_low
+        self.snr_low[row] = thresholds.snr_low
+        self.bw_low[row] = thresholds.bw_low
+        self.counter_limit[row] = thresholds.counter_max
+
+    def set_metrics(self, key, metrics, thresholds=None):
+        """
+        This function will store the sample {metrics} for the client {key}, called by the pollers
+        :param key: the client key
+        :param metrics: the parsed client metrics
+        :param thresholds: optional Thresholds for the client, from the threshold profiles
+        :return: none
+        """
+        row = self._rows[key]
+        if thresholds is not None:
+            self.set_thresholds(key, thresholds)
+        # the missing metrics are stored as NaN, never below the thresholds
+        client_health, snr, total_data = metrics['client_health'], metrics['snr'], metrics['total_data']
+        self.health[row] = NAN if client_health is None else client_health
+        self.snr[row] = NAN if snr is None else snr
+        self.total_data[row] = NAN if total_data is None else total_data
+        self.sampled[row] = True
+
+    def set_counter(self, key, counter):
+        """
+        This function will set the consecutive low performance counter for the client {key}, restored at startup
+        :param key: the client key
+        :param counter: the counter
+        :return: none
+        """
+        self.counters[self._rows[key]] = counter
+
+    def get_counter(self, key):
+        """
+        This function will return the consecutive low performance counter for the client {key}
+        :param key: the client key
+        :return: the counter
+        """
+        return int(self.counters[self._rows[key]])
+
+    def evaluate(self):
+        """
+        This function will update the counters of all the clients with the samples of this sweep
+        The counters of the clients reaching their counter_max are reset, the caller is alerting them
+        :return: list of the client keys reaching their counter_max
+        """
+        count = len(self._keys)
+        sampled = self.sampled[:count]
+        counters = self.counters[:count]
+        # NaN health score, not reported, is not a low health score
+        low = ((self.health[:count] <= self.health_low[:count]) | (self.snr[:count] <= self.snr_low[:count]) |
+               (self.total_data[:count] <= self.bw_low[:count]))
+        counters[sampled & low] += 1
+        counters[sampled & ~low] = 0
+        alert_rows = np.flatnonzero(counters >= self.counter_limit[:count])
+        counters[alert_rows] = 0
+        sampled[:] = False
+        return [self._keys[row] for row in alert_rows]
@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# Benchmarks for the application components, run offline with synthetic data.
+# Usage: python benchmarks.py <benchmark> [options], python benchmarks.py --help for the list
+
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from datetime import datetime, timedelta
+
+
+def build_report(index, client_count, report_time):
+    """
+    This function will build a synthetic wireless client report, as sent by the poller
+    :param index: report index
+    :param client_count: number of synthetic clients
+    :param report_time: the report datetime
+    :return: client report
+    """
+    return {
+        'username': 'user%05d' % (index % client_count),
+        'details': {
+            'mac_address': '02:00:00:00:%02x:%02x' % ((index % client_count) >> 8 & 0xff, index % client_count & 0xff),
+            'location': 'Global/Site-1/Building-2/Floor-3',
+            'access_point': 'ap-%03d' % (index % 200),
+            'ssid': 'ssid-%d' % (index % 4),
+            'health_score': [{'healthType': 'OVERALL', 'reason': '', 'score': index % 10 + 1},
+                             {'healthType': 'ONBOARDED', 'reason': '', 'score': 4},
+                             {'healthType': 'CONNECTED', 'reason': '', 'score': index % 10 + 1}],
+            'total_data': float(index * 1000),
+            'snr': float(index % 60),
+            'data_rate': 300.0,
+            'timestamp': report_time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+    }
+
+
+def build_reports(report_count, client_count):
+    """
+    This function will build {report_count} synthetic reports for {client_count} clients, one minute apart
+    :param report_count: number of reports
+    :param client_count: number of synthetic clients
+    :return: list of client reports
+    """
+    start_time = datetime.now() - timedelta(minutes=report_count // client_count + 1)
+    return [build_report(index, client_count, start_time + timedelta(minutes=index // client_count))
+            for index in range(report_count)]
+
+
+def print_result(name, count, duration, unit='reports'):
+    print('%-40s %10d %s in %8.3f seconds, %12.1f %s/second' % (name, count, unit, duration, count / duration, unit))
+
+
+def benchmark_ingest(args):
+    """
+    Sustained /wireless_clients ingestion rate:
+     - synchronous: each report written in the request thread, as before the ingest queue
+     - queued: put() latency seen by the request thread, and the background writer throughput
+    """
+    from sample_store import SampleStore, report_to_sample
+    from ingest_queue import IngestQueue, write_reports
+
+    reports = build_reports(args.reports, args.clients)
+    with tempfile.TemporaryDirectory() as folder:
+        sample_store = SampleStore(os.path.join(folder, 'history_sync'))
+        start_time = time.perf_counter()
+        for report in reports:
+            with open(os.path.join(folder, report['username'] + '.json'), 'w') as filehandle:
+                filehandle.write('%s\n' % json.dumps(report))
+                if args.fsync:
+                    filehandle.flush()
+                    os.fsync(filehandle.fileno())
+            sample_store.append(report['username'], [report_to_sample(report)], report['details']['mac_address'],
+                                fsync=args.fsync)
+        print_result('synchronous write', len(reports), time.perf_counter() - start_time)
+
+        sample_store = SampleStore(os.path.join(folder, 'history_queue'))
+        ingest_queue = IngestQueue(lambda batch: write_reports(batch, sample_store, folder, args.fsync),
+                                   maxsize=len(reports))
+        start_time = time.perf_counter()
+        for report in reports:
+            ingest_queue.put(report)
+        put_duration = time.perf_counter() - start_time
+        ingest_queue.join()
+        total_duration = time.perf_counter() - start_time
+        ingest_queue.close()
+        print_result('queued, request thread put()', len(reports), put_duration)
+        print_result('queued, sustained write', len(reports), total_duration)
+        print('%-40s %10d batches, %.1f reports/batch' % ('queued, writer batches', ingest_queue.batch_count,
+                                                         len(reports) / max(1, ingest_queue.batch_count)))
+
+
+def benchmark_wire(args):
+    """
+    Client reports wire format, bytes on the wire and encode/decode CPU time per 10k reports:
+     - single: one plain JSON request for each report, as before the batch endpoint
+     - batches of --batch reports, for each available content type and compression
+    """
+    from report_codec import CONTENT_TYPES, CONTENT_ENCODINGS, encode_body, decode_request, compress
+
+    reports = build_reports(args.reports, args.clients)
+    scale = 10000.0 / len(reports)
+    print('%-32s %14s %12s %12s' % ('format', 'bytes/10k', 'encode ms', 'decode ms'))
+
+    start_time = time.process_time()
+    bodies = [json.dumps(report).encode('utf-8') for report in reports]
+    encode_duration = time.process_time() - start_time
+    start_time = time.process_time()
+    for body in bodies:
+        json.loads(body)
+    decode_duration = time.process_time() - start_time
+    print('%-32s %14d %12.1f %12.1f' % ('single, json', sum(len(body) for body in bodies) * scale,
+                                        encode_duration * 1000 * scale, decode_duration * 1000 * scale))
+
+    batches = [reports[start:start + args.batch] for start in range(0, len(reports), args.batch)]
+    for content_type in CONTENT_TYPES:
+        for content_encoding in CONTENT_ENCODINGS:
+            start_time = time.process_time()
+            bodies = [compress(encode_body(batch, content_type), content_encoding) for batch in batches]
+            encode_duration = time.process_time() - start_time
+            start_time = time.process_time()
+            for body in bodies:
+                decode_request(body, content_type, content_encoding)
+            decode_duration = time.process_time() - start_time
+            name = 'batch %d, %s, %s' % (args.batch, content_type.split('/')[1], content_encoding)
+            print('%-32s %14d %12.1f %12.1f' % (name, sum(len(body) for body in bodies) * scale,
+                                                encode_duration * 1000 * scale, decode_duration * 1000 * scale))
+
+
+def benchmark_status(args):
+    """
+    Bot status lookup latency, for --clients clients:
+     - file: read and parse the <username>.json file, as before the status index
+     - index: StatusIndex lookup, in memory
+     - snapshot: StatusIndex warm-loaded from the snapshot, first lookup of each client
+    """
+    import random
+    from status_index import StatusIndex, read_status_file
+
+    reports = build_reports(args.clients, args.clients)
+    usernames = [report['username'] for report in reports]
+    lookups = [random.choice(usernames) for _ in range(args.reports)]
+    with tempfile.TemporaryDirectory() as folder:
+        for report in reports:
+            with open(os.path.join(folder, report['username'] + '.json'), 'w') as filehandle:
+                filehandle.write('%s\n' % json.dumps(report))
+
+        start_time = time.perf_counter()
+        for username in lookups:
+            read_status_file(username, folder)
+        print_result('file read', len(lookups), time.perf_counter() - start_time, 'lookups')
+
+        status_index = StatusIndex(folder, maxsize=args.clients)
+        status_index.update(reports)
+        start_time = time.perf_counter()
+        for username in lookups:
+            status_index.get(username)
+        print_result('index', len(lookups), time.perf_counter() - start_time, 'lookups')
+        status_index.save_snapshot()
+
+        start_time = time.perf_counter()
+        status_index = StatusIndex(folder, maxsize=args.clients)
+        print_result('snapshot warm-load', len(status_index), time.perf_counter() - start_time, 'clients')
+        start_time = time.perf_counter()
+        for username in usernames:
+            status_index.get(username)
+        print_result('snapshot, first lookup', len(usernames), time.perf_counter() - start_time, 'lookups')
+
+
+def build_metrics(index):
+    """
+    This function will build synthetic client metrics, as parsed by the poller
+    :param index: client index
+    :return: dict with the client metrics
+    """
+    return {'client_health': index % 10 + 1, 'snr': float(index % 80), 'total_data': float(index % 1000) * 10,
+            'data_rate': 300.0}
+
+
+def benchmark_evaluate(args):
+    """
+    Sweep threshold evaluation cost, for --clients clients:
+     - scalar: check_client_performance() and the counter update, for each client
+     - batch: BatchEvaluator, the metrics stored by the pollers, and one vectorized evaluate() pass
+    """
+    from client_poller import check_client_performance, create_client_state
+    from batch_evaluator import BatchEvaluator
+
+    client_states = [create_client_state('user%05d' % index, None) for index in range(args.clients)]
+    all_metrics = [build_metrics(index) for index in range(args.clients)]
+    sweeps = 10
+
+    start_time = time.perf_counter()
+    for _ in range(sweeps):
+        for client_state, metrics in zip(client_states, all_metrics):
+            if check_client_performance(metrics):
+                client_state['alert_count'] += 1
+            else:
+                client_state['alert_count'] = 0
+    print_result('scalar evaluation', args.clients * sweeps, time.perf_counter() - start_time, 'clients')
+
+    evaluator = BatchEvaluator()
+    evaluator.add_clients(client_state['username'] for client_state in client_states)
+    set_duration = 0.0
+    evaluate_duration = 0.0
+    for _ in range(sweeps):
+        start_time = time.perf_counter()
+        for client_state, metrics in zip(client_states, all_metrics):
+            evaluator.set_metrics(client_state['username'], metrics)
+        set_duration += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        evaluator.evaluate()
+        evaluate_duration += time.perf_counter() - start_time
+    print_result('batch, pollers set_metrics()', args.clients * sweeps, set_duration, 'clients')
+    print_result('batch, evaluate()', args.clients * sweeps, evaluate_duration, 'clients')
+    print('%-40s %10.3f ms/sweep' % ('batch, evaluate() per sweep', evaluate_duration * 1000 / sweeps))
+
+
+def build_card_dict(space_id, client_state, dnac_url):
+    """
+    This function will create the notification card as a dict, as before the adaptive_cards module
+    :param space_id: the Webex Teams room Id
+    :param client_state: the client state, with the last collected metrics
+    :param dnac_url: the Cisco DNA Center url
+    :return: card message
+    """
+    metrics = client_state['metrics']
+    client_360_url = dnac_url + '/dna/assurance/client/details?macAddress=' + client_state['mac_address']
+    return {
+        "roomId": space_id,
+        "markdown": "Wireless Client Notification",
+        "attachments": [{
+            "contentType": "application/vnd.microsoft.card.adaptive",
+            "content": {
+                "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
+                "type": "AdaptiveCard",
+                "version": "1.0",
+                "body": [
+                    {"type": "TextBlock", "text": "Wireless Client Notification", "weight": "bolder", "size": "large"},
+                    {"type": "TextBlock",
+                     "text": "Cisco DNA Center identified low wireless performance for this client:", "wrap": True},
+                    {"type": "FactSet", "facts": [
+                        {"title": "Username: ", "value": client_state['username']},
+                        {"title": "MAC Address:", "value": client_state['mac_address']},
+                        {"title": "Location:", "value": metrics['location']},
+                        {"title": "Access Point:", "value": metrics['access_point']},
+                        {"title": "SSID:", "value": metrics['ssid']},
+                        {"title": "Health Score:", "value": str(metrics['client_health'])},
+                        {"title": "Total data:", "value": str(metrics['total_data'])},
+                        {"title": "SNR:", "value": str(metrics['snr'])}]}
+                ],
+                "actions": [{"type": "Action.openURL", "title": "Cisco DNA Center Client 360",
+                             "url": client_360_url}]
+            }
+        }]
+    }
+
+
+def benchmark_cards(args):
+    """
+    Notification card rendering, for --reports alerts:
+     - dict: the card dict built and serialized with json.dumps for each alert, as before the adaptive_cards module
+     - template: the pre-serialized card skeleton, only the values are escaped and joined
+     - digest: one digest card for the alerts, in groups of --batch clients
+    """
+    from config import DNAC_URL
+    from adaptive_cards import render_notification_card, render_digest_card, with_room_id
+
+    client_states = []
+    for index, report in enumerate(build_reports(args.reports, args.clients)):
+        details = report['details']
+        client_states.append({'username': report['username'], 'mac_address': details['mac_address'], 'metrics': {
+            'location': details['location'], 'access_point': details['access_point'], 'ssid': details['ssid'],
+            'client_health': details['health_score'][0]['score'], 'total_data': details['total_data'],
+            'snr': details['snr']}})
+    assert json.loads(with_room_id(render_notification_card(client_states[0]), 'room')) == \
+        build_card_dict('room', client_states[0], DNAC_URL)
+
+    start_time = time.perf_counter()
+    for client_state in client_states:
+        json.dumps(build_card_dict('room', client_state, DNAC_URL))
+    print_result('dict and json.dumps', len(client_states), time.perf_counter() - start_time, 'cards')
+
+    start_time = time.perf_counter()
+    for client_state in client_states:
+        with_room_id(render_notification_card(client_state), 'room')
+    print_result('pre-serialized template', len(client_states), time.perf_counter() - start_time, 'cards')
+
+    start_time = time.perf_counter()
+    for start in range(0, len(client_states), args.batch):
+        render_digest_card('access_point', 'ap-001', client_states[start:start + args.batch])
+    print_result('digest, %d clients/card' % args.batch, len(client_states), time.perf_counter() - start_time,
+                 'clients')
+
+
+def parse_detail_dict(client_info):
+    """
+    This function will parse the client detail info to a metrics dict, as before the client_sample module
+    :param client_info: client detail info
+    :return: dict with the client metrics
+    """
+    detail = client_info['detail']
+    client_health = None
+    for score in detail['healthScore']:
+        if score['healthType'] == 'OVERALL':
+            client_health = score['score']
+    return {'health_score': detail['healthScore'], 'client_health': client_health,
+            'total_data': float(detail['txBytes']) + float(detail['rxBytes']),
+            'access_point': detail['clientConnection'], 'snr': float(detail['snr']),
+            'data_rate': float(detail['dataRate']), 'location': detail['location'], 'ssid': detail['ssid']}
+
+
+def measure_history(build_history):
+    """
+    This function will measure the memory allocated by {build_history}
+    :param build_history: function returning the history, kept alive while measured
+    :return: allocated bytes
+    """
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    history = build_history()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del history
+    return allocated
+
+
+def benchmark_samples(args):
+    """
+    Client detail parsing and in-memory history cost, for --reports client-detail responses of --clients clients:
+     - dict: json.loads and the metrics dict, as before the client_sample module
+     - sample: decode_json (orjson if installed) and the single-pass ClientSample
+     - history: memory for --reports samples kept in memory, raw responses, metrics dicts, ClientSample
+    """
+    from dnac_stub import generate_client, build_client_detail
+    from client_sample import parse_client_detail, decode_json, orjson
+
+    bodies = [json.dumps(build_client_detail(generate_client(index % args.clients, index // args.clients)))
+              .encode('utf-8') for index in range(args.reports)]
+    sample = parse_client_detail(json.loads(bodies[0])).to_dict()
+    metrics = parse_detail_dict(json.loads(bodies[0]))
+    # the health score reason is not kept
+    assert sample.pop('health_score') == [{'healthType': score['healthType'], 'score': score['score']}
+                                          for score in metrics.pop('health_score')]
+    assert sample == metrics
+
+    start_time = time.perf_counter()
+    for body in bodies:
+        parse_detail_dict(json.loads(body))
+    print_result('dict, json.loads', len(bodies), time.perf_counter() - start_time, 'samples')
+
+    start_time = time.perf_counter()
+    for body in bodies:
+        parse_client_detail(decode_json(body))
+    print_result('sample, %s' % ('orjson' if orjson else 'json.loads'), len(bodies),
+                 time.perf_counter() - start_time, 'samples')
+
+    # the responses are not kept, only the parsed history
+    for name, build_history in (
+            ('raw responses', lambda: [json.loads(body) for body in bodies]),
+            ('metrics dicts', lambda: [parse_detail_dict(json.loads(body)) for body in bodies]),
+            ('ClientSample', lambda: [parse_client_detail(decode_json(body)) for body in bodies])):
+        allocated = measure_history(build_history)
+        print('%-40s %10.0f bytes/sample' % ('history, ' + name, allocated / len(bodies)))
+
+
+def get_percentile(values, percentile):
+    """
+    This function will return the {percentile} of the {values}
+    :param values: sorted list of values
+    :param percentile: the percentile, 0-100
+    :return: the value, None if no values
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percentile / 100.0))]
+
+
+# for each monitor: the module, the Cisco DNA Center token manager and the Webex Teams card post function
+MONITORS = {
+    'rest': ('client_monitoring', 'DNAC_TOKEN', lambda module, room: lambda card_message:
+             module.post_room_card_message(room, card_message)),
+    'sdk': ('client_monitoring_sdk', 'DNAC_API', lambda module, room: lambda card_message:
+            module.post_room_card_message(card_message, room))
+}
+
+
+def run_monitor(monitor, args, temp_folder):
+    """
+    This function will poll all the stub clients with the {monitor} functions, and print the results
+    :param monitor: the MONITORS key
+    :param args: the benchmark options
+    :param temp_folder: folder for the rate limit database
+    :return: none
+    """
+    import io
+    import resource
+    import importlib
+    import contextlib
+
+    from config import WHATSOP_ROOM, DNAC_RATE_LIMITS, WEBEX_RATE_LIMITS
+    from dnac_stub import start_stub_server, get_client_mac, get_client_username
+    from rate_limiter import RateLimiter, set_rate_limiter
+    from client_poller import create_client_state, monitor_clients
+    from batch_evaluator import BatchEvaluator
+    from notification_queue import NotificationQueue
+    from adaptive_cards import render_notification_card
+    import webex_rooms
+
+    module_name, token_name, build_send_card = MONITORS[monitor]
+    module = importlib.import_module(module_name)
+    server, base_url = start_stub_server(args.clients, latency=args.latency / 1000.0, error_rate=args.error_rate,
+                                         throttle_rate=args.throttle_rate)
+    module.DNAC_URL = base_url
+    webex_rooms.WEBEX_TEAMS_URL = base_url
+    webex_rooms.invalidate_room(WHATSOP_ROOM)
+    # the stub is not rate limited, the rate limiter and its 429 handling are kept
+    db_path = os.path.join(temp_folder, '%s_rate_limits.sqlite' % monitor)
+    set_rate_limiter(RateLimiter({endpoint: 10 ** 9 for endpoint in DNAC_RATE_LIMITS}, db_path))
+    webex_limiter = RateLimiter({endpoint: 10 ** 9 for endpoint in WEBEX_RATE_LIMITS}, db_path)
+    token_manager = getattr(module, token_name)
+
+    call_latencies = []
+
+    def get_detail(mac_address, timestamp):
+        start_time = time.perf_counter()
+        try:
+            return token_manager.call(module.get_client_detail, mac_address, timestamp)
+        finally:
+            call_latencies.append(time.perf_counter() - start_time)
+
+    notification_queue = NotificationQueue(build_send_card(module, WHATSOP_ROOM), render_notification_card,
+                                           window=args.window, rate_limiter=webex_limiter)
+    memory_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    client_states = [create_client_state(get_client_username(index), get_client_mac(index))
+                     for index in range(args.clients)]
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the poller prints each sample
+        monitor_clients(client_states, get_detail, notification_queue.submit, 0, max_sweeps=args.sweeps,
+                        evaluator=BatchEvaluator())
+    duration = time.perf_counter() - start_time
+    memory_used = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - memory_start) * 1024
+    notification_queue.close()
+    server.shutdown()
+    server.server_close()
+
+    call_latencies.sort()
+    notification_stats = notification_queue.get_stats()
+    stub_stats = server.get_stats()
+    print('\n%s (%s)' % (monitor, module_name))
+    print_result('polls', len(call_latencies), duration, 'polls')
+    print('%-40s %10.1f msec' % ('client detail call, p50', get_percentile(call_latencies, 50) * 1000))
+    print('%-40s %10.1f msec' % ('client detail call, p99', get_percentile(call_latencies, 99) * 1000))
+    print('%-40s %10.0f bytes/client' % ('memory, max RSS growth', memory_used / float(args.clients)))
+    print('%-40s %10d alerts, %d cards, %d digests' % ('notifications', notification_stats['alerts'],
+                                                        notification_stats['cards'], notification_stats['digests']))
+    if 'latency_p50' in notification_stats:
+        print('%-40s %10.1f msec' % ('alert to notification, p50', notification_stats['latency_p50'] * 1000))
+        print('%-40s %10.1f msec' % ('alert to notification, p99', notification_stats['latency_p99'] * 1000))
+    print('%-40s %10d messages, %d throttled, %d errors' % ('stub', stub_stats['messages'],
+                                                             stub_stats.get('throttled', 0),
+                                                             stub_stats.get('errors', 0)))
+
+
+def benchmark_monitor(args):
+    """
+    End to end polling, against the local stub Cisco DNA Center and Webex Teams, for --clients clients and
+    --sweeps sweeps, with the client_monitoring (rest) and client_monitoring_sdk (sdk) functions, see --monitor:
+     - polls/second, and the client detail call latency p50/p99, including the token, rate limiter and retries
+     - memory per monitored client, the process max RSS growth during the polling
+     - alert to notification latency p50/p99, from the alert to the card posted, coalesced for --window seconds
+    The stub responses are delayed --latency msec on average, --error-rate fail with 500, --throttle-rate with 429
+    """
+    monitors = sorted(MONITORS) if args.monitor == 'all' else [args.monitor]
+    with tempfile.TemporaryDirectory() as temp_folder:
+        for monitor in monitors:
+            run_monitor(monitor, args, temp_folder)
+
+
+def run_logging(name, setup, args, log_file):
+    """
+    This function will log --reports per-sample records from 16 threads, with the logging configured by {setup},
+    and print the time spent by the logging threads and until all the records are written
+    :param name: the result name
+    :param setup: function called with the log file, configures the root logger, returns the listener or None
+    :param args: the benchmark options
+    :param log_file: the log file
+    :return: none
+    """
+    import logging
+    import threading
+
+    thread_count = 16
+    root_logger = logging.getLogger()
+    saved_handlers, saved_level = root_logger.handlers[:], root_logger.level
+    root_logger.handlers = []
+    listener = setup(log_file)
+
+    def log_samples(count):
+        for index in range(count):
+            logging.debug('Client sample: %s health %s snr %s', 'user%05d' % (index % args.clients), index % 10,
+                          40.0)
+
+    threads = [threading.Thread(target=log_samples, args=(args.reports // thread_count,))
+               for _ in range(thread_count)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logging_duration = time.perf_counter() - start_time
+    if listener is not None:
+        listener.stop()
+    total_duration = time.perf_counter() - start_time
+    for handler in root_logger.handlers:
+        handler.close()
+    root_logger.handlers, root_logger.level = saved_handlers, saved_level
+
+    record_count = thread_count * (args.reports // thread_count)
+    with open(log_file) as filehandle:
+        line_count = sum(1 for _ in filehandle)
+    print_result(name + ', logging threads', record_count, logging_duration, 'records')
+    print('%-40s %10.3f seconds, %d lines written, %d bytes' % (name + ', all written', total_duration, line_count,
+                                                               os.path.getsize(log_file)))
+
+
+def benchmark_logging(args):
+    """
+    Logging cost for --reports repetitive per-sample DEBUG records, logged by 16 threads:
+     - sync: logging.basicConfig, the text records written to the file by the logging threads, as before
+     - async: the structured_logging queue handler, the JSON records written to the rotated file by the listener
+     - async, sampled: the same, with the repetitive records sampled, the default for the async LOG_MODE
+    """
+    import logging
+    from structured_logging import setup_logging, start_async_logging, create_file_handler, JsonFormatter
+
+    def setup_async(log_file):
+        file_handler = create_file_handler(log_file)
+        file_handler.setFormatter(JsonFormatter())
+        logging.getLogger().setLevel(logging.DEBUG)
+        # the queue is sized for the benchmark, no records are dropped
+        return start_async_logging(logging.getLogger(), [file_handler], queue_size=args.reports)
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        run_logging('sync', lambda log_file: setup_logging(log_file, 'sync', logging.DEBUG), args,
+                    os.path.join(temp_folder, 'sync.log'))
+        run_logging('async', setup_async, args, os.path.join(temp_folder, 'async.log'))
+        run_logging('async, sampled', lambda log_file: setup_logging(log_file, 'async', logging.DEBUG), args,
+                    os.path.join(temp_folder, 'sampled.log'))
+
+
+BENCHMARKS = {
+    'cards': benchmark_cards,
+    'evaluate': benchmark_evaluate,
+    'ingest': benchmark_ingest,
+    'logging': benchmark_logging,
+    'monitor': benchmark_monitor,
+    'samples': benchmark_samples,
+    'status': benchmark_status,
+    'wire': benchmark_wire
+}
+
+
+def main():
+    """
+    This application will run the selected benchmark
+    """
+    parser = argparse.ArgumentParser(description='Wireless client monitoring benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help='the benchmark to run')
+    parser.add_argument('--reports', type=int, default=20000, help='number of client reports')
+    parser.add_argument('--clients', type=int, default=1000, help='number of clients')
+    parser.add_argument('--fsync', action='store_true', help='sync the written files to disk')
+    parser.add_argument('--batch', type=int, default=200, help='number of client reports in each batch')
+    parser.add_argument('--monitor', choices=sorted(MONITORS) + ['all'], default='all',
+                        help='the monitor functions polling the stub')
+    parser.add_argument('--sweeps', type=int, default=3, help='number of polling sweeps')
+    parser.add_argument('--latency', type=float, default=0.0, help='average stub response delay in msec')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the stub calls failed with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='fraction of the stub calls failed with 429')
+    parser.add_argument('--window', type=float, default=1.0, help='notification coalescing window in seconds')
+    args = parser.parse_args()
+
+    print(BENCHMARKS[args.benchmark].__doc__.strip())
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == '__main__':
+    main()
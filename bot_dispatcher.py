@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import queue
+import logging
+import threading
+
+from collections import OrderedDict, deque
+
+from config import BOT_WORKERS, BOT_QUEUE_SIZE, BOT_DEDUP_WINDOW
+
+QUEUED = 'queued'
+DUPLICATE = 'duplicate'
+QUEUE_FULL = 'full'
+
+
+class BotDispatcher:
+    """
+    Webex Teams webhook events dispatched to a pool of worker threads, behind a bounded queue,
+    so the webhook is acknowledged without waiting for the bot to reply.
+    The events for the same message id, received within {dedup_window} seconds, are handled once:
+    Webex Teams sends the webhook again if it is not acknowledged in time.
+    """
+
+    def __init__(self, handler, workers=BOT_WORKERS, queue_size=BOT_QUEUE_SIZE, dedup_window=BOT_DEDUP_WINDOW):
+        """
+        :param handler: function called with the webhook event, by the worker threads
+        :param workers: number of worker threads
+        :param queue_size: maximum number of queued events
+        :param dedup_window: time in seconds the message ids are remembered
+        """
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.dedup_window = dedup_window
+        self._seen = OrderedDict()  # message id -> received time, oldest first
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._stats = {'received': 0, 'duplicates': 0, 'rejected': 0, 'handled': 0, 'errors': 0}
+        self._threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker_loop, name='bot-worker-%d' % index, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _is_duplicate(self, message_id, now):
+        # forget the message ids older than the de-duplication window
+        while self._seen:
+            oldest_time = next(iter(self._seen.values()))
+            if now - oldest_time <= self.dedup_window:
+                break
+            self._seen.popitem(last=False)
+        if message_id in self._seen:
+            return True
+        self._seen[message_id] = now
+        return False
+
+    def submit(self, event):
+        """
+        This function will queue the webhook {event} for the bot, without waiting
+        :param event: the Webex Teams webhook event
+        :return: QUEUED, DUPLICATE if the message id was already received, QUEUE_FULL if the queue is full
+        """
+        now = time.monotonic()
+        message_id = (event.get('data') or {}).get('id')
+        with self._lock:
+            self._stats['received'] += 1
+            if message_id is not None and self._is_duplicate(message_id, now):
+                self._stats['duplicates'] += 1
+                return DUPLICATE
+        try:
+            self._queue.put_nowait((now, event))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+                # not handled, the message id is accepted again when Webex Teams retries
+                self._seen.pop(message_id, None)
+            return QUEUE_FULL
+        return QUEUED
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            received_time, event = item
+            try:
+                self._handler(event)
+                failed = False
+            except Exception:
+                logging.exception('Bot message handling failed')
+                failed = True
+            latency = time.monotonic() - received_time
+            with self._lock:
+                self._stats['errors' if failed else 'handled'] += 1
+                self._latencies.append(latency)
+            self._queue.task_done()
+
+    def get_stats(self):
+        """
+        This function will return the dispatcher statistics
+        :return: dict with the queue depth, the event counters and the handling latency in seconds,
+        from webhook received to bot reply, over the last 1000 events
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        stats['queue_depth'] = self._queue.qsize()
+        if latencies:
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p99'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+    def join(self):
+        """
+        This function will wait until all the queued events are handled
+        :return: none
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        This function will handle the queued events and stop the worker threads
+        :return: none
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# Historical backfill of the wireless clients history, using the client detail at past timestamps.
+# Rebuild the last hours after the poller was down, or for new clients:
+#   python client_backfill.py --hours 24 --step 5
+#   python client_backfill.py --client username=aa:bb:cc:dd:ee:ff
+# The calls share the client-detail rate limit with the poller, an interrupted backfill is resumed on the next run.
+# The samples are written to the receiver history folder, on the receiver host: the receiver can keep running,
+# the appends and the compactions of both processes are serialized by the SampleStore file lock.
+
+import os
+import time
+import bisect
+import argparse
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config import MONITORED_CLIENTS, POLLER_MAX_WORKERS, WIRELESS_FOLDER
+from config import BACKFILL_HOURS, BACKFILL_STEP, BACKFILL_FLUSH_SIZE, BACKFILL_JOURNAL
+
+from client_sample import parse_client_detail
+from sample_store import SampleStore, NAN
+from structured_logging import setup_logging
+
+PROGRESS_INTERVAL = 10  # in seconds, the progress is printed to the console
+
+
+def get_backfill_times(start_time, end_time, step):
+    """
+    This function will return the timestamps in the time window [start_time, end_time], every {step} msec.
+    The timestamps are aligned to the step, so the same time window gives the same timestamps when resumed.
+    :param start_time: window start, epoch msec
+    :param end_time: window end, epoch msec
+    :param step: time between samples, msec
+    :return: list of timestamps, epoch msec
+    """
+    first_time = -(-start_time // step) * step
+    return list(range(first_time, end_time + 1, step))
+
+
+def sample_to_record(timestamp, sample):
+    """
+    This function will convert the client {sample} to a sample history record
+    :param timestamp: the sample timestamp, epoch msec
+    :param sample: the ClientSample
+    :return: tuple with the timestamp, health score, snr, data rate, total data
+    """
+    values = [sample.client_health, sample.snr, sample.data_rate, sample.total_data]
+    return (timestamp,) + tuple(float(value) if value is not None else NAN for value in values)
+
+
+def get_missing_times(sample_store, username, times, step):
+    """
+    This function will return the {times} without a sample in the history of the {username}.
+    A timestamp is not missing if the history has a sample in the step starting at the timestamp,
+    so only the gaps are filled, when the poller was down or the client was not monitored.
+    :param sample_store: the client history SampleStore
+    :param username: client username
+    :param times: sorted list of timestamps, epoch msec
+    :param step: time between samples, msec
+    :return: list of timestamps, epoch msec
+    """
+    if not times:
+        return []
+    sample_times = [sample[0] for sample in sample_store.query(username, times[0], times[-1] + step - 1)]
+    missing_times = []
+    for timestamp in times:
+        index = bisect.bisect_left(sample_times, timestamp)
+        if index == len(sample_times) or sample_times[index] >= timestamp + step:
+            missing_times.append(timestamp)
+    return missing_times
+
+
+class BackfillJournal:
+    """
+    Append-only journal of the completed client detail calls, one line with the timestamp and the username for
+    each call, including the calls without data. The lines are written after the samples are saved, so after
+    an interruption, the next run skips the completed calls. A partial last line is ignored.
+    """
+
+    def __init__(self, path=BACKFILL_JOURNAL):
+        """
+        :param path: the journal file
+        """
+        self.path = path
+
+    def load(self):
+        """
+        This function will load the completed calls from the journal file, if existing
+        :return: set of tuples with the username and the timestamp
+        """
+        completed = set()
+        try:
+            with open(self.path, 'r') as filehandle:
+                for line in filehandle:
+                    timestamp, separator, username = line.rstrip('\n').partition('\t')
+                    if separator and username and timestamp.isdigit():
+                        completed.add((username, int(timestamp)))
+        except FileNotFoundError:
+            pass
+        return completed
+
+    def record(self, calls):
+        """
+        This function will append the completed {calls} to the journal file, synced to disk
+        :param calls: list of tuples with the username and the timestamp
+        :return: none
+        """
+        if not calls:
+            return
+        with open(self.path, 'a') as filehandle:
+            filehandle.write(''.join('%d\t%s\n' % (timestamp, username) for username, timestamp in calls))
+            filehandle.flush()
+            os.fsync(filehandle.fileno())
+
+    def remove(self):
+        """
+        This function will remove the journal file, when the backfill is complete
+        :return: none
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def backfill_clients(clients, get_detail, sample_store, start_time, end_time, step, journal=None,
+                     max_workers=POLLER_MAX_WORKERS, flush_size=BACKFILL_FLUSH_SIZE,
+                     progress_interval=PROGRESS_INTERVAL):
+    """
+    This function will collect the client detail for the {clients} at each timestamp in the time window,
+    without a sample in the history, and append the samples to the {sample_store}.
+    The calls run concurrently, up to {max_workers}, within the client-detail rate limit of {get_detail}.
+    The samples are saved, and the calls recorded in the {journal}, every {flush_size} completed calls,
+    so an interrupted backfill loses at most the calls in flight. The failed calls are retried by the next run.
+    :param clients: list of tuples with the username and the MAC address
+    :param get_detail: function called with (mac_address, timestamp), returns the client detail info
+    :param sample_store: the client history SampleStore
+    :param start_time: window start, epoch msec
+    :param end_time: window end, epoch msec
+    :param step: time between samples, msec
+    :param journal: optional BackfillJournal, to resume an interrupted backfill
+    :param max_workers: maximum number of concurrent client detail calls
+    :param flush_size: number of completed calls saved together
+    :param progress_interval: time in seconds between the progress messages
+    :return: dict with the backfill statistics
+    """
+    completed = journal.load() if journal is not None else set()
+    times = get_backfill_times(start_time, end_time, step)
+    calls = []
+    stats = {'clients': len(clients), 'calls': 0, 'samples': 0, 'no_data': 0, 'errors': 0, 'skipped': 0}
+    for username, mac_address in clients:
+        missing_times = get_missing_times(sample_store, username, times, step)
+        stats['skipped'] += len(times) - len(missing_times)
+        for timestamp in missing_times:
+            if (username, timestamp) in completed:
+                stats['skipped'] += 1
+            else:
+                calls.append((username, mac_address, timestamp))
+    mac_addresses = dict((username, mac_address) for username, mac_address in clients)
+    print('\nClient detail calls to backfill: ', len(calls), ', skipped: ', stats['skipped'])
+
+    def fetch(username, mac_address, timestamp):
+        sample = parse_client_detail(get_detail(mac_address, timestamp))
+        return sample_to_record(timestamp, sample) if sample is not None else None
+
+    records = {}  # username -> list of records, not saved yet
+    done_calls = []  # completed calls, not recorded in the journal yet
+    written_usernames = set()
+
+    def flush():
+        for username, client_records in records.items():
+            client_records.sort()
+            sample_store.append(username, client_records, mac_addresses[username])
+            written_usernames.add(username)
+        records.clear()
+        if journal is not None:
+            journal.record(done_calls)
+        del done_calls[:]
+
+    start = time.perf_counter()
+    next_progress = start + progress_interval
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backfill')
+    in_flight = {}
+    pending = iter(calls)
+    try:
+        while True:
+            # a bounded number of calls is submitted, the remaining calls are not queued in the executor
+            for username, mac_address, timestamp in pending:
+                future = executor.submit(fetch, username, mac_address, timestamp)
+                in_flight[future] = (username, timestamp)
+                if len(in_flight) >= max_workers * 2:
+                    break
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                username, timestamp = in_flight.pop(future)
+                stats['calls'] += 1
+                try:
+                    record = future.result()
+                except Exception as error:
+                    stats['errors'] += 1
+                    logging.warning('Backfill client detail failed, username: %s, timestamp: %s, error: %s',
+                                    username, timestamp, error)
+                    continue
+                if record is None:
+                    stats['no_data'] += 1
+                else:
+                    stats['samples'] += 1
+                    records.setdefault(username, []).append(record)
+                done_calls.append((username, timestamp))
+            if len(done_calls) >= flush_size:
+                flush()
+            now = time.perf_counter()
+            if now >= next_progress:
+                next_progress = now + progress_interval
+                print('Backfill progress: ', stats['calls'], '/', len(calls), ' calls, ',
+                      round(stats['samples'] / (now - start), 1), ' samples/s')
+    finally:
+        # save the completed calls, also when interrupted, the calls in flight are not waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+        flush()
+
+    # the samples older than the last sample in the history are sorted again, under the SampleStore file lock,
+    # the receiver appends wait for the compaction
+    for username in written_usernames:
+        sample_store.compact(username)
+    if journal is not None and stats['errors'] == 0:
+        journal.remove()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['samples_per_second'] = stats['samples'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def parse_client(value):
+    """
+    This function will parse the --client option, username=mac_address
+    :param value: the option value
+    :return: tuple with the username and the MAC address
+    """
+    username, separator, mac_address = value.partition('=')
+    if not separator or not username or not mac_address:
+        raise argparse.ArgumentTypeError('username=mac_address required: %r' % value)
+    return username, mac_address
+
+
+def get_monitored_clients():
+    """
+    This function will return the monitored clients {MONITORED_CLIENTS}, with the MAC address from the identity
+    cache, or the pre-configured MAC address if not cached
+    :return: list of tuples with the username and the MAC address
+    """
+    from client_monitoring import DNAC_TOKEN, find_wireless_client
+    from client_identity import IdentityCache
+
+    identity_cache = IdentityCache(lambda username: DNAC_TOKEN.call(find_wireless_client, username))
+    clients = []
+    for client in MONITORED_CLIENTS:
+        mac_address = identity_cache.get_mac(client['username']) or client.get('mac_address')
+        if mac_address:
+            clients.append((client['username'], mac_address))
+    return clients
+
+
+def main():
+    """
+    This application will backfill the wireless clients history, for the {MONITORED_CLIENTS} or the clients
+    given as options, with the samples missing in the time window
+    """
+    parser = argparse.ArgumentParser(description='Backfill the wireless clients history from Cisco DNA Center')
+    parser.add_argument('--client', type=parse_client, action='append', dest='clients',
+                        help='username=mac_address, repeat for each client, default: the monitored clients')
+    parser.add_argument('--hours', type=float, default=BACKFILL_HOURS, help='time window, in hours before the end')
+    parser.add_argument('--end', type=int, help='time window end, epoch msec, default: now')
+    parser.add_argument('--step', type=float, default=BACKFILL_STEP, help='time between samples, in minutes')
+    parser.add_argument('--workers', type=int, default=POLLER_MAX_WORKERS, help='concurrent client detail calls')
+    parser.add_argument('--folder', default=WIRELESS_FOLDER + '/history', help='the client history folder')
+    parser.add_argument('--journal', default=BACKFILL_JOURNAL, help='the completed calls file, to resume')
+    parser.add_argument('--restart', action='store_true', help='ignore the calls completed by a previous run')
+    args = parser.parse_args()
+
+    setup_logging()
+    from client_monitoring import DNAC_TOKEN, get_client_detail
+
+    clients = args.clients or get_monitored_clients()
+    end_time = args.end if args.end is not None else int(time.time() * 1000)
+    start_time = end_time - int(args.hours * 3600 * 1000)
+    journal = BackfillJournal(args.journal)
+    if args.restart:
+        journal.remove()
+
+    print('\nWireless Client History Backfill, clients: ', len(clients), ', hours: ', args.hours,
+          ', step: ', args.step, ' minutes')
+    stats = backfill_clients(clients, lambda mac_address, timestamp: DNAC_TOKEN.call(get_client_detail,
+                                                                                     mac_address, timestamp),
+                             SampleStore(args.folder), start_time, end_time, int(args.step * 60 * 1000),
+                             journal=journal, max_workers=args.workers)
+    print('\nBackfill complete, calls: ', stats['calls'], ', samples: ', stats['samples'], ', no data: ',
+          stats['no_data'], ', errors: ', stats['errors'], ', skipped: ', stats['skipped'])
+    print('Backfill duration: ', round(stats['seconds'], 2), ' seconds, ', round(stats['samples_per_second'], 1),
+          ' samples/s')
+    if stats['errors']:
+        print('Run again to retry the failed calls, the completed calls are skipped')
+
+
+if __name__ == '__main__':
+    main()
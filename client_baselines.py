@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import math
+import logging
+import zipfile
+import threading
+
+import numpy as np
+
+from config import BASELINE_MAX_CLIENTS, BASELINE_ALPHA, BASELINE_DEVIATION, BASELINE_WARMUP, BASELINE_MIN_STD
+from config import BASELINE_CHECKPOINT_FILE
+
+# the metrics with a baseline, an anomaly is a drop below the client baseline
+BASELINE_METRICS = ('client_health', 'snr', 'data_rate', 'total_data')
+
+
+class BaselineStore:
+    """
+    Streaming baseline for each client: the exponentially weighted moving average and variance of the
+    health score, SNR, data rate and total data (tx + rx bytes).
+    The state is array-backed, one row of fixed size for each client, for at most {capacity} clients:
+    the least recently updated client is dropped when full.
+    A sample is anomalous when a metric is more than {deviation} standard deviations below the client baseline,
+    after {warmup} samples. The anomalous samples are included in the baseline, so it follows a lasting change.
+    """
+
+    def __init__(self, capacity=BASELINE_MAX_CLIENTS, alpha=BASELINE_ALPHA, deviation=BASELINE_DEVIATION,
+                 warmup=BASELINE_WARMUP, min_std=BASELINE_MIN_STD):
+        """
+        :param capacity: maximum number of clients
+        :param alpha: EWMA weight of the new sample, 0-1
+        :param deviation: number of standard deviations below the mean for an anomaly
+        :param warmup: number of samples before the anomalies are detected
+        :param min_std: minimum standard deviation for each metric, to ignore the small changes of a stable metric
+        """
+        self.capacity = capacity
+        self.alpha = alpha
+        self.deviation = deviation
+        self.warmup = warmup
+        self.min_std = tuple(min_std)
+        self._lock = threading.Lock()
+        self._rows = {}  # client key -> row
+        self._keys = [None] * capacity
+        metric_count = len(BASELINE_METRICS)
+        self.mean = np.zeros((capacity, metric_count))
+        self.var = np.zeros((capacity, metric_count))
+        self.count = np.zeros((capacity, metric_count), dtype=np.int32)
+        self.last_update = np.zeros(capacity)  # sequence number of the last update, to drop the oldest client
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _get_row(self, key):
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        if len(self._rows) < self.capacity:
+            row = len(self._rows)
+        else:
+            # full, reuse the row of the least recently updated client
+            row = int(np.argmin(self.last_update))
+            del self._rows[self._keys[row]]
+            logging.info('Baseline dropped for the client %s, %s clients', self._keys[row], self.capacity)
+        self._rows[key] = row
+        self._keys[row] = key
+        self.mean[row] = 0.0
+        self.var[row] = 0.0
+        self.count[row] = 0
+        return row
+
+    def update(self, key, metrics):
+        """
+        This function will compare the sample {metrics} to the client {key} baseline, and update the baseline
+        :param key: the client key
+        :param metrics: the parsed client metrics
+        :return: list of the metric names below the client baseline, empty if the sample is not anomalous
+        """
+        values = [metrics.get(name) for name in BASELINE_METRICS]
+        with self._lock:
+            row = self._get_row(key)
+            self._sequence += 1
+            self.last_update[row] = self._sequence
+            # the row is read and written once, the metrics are computed with Python floats
+            means = self.mean[row].tolist()
+            variances = self.var[row].tolist()
+            counts = self.count[row].tolist()
+            anomalies = []
+            for index, value in enumerate(values):
+                if value is None or value != value:
+                    continue
+                value = float(value)
+                mean = means[index]
+                if counts[index] >= self.warmup:
+                    std = max(math.sqrt(variances[index]), self.min_std[index])
+                    if value < mean - self.deviation * std:
+                        anomalies.append(BASELINE_METRICS[index])
+                if counts[index] == 0:
+                    # the first sample sets the mean
+                    means[index] = value
+                else:
+                    difference = value - mean
+                    increment = self.alpha * difference
+                    means[index] = mean + increment
+                    variances[index] = (1.0 - self.alpha) * (variances[index] + difference * increment)
+                counts[index] += 1
+            self.mean[row] = means
+            self.var[row] = variances
+            self.count[row] = counts
+        return anomalies
+
+    def get_baseline(self, key):
+        """
+        This function will return the client {key} baseline
+        :param key: the client key
+        :return: dict with the metric name -> (mean, standard deviation, sample count), None if no baseline
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            return {name: (float(self.mean[row, index]), math.sqrt(self.var[row, index]), int(self.count[row, index]))
+                    for index, name in enumerate(BASELINE_METRICS)}
+
+    def save(self, path=BASELINE_CHECKPOINT_FILE):
+        """
+        This function will save the baselines to the checkpoint file {path}, replaced atomically
+        :param path: the checkpoint file
+        :return: number of clients saved
+        """
+        with self._lock:
+            rows = np.array(sorted(self._rows.values()), dtype=np.int64)
+            keys = np.array([self._keys[row] for row in rows], dtype=str)
+            mean = self.mean[rows]
+            var = self.var[rows]
+            count = self.count[rows]
+            last_update = self.last_update[rows]
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as filehandle:
+            np.savez(filehandle, keys=keys, metrics=np.array(BASELINE_METRICS), mean=mean, var=var, count=count,
+                     last_update=last_update)
+            filehandle.flush()
+            os.fsync(filehandle.fileno())
+        os.replace(temp_path, path)
+        return len(keys)
+
+    def load(self, path=BASELINE_CHECKPOINT_FILE):
+        """
+        This function will load the baselines from the checkpoint file {path}, if existing
+        The most recently updated clients are loaded, up to {capacity}
+        A checkpoint file not valid, truncated or corrupt, is logged and the baselines start empty
+        :param path: the checkpoint file
+        :return: number of clients loaded
+        """
+        try:
+            with np.load(path) as checkpoint:
+                if tuple(checkpoint['metrics']) != BASELINE_METRICS:
+                    logging.warning('Baseline checkpoint metrics changed, the baselines are not loaded')
+                    return 0
+                order = np.argsort(checkpoint['last_update'])[-self.capacity:]
+                keys = checkpoint['keys'][order]
+                mean = checkpoint['mean'][order]
+                var = checkpoint['var'][order]
+                count = checkpoint['count'][order]
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as error:
+            logging.error('Baseline checkpoint not valid, start with empty baselines: %s', error)
+            return 0
+        client_count = len(keys)
+        with self._lock:
+            self._rows = {str(key): row for row, key in enumerate(keys)}
+            self._keys = [str(key) for key in keys] + [None] * (self.capacity - client_count)
+            self.mean[:client_count] = mean
+            self.var[:client_count] = var
+            self.count[:client_count] = count
+            self.last_update[:] = 0
+            self.last_update[:client_count] = np.arange(1, client_count + 1)
+            self._sequence = client_count
+        return client_count
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import logging
+
+from config import DNAC_URL, BULK_PAGE_SIZE
+
+import http_transport
+from rate_limiter import rate_limited
+from client_sample import ClientSample, decode_json
+from app_metrics import instrumented
+
+CLIENTS_PATH = '/dna/data/api/v1/clients'
+
+
+@rate_limited('clients')
+@instrumented('clients')
+def get_clients_page(offset, limit, dnac_auth):
+    """
+    This function will return one page of the wireless clients list, with the health and connection info
+    Call to Cisco DNA Center - /dna/data/api/v1/clients
+    :param offset: index of the first client, starting with 1
+    :param limit: maximum number of clients in the page
+    :param dnac_auth: Cisco DNA Center token
+    :return: list of clients
+    """
+    url = DNAC_URL + CLIENTS_PATH
+    params = {'type': 'Wireless', 'offset': offset, 'limit': limit}
+    header = {'content-type': 'application/json', 'x-auth-token': dnac_auth}
+    clients_response = http_transport.get(url, params=params, headers=header, verify=False)
+    clients_response.raise_for_status()
+    return decode_json(clients_response.content)['response']
+
+
+@rate_limited('clients')
+@instrumented('clients')
+def get_clients_page_sdk(offset, limit, dnac_api):
+    """
+    This function will return one page of the wireless clients list, using the dnacentersdk custom caller
+    :param offset: index of the first client, starting with 1
+    :param limit: maximum number of clients in the page
+    :param dnac_api: DNACenterAPI "Connection Object"
+    :return: list of clients
+    """
+    params = {'type': 'Wireless', 'offset': offset, 'limit': limit}
+    clients_response = dnac_api.custom_caller.call_api('GET', CLIENTS_PATH, params=params)
+    return clients_response['response']
+
+
+def parse_client_summary(client):
+    """
+    This function will parse the client info {client} from the clients list
+    :param client: one client from the clients list
+    :return: ClientSample with the same metrics as client_sample.parse_client_detail,
+    or None if the client info is incomplete and the client detail is required
+    """
+    try:
+        health = client['health']
+        connection = client['connection']
+        traffic = client['traffic']
+        client_health = health['overallScore']
+        sample = ClientSample(
+            client_health=client_health,
+            total_data=float(traffic['txBytes']) + float(traffic['rxBytes']),
+            access_point=connection['apName'],
+            snr=float(connection['snr']),
+            data_rate=float(connection['dataRate']),
+            location=client['siteHierarchy'],
+            ssid=connection['ssid'],
+            health_scores=(('OVERALL', client_health),))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return None if sample.missing else sample
+
+
+def collect_client_health(get_page, mac_addresses, page_size=BULK_PAGE_SIZE):
+    """
+    This function will collect the health of all the wireless clients, one page at a time,
+    and keep the metrics only for the monitored clients {mac_addresses}
+    :param get_page: function called with (offset, limit), returns one page of the clients list
+    :param mac_addresses: the MAC addresses of the monitored clients
+    :param page_size: number of clients in each page
+    :return: dict with the client MAC address -> metrics, for the monitored clients with complete info
+    """
+    monitored = set(mac_address.lower() for mac_address in mac_addresses)
+    client_metrics = {}
+    offset = 1
+    page_count = 0
+    while True:
+        clients = get_page(offset, page_size)
+        page_count += 1
+        for client in clients:
+            mac_address = str(client.get('macAddress', '')).lower()
+            if mac_address in monitored:
+                metrics = parse_client_summary(client)
+                if metrics is not None:
+                    client_metrics[mac_address] = metrics
+        # the last page is not full
+        if len(clients) < page_size or len(client_metrics) == len(monitored):
+            break
+        offset += page_size
+    logging.info('Bulk collection: %s pages, %s of %s monitored clients', page_count, len(client_metrics),
+                 len(monitored))
+    return client_metrics
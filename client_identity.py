@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import json
+import time
+import logging
+import threading
+
+from collections import deque
+
+from config import IDENTITY_CACHE_FILE, IDENTITY_CACHE_TTL, IDENTITY_REFRESH_RATE, IDENTITY_LOOKUP_RETRY
+
+
+class IdentityCache:
+    """
+    Persistent username <-> wireless MAC address cache.
+    Each entry holds the MAC address, the hostType, the time of the last lookup and the time the client was
+    last seen with data. The cache is saved to a JSON file, so the application startup is a file read.
+    The lookups are done by a background thread, spread over time to stay within the API rate limit:
+     - first, the usernames requested because their cached MAC address stopped returning data
+     - then, the usernames never looked up, or with a lookup older than {ttl} minutes
+    """
+
+    def __init__(self, resolve, path=IDENTITY_CACHE_FILE, ttl=IDENTITY_CACHE_TTL,
+                 refresh_rate=IDENTITY_REFRESH_RATE, lookup_retry=IDENTITY_LOOKUP_RETRY, on_resolved=None):
+        """
+        :param resolve: function called with the username, returns the client userDetails, None if not found
+        :param path: the cache JSON file
+        :param ttl: time in minutes before a cached entry is looked up again
+        :param refresh_rate: maximum number of background lookups/minute
+        :param lookup_retry: minimum time in minutes between two requested lookups for the same username
+        :param on_resolved: optional function called with (username, mac_address) when a MAC address changes
+        """
+        self._resolve = resolve
+        self.path = path
+        self.ttl = ttl * 60
+        self.lookup_retry = lookup_retry * 60
+        self.refresh_interval = 60.0 / refresh_rate
+        self.on_resolved = on_resolved
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self._roster = []
+        self._requested = deque()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.load()
+
+    def load(self):
+        """
+        This function will load the cache from the JSON file, if existing
+        :return: number of cached entries
+        """
+        try:
+            with open(self.path, 'r') as filehandle:
+                entries = json.load(filehandle)
+        except FileNotFoundError:
+            entries = {}
+        except ValueError:
+            logging.warning('Identity cache file not valid, start with an empty cache: %s', self.path)
+            entries = {}
+        with self._lock:
+            self._entries = entries
+            self._dirty = False
+        return len(entries)
+
+    def save(self):
+        """
+        This function will save the cache to the JSON file, replacing it atomically
+        :return: none
+        """
+        with self._lock:
+            content = json.dumps(self._entries)
+            self._dirty = False
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as filehandle:
+            filehandle.write(content)
+        os.replace(temp_path, self.path)
+
+    def get_mac(self, username):
+        """
+        This function will return the cached wireless MAC address for the {username}
+        :param username: client username
+        :return: client MAC address, None if not cached
+        """
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        return entry['mac_address']
+
+    def mark_seen(self, username):
+        """
+        This function will record the {username} client returned data, at the current time
+        The last seen time is saved by the background thread, with the next cache save
+        :param username: client username
+        :return: none
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                entry['last_seen'] = time.time()
+                self._dirty = True
+
+    def request_lookup(self, username):
+        """
+        This function will request a new lookup for the {username}, before any TTL refresh
+        Used when the cached MAC address stops returning data, ignored if looked up in the last {lookup_retry}
+        :param username: client username
+        :return: none
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry['resolved'] is not None and \
+                    time.time() - entry['resolved'] < self.lookup_retry:
+                return
+            if username not in self._requested:
+                self._requested.append(username)
+
+    def lookup(self, username):
+        """
+        This function will look up the {username} wireless MAC address, and update the cache
+        :param username: client username
+        :return: client MAC address, None if not found
+        """
+        user_details = self._resolve(username)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault(username, {'mac_address': None, 'host_type': None,
+                                                        'last_seen': None, 'resolved': None})
+            previous_mac = entry['mac_address']
+            entry['resolved'] = now
+            if user_details is not None:
+                entry['mac_address'] = user_details['id']
+                entry['host_type'] = user_details['hostType']
+            mac_address = entry['mac_address']
+        self.save()
+        if mac_address is not None and mac_address != previous_mac:
+            logging.info('Wireless client MAC Address found for %s: %s', username, mac_address)
+            if self.on_resolved is not None:
+                self.on_resolved(username, mac_address)
+        return mac_address
+
+    def _next_username(self):
+        # requested lookups first, then the never resolved or expired entries, the oldest first
+        with self._lock:
+            if self._requested:
+                return self._requested.popleft()
+            expired_time = time.time() - self.ttl
+            next_username = None
+            next_resolved = None
+            for username in self._roster:
+                entry = self._entries.get(username)
+                resolved = entry['resolved'] if entry is not None and entry['resolved'] is not None else 0.0
+                if resolved < expired_time and (next_resolved is None or resolved < next_resolved):
+                    next_username, next_resolved = username, resolved
+            return next_username
+
+    def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            username = self._next_username()
+            if username is not None:
+                try:
+                    self.lookup(username)
+                except Exception:
+                    logging.exception('Identity lookup failed for the username: %s', username)
+            elif self._dirty:
+                self._save_seen()
+            self._stop_event.wait(self.refresh_interval)
+
+    def _save_seen(self):
+        # persist the last seen times updated since the last save
+        try:
+            self.save()
+        except OSError:
+            logging.exception('Identity cache save failed: %s', self.path)
+
+    def start_refresh(self, usernames):
+        """
+        This function will start the background lookups for the roster {usernames}
+        :param usernames: the monitored usernames
+        :return: none
+        """
+        with self._lock:
+            self._roster = list(usernames)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='identity-refresh', daemon=True)
+            self._thread.start()
+
+    def stop_refresh(self):
+        """
+        This function will stop the background lookups
+        :return: none
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._dirty:
+            self._save_seen()
@@ -26,13 +26,11 @@ __copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
 __license__ = "Cisco Sample Code License, Version 1.1"
 
 
-import requests
 import urllib3
 import json
 import os
 import time
 import datetime
-import logging
 
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
 
@@ -44,14 +42,34 @@ from requests.auth import HTTPBasicAuth  # for Basic Auth
 from datetime import datetime
 
 from config import DNAC_URL, DNAC_PASS, DNAC_USER
-from config import CLIENT_USERNAME, CLIENT_MAC
-from config import BW_LOW, HEALTH_LOW, COUNTER_MAX, TIME_INTERVAL, SNR
-from config import WHATSOP_BOT_AUTH, WHATSOP_ROOM, WEBEX_TEAMS_URL
+from config import MONITORED_CLIENTS, TIME_INTERVAL, BULK_COLLECTION, BATCH_EVALUATION, BASELINE_ALERTS
+from config import POLL_SCHEDULER, POLLER_CHECKPOINT
+from config import WHATSOP_ROOM
+
+import http_transport
+import webex_rooms
+from client_poller import create_client_state, monitor_clients, schedule_clients, MacUpdates
+from batch_evaluator import BatchEvaluator
+from threshold_profiles import ThresholdProfiles
+from client_baselines import BaselineStore
+from poller_checkpoint import PollerCheckpoint
+from notification_queue import NotificationQueue
+from adaptive_cards import render_notification_card
+from client_identity import IdentityCache
+from client_bulk import collect_client_health, get_clients_page
+from client_sample import decode_json
+from dnac_token import DnacTokenManager
+from rate_limiter import rate_limited
+from app_metrics import instrumented, register_poller_metrics, start_metrics_server
+from structured_logging import setup_logging
 
 urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
 
 DNAC_AUTH = HTTPBasicAuth(DNAC_USER, DNAC_PASS)
 
+# Cisco DNA Center JWT token shared by all the API calls, refreshed before the 60 minutes expiration
+DNAC_TOKEN = DnacTokenManager(lambda: get_dnac_jwt_token(DNAC_AUTH))
+
 
 def pprint(json_data):
     """
@@ -71,6 +89,7 @@ def get_epoch_time():
     return int(epoch)
 
 
+@instrumented('dnac-token')
 def get_dnac_jwt_token(dnac_auth):
     """
     Create the authorization token required to access DNA C
@@ -80,11 +99,14 @@ def get_dnac_jwt_token(dnac_auth):
     """
     url = DNAC_URL + '/dna/system/api/v1/auth/token'
     header = {'content-type': 'application/json'}
-    response = requests.post(url, auth=dnac_auth, headers=header, verify=False)
+    response = http_transport.post(url, auth=dnac_auth, headers=header, verify=False)
+    response.raise_for_status()
     dnac_jwt_token = response.json()['Token']
     return dnac_jwt_token
 
 
+@rate_limited('user-enrichment-details')
+@instrumented('user-enrichment-details')
 def get_client_info_by_name(username, dnac_auth):
     """
     This function will return the wireless client info for the wireless client using the username {username}
@@ -95,7 +117,8 @@ def get_client_info_by_name(username, dnac_auth):
     """
     url = DNAC_URL + '/dna/intent/api/v1/user-enrichment-details'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_auth, 'entity_type': 'network_user_id', 'entity_value': username}
-    client_response = requests.get(url, headers=header, verify=False)
+    client_response = http_transport.get(url, headers=header, verify=False)
+    client_response.raise_for_status()
     wireless_client_json = client_response.json()
     wireless_client_info = []
     if wireless_client_json[0]['userDetails'] != {}:  # check if user details is empty. if yes, unknown users
@@ -104,6 +127,8 @@ def get_client_info_by_name(username, dnac_auth):
         return wireless_client_info
 
 
+@rate_limited('user-enrichment-details')
+@instrumented('user-enrichment-details')
 def get_client_info_by_mac(mac_address, dnac_auth):
     """
     This function will return the wireless client info for the wireless client using the MAC address {mac_address}
@@ -115,7 +140,8 @@ def get_client_info_by_mac(mac_address, dnac_auth):
     url = DNAC_URL + '/dna/intent/api/v1/user-enrichment-details'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_auth, 'entity_type': 'mac_address',
               'entity_value': mac_address}
-    client_response = requests.get(url, headers=header, verify=False)
+    client_response = http_transport.get(url, headers=header, verify=False)
+    client_response.raise_for_status()
     wireless_client_json = client_response.json()
     wireless_client_info = []
     if wireless_client_json[0]['userDetails'] != {}:  # check if user details is empty. if yes, unknown users
@@ -124,6 +150,8 @@ def get_client_info_by_mac(mac_address, dnac_auth):
         return wireless_client_info
 
 
+@rate_limited('client-detail')
+@instrumented('client-detail')
 def get_client_detail(mac_address, timestamp, dnac_auth):
     """
     This function will return the client_detail info for the wireless client using the MAC address {mac_address},
@@ -136,222 +164,146 @@ def get_client_detail(mac_address, timestamp, dnac_auth):
     """
     url = DNAC_URL + '/dna/intent/api/v1/client-detail?timestamp=' + str(timestamp) + '&macAddress=' + mac_address
     header = {'content-type': 'application/json', 'x-auth-token': dnac_auth}
-    client_response = requests.get(url, headers=header, verify=False)
-    client_detail_json = client_response.json()
+    client_response = http_transport.get(url, headers=header, verify=False)
+    client_response.raise_for_status()
+    client_detail_json = decode_json(client_response.content)
     return client_detail_json
 
 
 def get_room_id(room_name):
     """
-    This function will find the Webex Teams space id based on the {space_name}
-    Call to Webex Teams - /rooms
+    This function will find the Webex Teams space id based on the {space_name}, using the room directory cache
     :param room_name: The Webex Teams room name
     :return: the Webex Teams room Id
     """
-    room_id = None
-    url = WEBEX_TEAMS_URL + '/v1/rooms' + '?sortBy=lastactivity&max=1000'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    space_response = requests.get(url, headers=header, verify=False)
-    space_list_json = space_response.json()
-    space_list = space_list_json['items']
-    for spaces in space_list:
-        if spaces['title'] == room_name:
-            room_id = spaces['id']
-    return room_id
+    return webex_rooms.get_room_id(room_name)
 
 
 def post_room_card_message(space_name, card_message):
     """
     This function will post a adaptive card message {card_message} to the Webex Teams space with the {space_name}
+    If the post fails because the room is unknown, the room id is looked up again and the post retried
     :param space_name: Webex Teams message
-    :param card_message: card message
-    :return: none
+    :param card_message: card message JSON, rendered by the adaptive_cards module, without the roomId
+    :return: the Webex Teams response
+    """
+    return webex_rooms.post_room_body(space_name, card_message)
+
+
+def find_wireless_client(username, dnac_auth):
+    """
+    This function will find the wireless client details for the client with the {username}
+    :param username: client username
+    :param dnac_auth: Cisco DNA Center token
+    :return: the wireless client userDetails, including the MAC address {id}, None if not found
+    """
+    all_client_info = get_client_info_by_name(username, dnac_auth)
+    wireless_client = None
+    for client in all_client_info:
+        if client['userDetails'].get('hostType') == 'WIRELESS':
+            wireless_client = client['userDetails']
+    return wireless_client
+
+
+def create_notification_queue():
+    """
+    This function will create the Webex Teams notification queue, the alerts are coalesced into digest cards
+    :return: NotificationQueue
     """
-    space_id = get_room_id(space_name)
-    url = WEBEX_TEAMS_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    requests.post(url, data=json.dumps(card_message), headers=header, verify=False)
+    # the room id is set when the card is posted, using the room directory cache
+    return NotificationQueue(lambda card_message: post_room_card_message(WHATSOP_ROOM, card_message),
+                             render_notification_card)
 
 
 def main():
     """
-    This application will monitor a wireless user client device.
-    It will identify when the client experiences poor performance:
+    This application will monitor the wireless user client devices {MONITORED_CLIENTS}.
+    It will identify when a client experiences poor performance:
      - decreased total transmit and receive data
      - lower client health score
      - low SNR value
     If any of the above conditions are true, exceeding a predefined number of consecutive polling intervals,
-    it will create a notification to Webex Teams
+    it will create a notification to Webex Teams for that client
     """
-    # logging, debug level, to file {application_run.log}
-    logging.basicConfig(
-        filename='application_run.log',
-        level=logging.DEBUG,
-        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S')
+    # logging, debug level, to file {application_run.log}, or written by a background thread in the async LOG_MODE
+    setup_logging()
 
     current_time = str(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     print('\nWireless Client Monitoring App Start, ', current_time)
 
-    print('\nWireless client user to be monitored: ', CLIENT_USERNAME)
-
-    # obtain the Cisco DNA Center Auth Token
-    dnac_auth = get_dnac_jwt_token(DNAC_AUTH)
-
-    # If client MAC Address not found, continue with pre-configured MAC Address
-
-    all_client_info = get_client_info_by_name(CLIENT_USERNAME, dnac_auth)
-    client_mac = ''
-    if all_client_info != []:
-        for client in all_client_info:
-            if client['userDetails']['hostType'] == 'WIRELESS':
-                client_mac = client['userDetails']['id']
-    else:
-        print('\nUnknown wireless client MAC Address for the client with the username: ', CLIENT_USERNAME)
-
-    if client_mac == '':
-        print('Wireless client MAC address not found, use the pre-configured MAC Address: ', CLIENT_MAC)
-        client_mac = CLIENT_MAC
-    else:
-        print('\nWireless Client MAC Address found: ', client_mac, '\n')
-
-    # start to collect data about the client to monitor
-    # poll the client until notification will be sent ot Webex
-
-    alert_count = 0  # used to detect if any of the minimum quality conditions are triggered, 3 consecutive times
-
-    while alert_count < COUNTER_MAX:
-
-        # initialize the alert flag, used to identify if any conditions of client poor performance are met
-        alert = False
-
-        # get a new token every time, to avoid token expiration after 60 minutes
-        dnac_auth = get_dnac_jwt_token(DNAC_AUTH)
-
-        # find out the epoch time msec
-        timestamp = get_epoch_time()
-
+    print('\nWireless client users to be monitored: ', len(MONITORED_CLIENTS))
+
+    # find the MAC address for each client to be monitored, from the identity cache
+    # the usernames not cached are looked up in the background, within the API rate limit,
+    # using the pre-configured MAC address until found
+    # the Cisco DNA Center Auth Token is obtained on first use, and shared by all the API calls
+    # the MAC addresses found by the identity cache thread are applied by the poller, between the client polls
+    client_states = {}
+    mac_updates = MacUpdates()
+    identity_cache = IdentityCache(lambda username: DNAC_TOKEN.call(find_wireless_client, username),
+                                   on_resolved=mac_updates.put)
+    for client in MONITORED_CLIENTS:
+        client_mac = identity_cache.get_mac(client['username']) or client.get('mac_address')
+        client_states[client['username']] = create_client_state(client['username'], client_mac)
+    print('\nWireless Client MAC Addresses found in the identity cache: ',
+          sum(1 for client in MONITORED_CLIENTS if identity_cache.get_mac(client['username'])))
+
+    # the alert counters, the MAC addresses and the last samples, resumed from the last poller checkpoint
+    checkpoint = None
+    if POLLER_CHECKPOINT:
+        checkpoint = PollerCheckpoint()
+        print('\nWireless client states restored from the poller checkpoint: ',
+              checkpoint.restore(client_states.values()))
+    identity_cache.start_refresh(client_states.keys())
+
+    def request_lookup(client_state):
+        # the MAC address stopped returning data, look up the username again
+        identity_cache.request_lookup(client_state['username'])
+
+    def get_detail(mac_address, timestamp):
         # receive the client detail info for the client with the MAC address at a specific timestamp
-        client_info = get_client_detail(client_mac, timestamp, dnac_auth)
-
-        # parse the total data transfer, ap name, snr, data rate, location, ssid
-        try:
-            health_score = client_info['detail']['healthScore']
-            for score in health_score:
-                if score['healthType'] == 'OVERALL':
-                    client_health = score['score']
-            total_data_transfer = float(client_info['detail']['txBytes']) + float(client_info['detail']['rxBytes'])
-            ap_name = client_info['detail']['clientConnection']
-            snr = float(client_info['detail']['snr'])
-            data_rate = float(client_info['detail']['dataRate'])
-            location = client_info['detail']['location']
-            ssid = client_info['detail']['ssid']
-            print(client_health, total_data_transfer, data_rate, snr, ssid, ap_name, location)
-        except:
-            print('\nUnable to collect the client info, client not in the Cisco DNA Center inventory')
-
-        # verify client connectivity performance
-        if client_health <= HEALTH_LOW:
-            alert = True
-        if snr <= SNR:
-            alert = True
-        if total_data_transfer <= BW_LOW:
-            alert = True
-
-        # if any of the above conditions are true, increase the alert_count
-        # if performance improved during this poll interval, reset the alert_count
-        if alert:
-            alert_count += 1
+        return DNAC_TOKEN.call(get_client_detail, mac_address, timestamp)
+
+    def get_bulk(mac_addresses):
+        # receive the health of all the clients, one page at a time
+        return collect_client_health(lambda offset, limit: DNAC_TOKEN.call(get_clients_page, offset, limit),
+                                     mac_addresses)
+
+    # the client baselines for the anomaly alerts, warm-loaded from the last checkpoint
+    baselines = None
+    if BASELINE_ALERTS:
+        baselines = BaselineStore()
+        print('\nClient baselines loaded: ', baselines.load())
+
+    notification_queue = create_notification_queue()
+    # the API call latency, the sweeps and the queues, on the standalone /metrics endpoint
+    register_poller_metrics(notification_queue)
+    start_metrics_server()
+
+    # start to collect data about the clients to monitor
+    # poll all the clients concurrently, queue a notification to Webex when a client reaches COUNTER_MAX,
+    # the notifications within NOTIFY_COALESCE_WINDOW are coalesced into digest cards
+    # with the poll scheduler, each client is polled on its own deadline, faster while its performance is low
+    # in sweeps mode, in bulk collection mode, the client detail is collected only for the clients missing from
+    # the clients list
+    def on_sample(client_state):
+        identity_cache.mark_seen(client_state['username'])
+
+    # the polling runs until interrupted, the queued notifications and reports are sent on the way out
+    try:
+        if POLL_SCHEDULER:
+            schedule_clients(list(client_states.values()), get_detail, notification_queue.submit, TIME_INTERVAL * 60,
+                             on_sample=on_sample, on_no_data=request_lookup, profiles=ThresholdProfiles(),
+                             baselines=baselines, checkpoint=checkpoint, mac_updates=mac_updates)
         else:
-            alert_count = 0
-        print('Alert: ', alert, alert_count)
-        time.sleep(TIME_INTERVAL * 60)
-
-    # send notifications to Webex Teams
-
-    # find the Webex Teams space id
-    space_id = get_room_id(WHATSOP_ROOM)
-
-    card_message = {
-        "roomId": space_id,
-        "markdown": "Wireless Client Notification",
-        "attachments": [
-            {
-                "contentType": "application/vnd.microsoft.card.adaptive",
-                "content": {
-                    "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                    "type": "AdaptiveCard",
-                    "version": "1.0",
-                    "body": [
-                        {
-                            "type": "TextBlock",
-                            "text": "Wireless Client Notification",
-                            "weight": "bolder",
-                            "size": "large"
-                        },
-                        {
-                            "type": "TextBlock",
-                            "text": "Cisco DNA Center identified low wireless performance for this client:",
-                            "wrap": True
-                        },
-                        {
-                            "type": "FactSet",
-                            "facts": [
-                                {
-                                    "title": "Username: ",
-                                    "value": CLIENT_USERNAME
-                                },
-                                {
-                                    "title": "MAC Address:",
-                                    "value": client_mac
-                                },
-                                {
-                                    "title": "Location:",
-                                    "value": location
-                                },
-                                {
-                                    "title": "Access Point:",
-                                    "value": ap_name
-                                },
-                                {
-                                    "title": "SSID:",
-                                    "value": ssid
-                                },
-                                {
-                                    "title": "Health Score:",
-                                    "value": str(client_health)
-                                },
-                                {
-                                    "title": "Total data:",
-                                    "value": str(total_data_transfer)
-                                },
-                                {
-                                    "title": "SNR:",
-                                    "value": str(snr)
-                                }
-                            ]
-                        }
-                    ],
-                    "actions": [
-                        {
-                            "type": "Action.openURL",
-                            "title": "Cisco DNA Center Client 360",
-                            "url": DNAC_URL + '/dna/assurance/client/details?macAddress=' + client_mac
-                        }
-                        #{
-                        #    "type": "Action.openURL",
-                        #    "title": "ServiceNow incident " + issue_number,
-                        #    "url": jira_issue_url
-                        #}
-                    ]
-                }
-            }
-        ]
-    }
-
-    post_room_card_message(WHATSOP_ROOM, card_message)
-
-    print('Webex Teams notification message posted')
+            monitor_clients(list(client_states.values()), get_detail, notification_queue.submit, TIME_INTERVAL * 60,
+                            on_sample=on_sample, get_bulk=get_bulk if BULK_COLLECTION else None,
+                            on_no_data=request_lookup, evaluator=BatchEvaluator() if BATCH_EVALUATION else None,
+                            profiles=ThresholdProfiles(), baselines=baselines, checkpoint=checkpoint,
+                            mac_updates=mac_updates)
+    finally:
+        notification_queue.close()  # send the queued notifications
+        identity_cache.stop_refresh()  # save the last seen times
 
     current_time = str(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     print('\nWireless Client Monitoring App Run End, ', current_time)
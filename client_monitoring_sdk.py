@@ -25,13 +25,11 @@ __version__ = "0.1.0"
 __copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
 __license__ = "Cisco Sample Code License, Version 1.1"
 
-import requests
 import urllib3
 import json
 import os
 import time
 import datetime
-import logging
 import dnacentersdk
 
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
@@ -43,17 +41,49 @@ from requests.auth import HTTPBasicAuth  # for Basic Auth
 from datetime import datetime
 
 from config import DNAC_URL, DNAC_PASS, DNAC_USER
-from config import CLIENT_USERNAME, CLIENT_MAC
-from config import BW_LOW, HEALTH_LOW, COUNTER_MAX, TIME_INTERVAL, SNR
-from config import WHATSOP_BOT_AUTH, WHATSOP_ROOM, WEBEX_TEAMS_URL
-from config import WEBHOOK_RECEIVER_URL, WEBHOOK_HEADER
+from config import MONITORED_CLIENTS, TIME_INTERVAL, BULK_COLLECTION, BATCH_EVALUATION, BASELINE_ALERTS
+from config import POLL_SCHEDULER, POLLER_CHECKPOINT
+from config import WHATSOP_ROOM
+from config import WEBHOOK_RECEIVER_URL, WEBHOOK_HEADER, WEBHOOK_BATCH_URL, REPORT_BATCHING
 from dnacentersdk import DNACenterAPI
 
+import webex_rooms
+from client_poller import create_client_state, monitor_clients, schedule_clients, MacUpdates
+from batch_evaluator import BatchEvaluator
+from threshold_profiles import ThresholdProfiles
+from client_baselines import BaselineStore
+from poller_checkpoint import PollerCheckpoint
+from notification_queue import NotificationQueue
+from adaptive_cards import render_notification_card
+from client_identity import IdentityCache
+from client_bulk import collect_client_health, get_clients_page_sdk
+from dnac_token import DnacTokenManager
+from rate_limiter import rate_limited
+from report_sender import ReportSender, post_reports
+from app_metrics import instrumented, register_poller_metrics, start_metrics_server
+from structured_logging import setup_logging
+
 urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
 
 DNAC_AUTH = HTTPBasicAuth(DNAC_USER, DNAC_PASS)
 
 
+@instrumented('dnac-token')
+def create_dnac_api():
+    """
+    This function will create a DNACenterAPI "Connection Object", authenticating with Cisco DNA Center
+    :return: DNACenterAPI "Connection Object"
+    """
+    return DNACenterAPI(username=DNAC_USER, password=DNAC_PASS, base_url=DNAC_URL, version='2.1.2', verify=False)
+
+
+# DNACenterAPI "Connection Object" shared by all the API calls, re-created before the 60 minutes token expiration
+DNAC_API = DnacTokenManager(create_dnac_api)
+
+# the client reports sent to the webhook receiver in batches, by count or age
+REPORT_SENDER = ReportSender(WEBHOOK_BATCH_URL, WEBHOOK_HEADER)
+
+
 def pprint(json_data):
     """
     Pretty print JSON formatted data
@@ -72,34 +102,56 @@ def get_epoch_time():
     return int(epoch)
 
 
+@rate_limited('client-detail')
+@instrumented('client-detail')
+def get_client_detail(mac_address, timestamp, dnac_api):
+    """
+    This function will return the client_detail info for the wireless client using the MAC address {mac_address},
+    at a specific timestamp in epoch msec
+    100 API calls/minute
+    :param mac_address: client MAC address
+    :param timestamp: timestamp in epoch msec
+    :param dnac_api: DNACenterAPI "Connection Object"
+    :return: wireless client info
+    """
+    return dnac_api.clients.get_client_detail(mac_address=mac_address, timestamp=timestamp)
+
+
+@rate_limited('user-enrichment-details')
+@instrumented('user-enrichment-details')
+def get_client_info_by_name(username, dnac_api):
+    """
+    This function will return the wireless client info for the wireless client using the username {username}
+    5 API calls/minute
+    :param username: client username
+    :param dnac_api: DNACenterAPI "Connection Object"
+    :return: wireless client info
+    """
+    return dnac_api.clients.get_client_enrichment_details(
+        headers={'entity_type': 'network_user_id', 'entity_value': username})
+
+
 def get_room_id(room_name):
     """
-    This function will find the Webex Teams space id based on the {space_name}
-    Call to Webex Teams - /rooms
+    This function will find the Webex Teams space id based on the {space_name}, using the room directory cache
     :param room_name: The Webex Teams room name
     :return: the Webex Teams room Id
     """
-    room_id = None
-    url = WEBEX_TEAMS_URL + '/v1/rooms' + '?sortBy=lastactivity&max=1000'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    space_response = requests.get(url, headers=header, verify=False)
-    space_list_json = space_response.json()
-    space_list = space_list_json['items']
-    for spaces in space_list:
-        if spaces['title'] == room_name:
-            room_id = spaces['id']
-    return room_id
-
-
-def post_room_card_message(card_message):
+    return webex_rooms.get_room_id(room_name)
+
+
+def post_room_card_message(card_message, space_name=None):
     """
     This function will post a adaptive card message {card_message} to the Webex Teams space with the {space_name}
-    :param card_message: card message
-    :return: none
+    If the {space_name} is provided and the post fails because the room is unknown,
+    the room id is looked up again and the post retried
+    :param card_message: card message JSON, rendered by the adaptive_cards module
+    :param space_name: optional Webex Teams space name, the roomId is added to the {card_message}
+    :return: the Webex Teams response
     """
-    url = WEBEX_TEAMS_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    requests.post(url, data=json.dumps(card_message), headers=header, verify=False)
+    if space_name is not None:
+        return webex_rooms.post_room_body(space_name, card_message)
+    return webex_rooms.post_message(card_message)
 
 
 def send_client_details(payload, webhook_url, header):
@@ -110,214 +162,158 @@ def send_client_details(payload, webhook_url, header):
     :param header: header required
     :return: status code
     """
-    response = requests.post(webhook_url, data=json.dumps(payload), headers=header, verify=False)
+    response = post_reports(payload, webhook_url, header)
     return response.status_code, response.text
 
 
-def main():
+def find_wireless_client(username, dnac_api):
     """
-    This application will monitor a wireless user client device.
-    It will identify when the client experiences poor performance:
-     - decreased total transmit and receive data
-     - lower client health score
-     - low SNR value
-    If any of the above conditions are true, exceeding a predefined number of consecutive polling intervals,
-    it will create a notification to Webex Teams
+    This function will find the wireless client details for the client with the {username}
+    :param username: client username
+    :param dnac_api: DNACenterAPI "Connection Object"
+    :return: the wireless client userDetails, including the MAC address {id}, None if not found
     """
+    all_client_info = get_client_info_by_name(username, dnac_api)
+    wireless_client = None
+    for client in all_client_info:
+        if client['userDetails'].get('hostType') == 'WIRELESS':
+            wireless_client = client['userDetails']
+    return wireless_client
 
-    # logging, debug level, to file {application_run.log}
-    logging.basicConfig(
-        filename='application_run.log',
-        level=logging.DEBUG,
-        format='%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S')
 
+def report_client_details(client_state):
+    """
+    This function will send the last collected client data to the webhook receiver, to enable the bot functionality
+    :param client_state: the client state, with the last collected metrics
+    :return: none
+    """
+    # prepare the payload
+    metrics = client_state['metrics']
     current_time = str(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-    print('\nWireless Client Monitoring App Start, ', current_time)
-
-    print('\nWireless client user to be monitored: ', CLIENT_USERNAME)
-
-    # Create a DNACenterAPI "Connection Object"
-    dnac_api = DNACenterAPI(username=DNAC_USER, password=DNAC_PASS, base_url=DNAC_URL, version='2.1.2', verify=False)
-
-    # If client MAC Address not found, continue with pre-configured MAC Address
-
-    all_client_info = dnac_api.clients.get_client_enrichment_details(
-        headers={'entity_type': 'network_user_id', 'entity_value': CLIENT_USERNAME})
-    client_mac = ''
-    if all_client_info != []:
-        for client in all_client_info:
-            if client['userDetails']['hostType'] == 'WIRELESS':
-                client_mac = client['userDetails']['id']
-    else:
-        print('\nUnknown wireless client MAC Address for the client with the username: ', CLIENT_USERNAME)
-
-    if client_mac == '':
-        print('Wireless client MAC address not found, use the pre-configured MAC Address: ', CLIENT_MAC)
-        client_mac = CLIENT_MAC
-    else:
-        print('\nWireless Client MAC Address found: ', client_mac, '\n')
+    client_report = {
+                        'username': client_state['username'],
+                        'details': {
+                            'mac_address': client_state['mac_address'],
+                            'location': metrics['location'],
+                            'access_point': metrics['access_point'],
+                            'ssid': metrics['ssid'],
+                            'health_score': metrics['health_score'],
+                            'total_data': metrics['total_data'],
+                            'snr': metrics['snr'],
+                            'data_rate': metrics['data_rate'],
+                            'timestamp': current_time
+                        }
+    }
+    if REPORT_BATCHING:
+        # buffered, sent with the other clients reports in one request
+        REPORT_SENDER.add(client_report)
+        return
+    response = send_client_details(client_report, WEBHOOK_RECEIVER_URL, WEBHOOK_HEADER)
+    print('\nWireless Client POST API status: ', response[1])
 
-    # start to collect data about the monitored client
-    # poll the client until notification will be sent ot Webex
 
-    alert_count = 0  # used to count when minimum performance params are not met
+def create_notification_queue():
+    """
+    This function will create the Webex Teams notification queue, the alerts are coalesced into digest cards
+    :return: NotificationQueue
+    """
+    # the room id is set when the card is posted, using the room directory cache
+    return NotificationQueue(lambda card_message: post_room_card_message(card_message, WHATSOP_ROOM),
+                             render_notification_card)
 
-    while alert_count < COUNTER_MAX:
 
-        # initialize the alert flag, used to identify if any conditions of client poor performance are met
-        alert = False
+def main():
+    """
+    This application will monitor the wireless user client devices {MONITORED_CLIENTS}.
+    It will identify when a client experiences poor performance:
+     - decreased total transmit and receive data
+     - lower client health score
+     - low SNR value
+    If any of the above conditions are true, exceeding a predefined number of consecutive polling intervals,
+    it will create a notification to Webex Teams for that client
+    """
 
-        # create a DNACenterAPI "Connection Object", to avoid token expiration after 60 minutes
-        dnac_api = DNACenterAPI(username=DNAC_USER, password=DNAC_PASS, base_url=DNAC_URL, version='2.1.2',
-                                verify=False)
+    # logging, debug level, to file {application_run.log}, or written by a background thread in the async LOG_MODE
+    setup_logging()
 
-        # find out the epoch time msec
-        timestamp = get_epoch_time()
+    current_time = str(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    print('\nWireless Client Monitoring App Start, ', current_time)
 
+    print('\nWireless client users to be monitored: ', len(MONITORED_CLIENTS))
+
+    # find the MAC address for each client to be monitored, from the identity cache
+    # the usernames not cached are looked up in the background, within the API rate limit,
+    # using the pre-configured MAC address until found
+    # the DNACenterAPI "Connection Object" is created on first use, and shared by all the API calls
+    # the MAC addresses found by the identity cache thread are applied by the poller, between the client polls
+    client_states = {}
+    mac_updates = MacUpdates()
+    identity_cache = IdentityCache(lambda username: DNAC_API.call(find_wireless_client, username),
+                                   on_resolved=mac_updates.put)
+    for client in MONITORED_CLIENTS:
+        client_mac = identity_cache.get_mac(client['username']) or client.get('mac_address')
+        client_states[client['username']] = create_client_state(client['username'], client_mac)
+    print('\nWireless Client MAC Addresses found in the identity cache: ',
+          sum(1 for client in MONITORED_CLIENTS if identity_cache.get_mac(client['username'])))
+
+    # the alert counters, the MAC addresses and the last samples, resumed from the last poller checkpoint
+    checkpoint = None
+    if POLLER_CHECKPOINT:
+        checkpoint = PollerCheckpoint()
+        print('\nWireless client states restored from the poller checkpoint: ',
+              checkpoint.restore(client_states.values()))
+    identity_cache.start_refresh(client_states.keys())
+
+    def request_lookup(client_state):
+        # the MAC address stopped returning data, look up the username again
+        identity_cache.request_lookup(client_state['username'])
+
+    def get_detail(mac_address, timestamp):
         # receive the client detail info for the client with the MAC address at a specific timestamp
-        client_info = dnac_api.clients.get_client_detail(mac_address=client_mac, timestamp=timestamp)
-
-        # parse the total data transfer, ap name, snr, data rate, location, ssid
-        try:
-            health_score = client_info['detail']['healthScore']
-            for score in health_score:
-                if score['healthType'] == 'OVERALL':
-                    client_health = score['score']
-            total_data_transfer = float(client_info['detail']['txBytes']) + float(client_info['detail']['rxBytes'])
-            ap_name = client_info['detail']['clientConnection']
-            snr = float(client_info['detail']['snr'])
-            data_rate = float(client_info['detail']['dataRate'])
-            location = client_info['detail']['location']
-            ssid = client_info['detail']['ssid']
-            print(client_health, total_data_transfer, data_rate, snr, ssid, ap_name, location)
-        except:
-            print('\nUnable to collect the client info, client not in the Cisco DNA Center inventory')
-
-        # verify client connectivity performance
-        if client_health <= HEALTH_LOW:
-            alert = True
-        if snr <= SNR:
-            alert = True
-        if total_data_transfer <= BW_LOW:
-            alert = True
-
-        # if any of the above conditions are true, increase the alert_count
-        # if performance improved during this poll interval, reset the alert_count
-        if alert:
-            alert_count += 1
+        return DNAC_API.call(get_client_detail, mac_address, timestamp)
+
+    def get_bulk(mac_addresses):
+        # receive the health of all the clients, one page at a time
+        return collect_client_health(lambda offset, limit: DNAC_API.call(get_clients_page_sdk, offset, limit),
+                                     mac_addresses)
+
+    def on_sample(client_state):
+        identity_cache.mark_seen(client_state['username'])
+        report_client_details(client_state)
+
+    # the client baselines for the anomaly alerts, warm-loaded from the last checkpoint
+    baselines = None
+    if BASELINE_ALERTS:
+        baselines = BaselineStore()
+        print('\nClient baselines loaded: ', baselines.load())
+
+    notification_queue = create_notification_queue()
+    # the API call latency, the sweeps and the queues, on the standalone /metrics endpoint
+    register_poller_metrics(notification_queue, REPORT_SENDER)
+    start_metrics_server()
+
+    # start to collect data about the monitored clients
+    # poll all the clients concurrently, send each sample to the webhook receiver,
+    # and queue a notification to Webex when a client reaches COUNTER_MAX, coalesced into digest cards
+    # with the poll scheduler, each client is polled on its own deadline, faster while its performance is low
+    # in sweeps mode, in bulk collection mode, the client detail is collected only for the clients missing from
+    # the clients list
+    # the polling runs until interrupted, the queued notifications and reports are sent on the way out
+    try:
+        if POLL_SCHEDULER:
+            schedule_clients(list(client_states.values()), get_detail, notification_queue.submit, TIME_INTERVAL * 60,
+                             on_sample=on_sample, on_no_data=request_lookup, profiles=ThresholdProfiles(),
+                             baselines=baselines, checkpoint=checkpoint, mac_updates=mac_updates)
         else:
-            alert_count = 0
-        print('Alert: ', alert, alert_count)
-
-        # send the client data to the webhook receiver, to enable the bot functionality
-        # prepare the payload
-        current_time = str(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        client_report = {
-                            'username': CLIENT_USERNAME,
-                            'details': {
-                                'mac_address': client_mac,
-                                'location': location,
-                                'access_point': ap_name,
-                                'ssid': ssid,
-                                'health_score': health_score,
-                                'total_data': total_data_transfer,
-                                'snr': snr,
-                                'timestamp': current_time
-                            }
-        }
-        response = send_client_details(client_report, WEBHOOK_RECEIVER_URL, WEBHOOK_HEADER)
-        print('\nWireless Client POST API status: ', response[1])
-
-        time.sleep(TIME_INTERVAL * 60)
-
-    # send notifications to Webex Teams
-
-    # find the Webex Teams space id
-    space_id = get_room_id(WHATSOP_ROOM)
-
-    card_message = {
-        "roomId": space_id,
-        "markdown": "Wireless Client Notification",
-        "attachments": [
-            {
-                "contentType": "application/vnd.microsoft.card.adaptive",
-                "content": {
-                    "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                    "type": "AdaptiveCard",
-                    "version": "1.0",
-                    "body": [
-                        {
-                            "type": "TextBlock",
-                            "text": "Wireless Client Notification",
-                            "weight": "bolder",
-                            "size": "large"
-                        },
-                        {
-                            "type": "TextBlock",
-                            "text": "Cisco DNA Center identified low wireless performance for this client:",
-                            "wrap": True
-                        },
-                        {
-                            "type": "FactSet",
-                            "facts": [
-                                {
-                                    "title": "Username: ",
-                                    "value": CLIENT_USERNAME
-                                },
-                                {
-                                    "title": "MAC Address:",
-                                    "value": client_mac
-                                },
-                                {
-                                    "title": "Location:",
-                                    "value": location
-                                },
-                                {
-                                    "title": "Access Point:",
-                                    "value": ap_name
-                                },
-                                {
-                                    "title": "SSID:",
-                                    "value": ssid
-                                },
-                                {
-                                    "title": "Health Score:",
-                                    "value": str(client_health)
-                                },
-                                {
-                                    "title": "Total data:",
-                                    "value": str(total_data_transfer)
-                                },
-                                {
-                                    "title": "SNR:",
-                                    "value": str(snr)
-                                }
-                            ]
-                        }
-                    ],
-                    "actions": [
-                        {
-                            "type": "Action.openURL",
-                            "title": "Cisco DNA Center Client 360",
-                            "url": DNAC_URL + '/dna/assurance/client/details?macAddress=' + client_mac
-                        }
-                        # {
-                        #    "type": "Action.openURL",
-                        #    "title": "ServiceNow incident " + issue_number,
-                        #    "url": jira_issue_url
-                        # }
-                    ]
-                }
-            }
-        ]
-    }
-
-    post_room_card_message(card_message)
-
-
-
-    print('Webex Teams notification message posted')
+            monitor_clients(list(client_states.values()), get_detail, notification_queue.submit, TIME_INTERVAL * 60,
+                            on_sample=on_sample, get_bulk=get_bulk if BULK_COLLECTION else None,
+                            on_no_data=request_lookup, evaluator=BatchEvaluator() if BATCH_EVALUATION else None,
+                            profiles=ThresholdProfiles(), baselines=baselines, checkpoint=checkpoint,
+                            mac_updates=mac_updates)
+    finally:
+        REPORT_SENDER.flush()  # send the buffered client reports
+        notification_queue.close()  # send the queued notifications
+        identity_cache.stop_refresh()  # save the last seen times
 
     current_time = str(datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     print('\nWireless Client Monitoring App Run End, ', current_time)
@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import BW_LOW, HEALTH_LOW, COUNTER_MAX, SNR
+from config import POLLER_MAX_WORKERS
+
+from rate_limiter import get_rate_limiter
+from client_sample import parse_client_detail, EVALUATED_FIELDS
+from app_metrics import SWEEPS, SWEEP_SECONDS, POLLED_CLIENTS, CLIENTS_IN_ALERT, ALERTS, POLL_FAILURES
+from app_metrics import SCHEDULED_RATE
+from poll_scheduler import PollScheduler
+
+
+def get_epoch_time():
+    """
+    This function will return the epoch time for current time
+    :return: epoch time including msec
+    """
+    epoch = time.time() * 1000
+    return int(epoch)
+
+
+def create_client_state(username, mac_address):
+    """
+    This function will create the polling state for one monitored wireless client
+    :param username: client username
+    :param mac_address: client MAC address
+    :return: client state, a dict with the client identity, the alert counter, the last collected metrics
+    and the thresholds from the threshold profiles, None for the global thresholds
+    """
+    return {
+        'username': username,
+        'mac_address': mac_address,
+        'alert_count': 0,
+        'metrics': None,
+        'thresholds': None
+    }
+
+
+class MacUpdates:
+    """
+    The client MAC addresses found by other threads, like the identity cache refresh, applied by the poller
+    to the client states when no poll of the client is in progress: before each sweep, or before the client poll
+    in scheduler mode. The client states are only updated by the poller.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # username -> MAC address
+
+    def put(self, username, mac_address):
+        """
+        This function will queue the new {mac_address} for the client {username}, the last one is applied
+        :param username: client username
+        :param mac_address: client MAC address
+        :return: none
+        """
+        with self._lock:
+            self._pending[username] = mac_address
+
+    def apply(self, client_state):
+        """
+        This function will update the {client_state} MAC address, if a new one is queued for the client
+        :param client_state: client state
+        :return: True if updated
+        """
+        with self._lock:
+            mac_address = self._pending.pop(client_state['username'], None)
+        if mac_address is None:
+            return False
+        client_state['mac_address'] = mac_address
+        logging.info('Wireless client MAC Address updated for %s: %s', client_state['username'], mac_address)
+        return True
+
+    def apply_all(self, client_states):
+        """
+        This function will update the MAC address of the {client_states} with a new one queued
+        :param client_states: list of client states
+        :return: number of client states updated
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+        return sum(1 for client_state in client_states if self.apply(client_state))
+
+
+def check_client_performance(metrics, thresholds=None):
+    """
+    This function will verify the client connectivity performance
+    :param metrics: the parsed client metrics, ClientSample or dict, None for the missing metrics
+    :param thresholds: optional Thresholds for the client, the global thresholds if None
+    :return: True if any of the minimum quality conditions are triggered, False otherwise
+    """
+    health_low, snr_low, bw_low = (HEALTH_LOW, SNR, BW_LOW) if thresholds is None else thresholds[:3]
+    # the missing metrics are not evaluated
+    if metrics['client_health'] is not None and metrics['client_health'] <= health_low:
+        return True
+    if metrics['snr'] is not None and metrics['snr'] <= snr_low:
+        return True
+    if metrics['total_data'] is not None and metrics['total_data'] <= bw_low:
+        return True
+    return False
+
+
+def get_counter_max(client_state):
+    """
+    This function will return the number of consecutive low performance polls to alert for the client
+    :param client_state: client state
+    :return: the client counter max
+    """
+    thresholds = client_state.get('thresholds')
+    return COUNTER_MAX if thresholds is None else thresholds.counter_max
+
+
+def poll_client(client_state, get_detail, timestamp, on_sample=None, metrics=None, on_no_data=None, evaluator=None,
+                profiles=None, baselines=None):
+    """
+    This function will collect and evaluate one sample for the client with the state {client_state}
+    :param client_state: client state, updated in place
+    :param get_detail: function called with (mac_address, timestamp), returns the client detail info
+    :param timestamp: timestamp in epoch msec
+    :param on_sample: optional function called with the client state after each successful sample
+    :param metrics: optional metrics already collected in bulk, the client detail is collected if None
+    :param on_no_data: optional function called with the client state when no data is returned for the client
+    :param evaluator: optional BatchEvaluator, the sample is stored and evaluated with all the clients at the end
+    of the sweep, instead of evaluated now
+    :param profiles: optional ThresholdProfiles, to select the thresholds by the client location, SSID and AP
+    :param baselines: optional BaselineStore, the sample is evaluated against the client baseline instead of
+    the thresholds
+    :return: the client state
+    """
+    if metrics is None:
+        client_info = get_detail(client_state['mac_address'], timestamp)
+        metrics = parse_client_detail(client_info)
+    if metrics is not None and all(metrics[field] is None for field in EVALUATED_FIELDS):
+        # nothing to evaluate, same as no sample
+        logging.warning('No client metrics for the client: %s', client_state['username'])
+        metrics = None
+    if metrics is None:
+        # no sample this interval, keep the alert_count unchanged
+        print('\nUnable to collect the client info, client not in the Cisco DNA Center inventory: ',
+              client_state['username'])
+        if on_no_data is not None:
+            on_no_data(client_state)
+        return client_state
+
+    client_state['metrics'] = metrics
+    if profiles is not None:
+        client_state['thresholds'] = profiles.get_thresholds(metrics['location'], metrics['ssid'],
+                                                             metrics['access_point'])
+
+    if evaluator is not None:
+        evaluator.set_metrics(client_state['username'], metrics, client_state['thresholds'])
+        print(client_state['username'], metrics['client_health'], metrics['total_data'], metrics['data_rate'],
+              metrics['snr'], metrics['ssid'], metrics['access_point'], metrics['location'])
+        if on_sample is not None:
+            on_sample(client_state)
+        return client_state
+
+    # if any of the conditions are true, increase the alert_count
+    # if performance improved during this poll interval, reset the alert_count
+    if baselines is not None:
+        anomalies = baselines.update(client_state['username'], metrics)
+        alert = bool(anomalies)
+        if alert:
+            print('Below the client baseline: ', ', '.join(anomalies))
+    else:
+        alert = check_client_performance(metrics, client_state['thresholds'])
+    if alert:
+        client_state['alert_count'] += 1
+    else:
+        client_state['alert_count'] = 0
+    print(client_state['username'], metrics['client_health'], metrics['total_data'], metrics['data_rate'],
+          metrics['snr'], metrics['ssid'], metrics['access_point'], metrics['location'])
+    print('Alert: ', alert, client_state['alert_count'])
+
+    if on_sample is not None:
+        on_sample(client_state)
+    return client_state
+
+
+def run_sweep(client_states, get_detail, executor, on_sample=None, get_bulk=None, on_no_data=None, evaluator=None,
+              profiles=None, baselines=None):
+    """
+    This function will poll all the clients {client_states} once, concurrently, using the {executor}
+    :param client_states: list of client states
+    :param get_detail: function called with (mac_address, timestamp), returns the client detail info
+    :param executor: the thread pool used to fan out the client detail calls
+    :param on_sample: optional function called with the client state after each successful sample
+    :param get_bulk: optional function called with the list of MAC addresses, returns a dict with the
+    MAC address -> metrics collected in bulk. The client detail is collected only for the clients not included
+    :param on_no_data: optional function called with the client state when no data is returned for the client
+    :param evaluator: optional BatchEvaluator, to evaluate all the samples in one pass at the end of the sweep
+    :param profiles: optional ThresholdProfiles, to select the thresholds by the client location, SSID and AP
+    :param baselines: optional BaselineStore, to alert on the deviation from the client baseline, the {evaluator}
+    is not used
+    :return: the list of client states reaching their counter max, the sweep duration in seconds
+    """
+    start_time = time.monotonic()
+    timestamp = get_epoch_time()
+    if baselines is not None:
+        evaluator = None
+    # the clients with an unknown MAC address are polled after the MAC address is found
+    client_states = [client_state for client_state in client_states if client_state['mac_address']]
+    if evaluator is not None:
+        evaluator.add_clients(client_state['username'] for client_state in client_states)
+    bulk_metrics = {}
+    if get_bulk is not None:
+        try:
+            bulk_metrics = get_bulk([client_state['mac_address'] for client_state in client_states])
+        except Exception as error:
+            # continue with the client detail for all the clients
+            logging.exception('Bulk collection failed')
+            print('\nBulk collection failed, collect the client detail for all the clients: ', error)
+        print('\nBulk collection:', len(bulk_metrics), 'clients, client detail:',
+              len(client_states) - len(bulk_metrics), 'clients')
+    futures = {}
+    for client_state in client_states:
+        metrics = bulk_metrics.get(client_state['mac_address'].lower())
+        future = executor.submit(poll_client, client_state, get_detail, timestamp, on_sample, metrics, on_no_data,
+                                 evaluator, profiles, baselines)
+        futures[future] = client_state
+    alert_clients = []
+    for future in as_completed(futures):
+        client_state = futures[future]
+        try:
+            future.result()
+        except Exception as error:
+            # one failed client should not stop the sweep for all the other clients
+            logging.exception('Polling failed for the client: %s', client_state['username'])
+            POLL_FAILURES.inc()
+            print('\nPolling failed for the client: ', client_state['username'], error)
+            continue
+        if evaluator is None and client_state['alert_count'] >= get_counter_max(client_state):
+            alert_clients.append(client_state)
+    if evaluator is not None:
+        alert_usernames = set(evaluator.evaluate())
+        for client_state in client_states:
+            if client_state['username'] in alert_usernames:
+                client_state['alert_count'] = get_counter_max(client_state)
+                alert_clients.append(client_state)
+            else:
+                client_state['alert_count'] = evaluator.get_counter(client_state['username'])
+    sweep_duration = time.monotonic() - start_time
+    return alert_clients, sweep_duration
+
+
+def save_checkpoint(checkpoint, client_states=None):
+    """
+    This function will save the poller state checkpoint, the changed client states
+    :param checkpoint: the PollerCheckpoint
+    :param client_states: optional list of client states recorded first, when no client poll is in progress,
+    the client states recorded by the pollers if None
+    :return: none
+    """
+    try:
+        count = checkpoint.save(client_states)
+    except OSError:
+        logging.exception('Poller checkpoint not saved')
+        return
+    logging.info('Poller checkpoint: %s clients saved', count)
+
+
+def monitor_clients(client_states, get_detail, on_alert, interval, on_sweep_start=None, on_sample=None,
+                    get_bulk=None, on_no_data=None, max_workers=POLLER_MAX_WORKERS, max_sweeps=None, evaluator=None,
+                    profiles=None, baselines=None, checkpoint=None, mac_updates=None):
+    """
+    This function will poll all the clients {client_states} every {interval} seconds.
+    The client detail calls are fanned out across a bounded thread pool, each client keeps its own alert_count.
+    When a client reaches COUNTER_MAX consecutive low performance polls, {on_alert} is called and the
+    alert_count for that client is reset.
+    :param client_states: list of client states
+    :param get_detail: function called with (mac_address, timestamp), returns the client detail info
+    :param on_alert: function called with the client state when the client reaches COUNTER_MAX
+    :param interval: polling interval in seconds
+    :param on_sweep_start: optional function called before each sweep
+    :param on_sample: optional function called with the client state after each successful sample
+    :param get_bulk: optional function called with the list of MAC addresses, returns a dict with the
+    MAC address -> metrics collected in bulk
+    :param on_no_data: optional function called with the client state when no data is returned for the client
+    :param max_workers: maximum number of concurrent client detail calls
+    :param max_sweeps: optional number of sweeps, poll forever if None
+    :param evaluator: optional BatchEvaluator, to evaluate all the samples in one vectorized pass for each sweep
+    :param profiles: optional ThresholdProfiles, reloaded before each sweep if the profiles file was modified
+    :param baselines: optional BaselineStore, to alert on the deviation from the client baseline, checkpointed
+    after each sweep
+    :param checkpoint: optional PollerCheckpoint, the changed client states are saved after each sweep, and when
+    the polling stops
+    :param mac_updates: optional MacUpdates, the new client MAC addresses are applied before each sweep
+    :return: none
+    """
+    sweep_count = 0
+    if evaluator is not None and baselines is None:
+        # the alert counters are kept by the evaluator, from the restored client states
+        evaluator.add_clients(client_state['username'] for client_state in client_states)
+        for client_state in client_states:
+            evaluator.set_counter(client_state['username'], client_state['alert_count'])
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while max_sweeps is None or sweep_count < max_sweeps:
+                if on_sweep_start is not None:
+                    on_sweep_start()
+                if mac_updates is not None:
+                    mac_updates.apply_all(client_states)
+                if profiles is not None:
+                    profiles.reload_if_changed()
+                alert_clients, sweep_duration = run_sweep(client_states, get_detail, executor, on_sample, get_bulk,
+                                                           on_no_data, evaluator, profiles, baselines)
+                sweep_count += 1
+                SWEEPS.inc()
+                SWEEP_SECONDS.set(sweep_duration)
+                POLLED_CLIENTS.set(len(client_states))
+                CLIENTS_IN_ALERT.set(sum(1 for client_state in client_states if client_state['alert_count'] > 0))
+                ALERTS.inc(len(alert_clients))
+
+                print('\nSweep', sweep_count, 'polled', len(client_states), 'clients in', round(sweep_duration, 3),
+                      'seconds, interval', interval, 'seconds')
+                logging.info('Sweep %s: %s clients, %.3f seconds', sweep_count, len(client_states), sweep_duration)
+                if sweep_duration > interval:
+                    print('Sweep duration exceeded the polling interval')
+                    logging.warning('Sweep duration %.3f seconds exceeded the polling interval', sweep_duration)
+
+                # the total time the API calls waited for the rate limits, to size the polling interval
+                for endpoint, stats in get_rate_limiter().get_wait_stats().items():
+                    print('Rate limit', endpoint, 'calls:', stats['calls'], 'waits:', stats['waits'],
+                          'wait seconds:', round(stats['wait_seconds'], 3),
+                          'max wait seconds:', round(stats['max_wait_seconds'], 3))
+
+                for client_state in alert_clients:
+                    on_alert(client_state)
+                    client_state['alert_count'] = 0
+
+                if baselines is not None:
+                    try:
+                        baselines.save()
+                    except OSError:
+                        logging.exception('Client baselines checkpoint not saved')
+                if checkpoint is not None:
+                    save_checkpoint(checkpoint, client_states)
+
+                if max_sweeps is None or sweep_count < max_sweeps:
+                    time.sleep(max(0.0, interval - sweep_duration))
+    finally:
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, client_states)
+
+
+def schedule_clients(client_states, get_detail, on_alert, interval, on_sample=None, on_no_data=None,
+                     max_workers=POLLER_MAX_WORKERS, max_polls=None, profiles=None, baselines=None, scheduler=None,
+                     checkpoint=None, mac_updates=None):
+    """
+    This function will poll each client {client_states} on its own deadline, from the PollScheduler.
+    The clients with low performance are polled faster, the stable clients slower, within the Cisco DNA Center
+    API budget, see PollScheduler. The samples are evaluated when collected, each client keeps its own
+    alert_count. When a client reaches its counter max, and its low performance lasted the same time as counter
+    max polls at the base interval, {on_alert} is called and the alert_count is reset.
+    Every base interval, the threshold profiles are reloaded if modified, the baselines and the poller checkpoint
+    are saved, and the schedule is reported.
+    :param client_states: list of client states
+    :param get_detail: function called with (mac_address, timestamp), returns the client detail info
+    :param on_alert: function called with the client state when the client reaches its counter max
+    :param interval: polling interval in seconds, for the clients with good performance
+    :param on_sample: optional function called with the client state after each successful sample
+    :param on_no_data: optional function called with the client state when no data is returned for the client
+    :param max_workers: maximum number of concurrent client detail calls
+    :param max_polls: optional number of polls, poll forever if None
+    :param profiles: optional ThresholdProfiles, reloaded every base interval if the profiles file was modified
+    :param baselines: optional BaselineStore, to alert on the deviation from the client baseline, checkpointed
+    every base interval
+    :param scheduler: optional PollScheduler, created for the {client_states} and {interval} if None
+    :param checkpoint: optional PollerCheckpoint, the changed client states are saved every base interval, and when
+    the polling stops
+    :param mac_updates: optional MacUpdates, a new client MAC address is applied before the client poll
+    :return: none
+    """
+    if scheduler is None:
+        scheduler = PollScheduler(client_states, interval)
+    print('\nPoll scheduler:', len(client_states), 'clients, base interval', round(scheduler.base_interval, 3),
+          'seconds, budget', round(scheduler.budget, 1), 'calls/minute')
+
+    breach_start = {}  # username -> due time of the first low performance poll
+
+    def poll_due(client_state, due_time):
+        breaching = False
+        try:
+            # the client is polled by one worker at a time, the worker applies the new MAC address
+            if mac_updates is not None:
+                mac_updates.apply(client_state)
+            # the clients with an unknown MAC address are polled after the MAC address is found
+            if client_state['mac_address']:
+                poll_client(client_state, get_detail, get_epoch_time(), on_sample, None, on_no_data, None, profiles,
+                            baselines)
+                breaching = client_state['alert_count'] > 0
+                if not breaching:
+                    breach_start.pop(client_state['username'], None)
+                else:
+                    # the faster polls do not shorten the alert delay, the low performance has to last
+                    # counter max base intervals, same as counter max sweeps
+                    counter_max = get_counter_max(client_state)
+                    start_time = breach_start.setdefault(client_state['username'], due_time)
+                    if client_state['alert_count'] >= counter_max and \
+                            due_time - start_time >= (counter_max - 1) * scheduler.base_interval:
+                        ALERTS.inc()
+                        on_alert(client_state)
+                        client_state['alert_count'] = 0
+                        breach_start.pop(client_state['username'], None)
+        except Exception as error:
+            # one failed client should not stop the polling for all the other clients
+            logging.exception('Polling failed for the client: %s', client_state['username'])
+            print('\nPolling failed for the client: ', client_state['username'], error)
+            POLL_FAILURES.inc()
+        finally:
+            # a consistent copy of the client state, the checkpoint is saved by the main thread
+            if checkpoint is not None:
+                checkpoint.record(client_state)
+            scheduler.reschedule(client_state, due_time, breaching)
+
+    if checkpoint is not None:
+        for client_state in client_states:
+            checkpoint.record(client_state)
+    poll_count = 0
+    period_polls = 0
+    period_start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while max_polls is None or poll_count < max_polls:
+                period_end = period_start + scheduler.base_interval
+                due_clients = scheduler.wait_due(timeout=max(0.0, period_end - time.monotonic()))
+                if max_polls is not None:
+                    due_clients = due_clients[:max_polls - poll_count]
+                for client_state, due_time in due_clients:
+                    executor.submit(poll_due, client_state, due_time)
+                poll_count += len(due_clients)
+                period_polls += len(due_clients)
+
+                if time.monotonic() < period_end:
+                    continue
+                # once every base interval
+                POLLED_CLIENTS.set(len(client_states))
+                CLIENTS_IN_ALERT.set(sum(1 for client_state in client_states if client_state['alert_count'] > 0))
+                SCHEDULED_RATE.set(scheduler.planned_rate)
+                print('\nScheduled', period_polls, 'polls in', round(time.monotonic() - period_start, 3),
+                      'seconds, planned', round(scheduler.planned_rate, 1), 'calls/minute')
+                logging.info('Scheduled %s polls, planned %.1f calls/minute', period_polls, scheduler.planned_rate)
+                period_polls = 0
+                period_start = period_end
+                if profiles is not None:
+                    profiles.reload_if_changed()
+                if baselines is not None:
+                    try:
+                        baselines.save()
+                    except OSError:
+                        logging.exception('Client baselines checkpoint not saved')
+                if checkpoint is not None:
+                    save_checkpoint(checkpoint)
+    finally:
+        # after the polls in flight are complete
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, client_states)
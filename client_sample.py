@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import sys
+import json
+
+# optional fast JSON decoder for the Cisco DNA Center responses, the standard json module if not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the client metrics, in the ClientSample field order
+SAMPLE_FIELDS = ('client_health', 'total_data', 'access_point', 'snr', 'data_rate', 'location', 'ssid',
+                 'health_score')
+
+# the metrics evaluated against the thresholds
+EVALUATED_FIELDS = ('client_health', 'snr', 'total_data')
+
+
+def decode_json(body):
+    """
+    This function will decode the JSON response {body}, using orjson if installed
+    :param body: the response body, bytes or str
+    :return: the decoded object
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# the health scores repeat across the clients and the samples, one tuple is kept for each distinct health scores
+_health_scores_cache = {}
+HEALTH_SCORES_CACHE_SIZE = 4096
+
+
+def _intern_health_scores(health_scores):
+    cached = _health_scores_cache.get(health_scores)
+    if cached is not None:
+        return cached
+    if len(_health_scores_cache) < HEALTH_SCORES_CACHE_SIZE:
+        _health_scores_cache[health_scores] = health_scores
+    return health_scores
+
+
+def _intern(value):
+    # the AP, SSID and location names repeat across the clients and the samples, one copy is kept
+    return sys.intern(value) if type(value) is str else value
+
+
+class ClientSample:
+    """
+    One wireless client sample, the metrics parsed from the client detail or the clients list.
+    The missing or not valid metrics are None, the {missing} property lists them.
+    A compact record for long in-memory histories: no per-instance dict, the repeated names and health scores
+    are shared by the samples, the health scores are stored as (health type, score) tuples.
+    Supports the read-only mapping access, sample['snr'] and sample.get('snr'), used for the metrics dict.
+    """
+
+    __slots__ = ('client_health', 'total_data', 'access_point', 'snr', 'data_rate', 'location', 'ssid',
+                 'health_scores')
+
+    def __init__(self, client_health=None, total_data=None, access_point=None, snr=None, data_rate=None,
+                 location=None, ssid=None, health_scores=()):
+        """
+        :param client_health: the overall health score
+        :param total_data: total data transfer, tx + rx bytes
+        :param access_point: the AP name
+        :param snr: the signal to noise ratio
+        :param data_rate: the data rate
+        :param location: the client location, site hierarchy
+        :param ssid: the SSID
+        :param health_scores: tuple of (health type, score) tuples
+        """
+        self.client_health = client_health
+        self.total_data = total_data
+        self.access_point = _intern(access_point)
+        self.snr = snr
+        self.data_rate = data_rate
+        self.location = _intern(location)
+        self.ssid = _intern(ssid)
+        self.health_scores = health_scores
+
+    @property
+    def health_score(self):
+        """
+        The health scores in the Cisco DNA Center format, list of dicts with the healthType and score
+        """
+        return [{'healthType': health_type, 'score': score} for health_type, score in self.health_scores]
+
+    @property
+    def missing(self):
+        """
+        The names of the missing metrics
+        """
+        return tuple(field for field in self.__slots__ if getattr(self, field) in (None, ()))
+
+    def __getitem__(self, field):
+        if field not in SAMPLE_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        """
+        This function will return the metric {field}, or {default} if not a metric
+        :param field: the metric name
+        :param default: returned if {field} is not a metric
+        :return: the metric value, None if missing
+        """
+        if field not in SAMPLE_FIELDS:
+            return default
+        return getattr(self, field)
+
+    def keys(self):
+        """
+        This function will return the metric names, dict(sample) returns the metrics dict
+        :return: tuple with the metric names
+        """
+        return SAMPLE_FIELDS
+
+    def to_dict(self):
+        """
+        This function will return the metrics dict
+        :return: dict with the metric name -> value
+        """
+        return {field: getattr(self, field) for field in SAMPLE_FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, ClientSample):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return 'ClientSample(%s)' % ', '.join('%s=%r' % (field, getattr(self, field)) for field in self.__slots__)
+
+
+def parse_client_detail(client_info):
+    """
+    This function will parse the client detail info {client_info} returned by Cisco DNA Center, in one pass
+    :param client_info: client detail info
+    :return: ClientSample, with None for the missing metrics,
+    or None if the client is not in the Cisco DNA Center inventory
+    """
+    detail = client_info.get('detail') if isinstance(client_info, dict) else None
+    if not detail or not isinstance(detail, dict):
+        return None
+    client_health = None
+    health_scores = ()
+    health_score = detail.get('healthScore')
+    if isinstance(health_score, list):
+        health_scores = _intern_health_scores(tuple((score.get('healthType'), score.get('score'))
+                                                    for score in health_score if isinstance(score, dict)))
+        for health_type, score in health_scores:
+            if health_type == 'OVERALL':
+                client_health = score
+    tx_bytes = _to_float(detail.get('txBytes'))
+    rx_bytes = _to_float(detail.get('rxBytes'))
+    return ClientSample(
+        client_health=client_health,
+        total_data=None if tx_bytes is None or rx_bytes is None else tx_bytes + rx_bytes,
+        access_point=detail.get('clientConnection'),
+        snr=_to_float(detail.get('snr')),
+        data_rate=_to_float(detail.get('dataRate')),
+        location=detail.get('location'),
+        ssid=detail.get('ssid'),
+        health_scores=health_scores)
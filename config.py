@@ -32,27 +32,133 @@ __license__ = "Cisco Sample Code License, Version 1.1"
 DNAC_URL = 'cisco_dna_center'
 DNAC_USER = 'admin'
 DNAC_PASS = 'password'
+DNAC_TOKEN_LIFETIME = 60  # token expiration, in minutes
+DNAC_TOKEN_REFRESH_MARGIN = 5  # refresh the token this many minutes before expiration
+
+# Cisco DNA Center API rate limits, API calls/minute for each endpoint
+DNAC_RATE_LIMITS = {
+    'client-detail': 100,
+    'user-enrichment-details': 5,
+    'clients': 100
+}
+RATE_LIMIT_DB = 'rate_limits.sqlite'  # rate limit buckets, shared by all the processes on this host
+RATE_LIMIT_MAX_RETRIES = 3  # retries after a 429 response, waiting for the Retry-After time
 
 # the wireless client info
 CLIENT_USERNAME = 'username'
 CLIENT_MAC = 'mac_address'
 
+# the wireless clients to be monitored, the MAC address is used if the username is not found
+MONITORED_CLIENTS = [
+    {'username': CLIENT_USERNAME, 'mac_address': CLIENT_MAC}
+]
+POLLER_MAX_WORKERS = 16  # maximum number of concurrent client detail calls
+POLL_SCHEDULER = False  # poll each client on its own deadline, instead of sweeps, bulk and batch evaluation not used
+SCHEDULE_FAST_FACTOR = 0.25  # interval multiplier for the clients with low performance, alert counter above zero
+SCHEDULE_SLOW_FACTOR = 2.0  # interval multiplier for the stable clients
+SCHEDULE_STABLE_POLLS = 3  # number of consecutive good polls for a stable client
+SCHEDULE_BUDGET_SHARE = 0.8  # share of the client-detail rate limit planned by the scheduler
+POLLER_CHECKPOINT = True  # save the alert counters and the last samples, resumed after a restart
+POLLER_CHECKPOINT_FILE = 'poller_state.ckpt'  # the changed clients are appended to {POLLER_CHECKPOINT_FILE}.log
+BULK_COLLECTION = False  # collect the health of all the clients from the clients list, one page at a time
+BULK_PAGE_SIZE = 100  # number of clients in each page of the clients list
+
+# username <-> wireless MAC address cache, the lookups are limited to 5 API calls/minute
+IDENTITY_CACHE_FILE = 'client_identity.json'
+IDENTITY_CACHE_TTL = 24 * 60  # in minutes, look up the cached MAC addresses again after this time
+IDENTITY_REFRESH_RATE = 3  # background lookups/minute, leave part of the rate limit for other calls
+IDENTITY_LOOKUP_RETRY = 60  # in minutes, minimum time between lookups when a client stops returning data
+
+# historical backfill of the client history, python client_backfill.py, the missing samples in the last hours
+BACKFILL_HOURS = 24  # default time range, in hours before now
+BACKFILL_STEP = 5  # in minutes, one client detail call for each step without samples
+BACKFILL_FLUSH_SIZE = 500  # number of completed calls saved together to the history and the journal
+BACKFILL_JOURNAL = 'backfill_journal.txt'  # the completed calls, to resume an interrupted backfill
+
+# HTTP connection pools, one pool for each upstream host: Cisco DNA Center, Webex, webhook receiver
+HTTP_POOL_MAXSIZE = 16  # maximum number of keep-alive connections for each host
+HTTP_CONNECT_TIMEOUT = 5  # in seconds
+HTTP_READ_TIMEOUT = 30  # in seconds
+HTTP_RETRY_TOTAL = 3  # retries for the idempotent calls (GET)
+HTTP_RETRY_BACKOFF = 0.5  # in seconds, doubled for each retry
+
+# Application logging, to the {LOG_FILE}
+LOG_MODE = 'sync'  # 'sync': logging.basicConfig; 'async': queued, written by a background thread, rotated, sampled
+LOG_FILE = 'application_run.log'
+LOG_LEVEL = 'DEBUG'
+LOG_FORMAT = 'json'  # 'json' one JSON object per record, or 'text', for the async mode
+LOG_ROTATION = 'size'  # 'size' or 'time', rotate the log file by size or time
+LOG_MAX_BYTES = 50 * 1024 * 1024  # in bytes, the log file size that triggers the size rotation
+LOG_ROTATE_WHEN = 'midnight'  # the time rotation interval, see logging.handlers.TimedRotatingFileHandler
+LOG_BACKUP_COUNT = 5  # number of rotated log files kept
+LOG_QUEUE_SIZE = 10000  # maximum number of queued log records, the new records are dropped when full
+LOG_SAMPLE_BURST = 10  # maximum number of records below WARNING for the same message, each interval
+LOG_SAMPLE_INTERVAL = 60  # in seconds, the sampling interval
+
+# Prometheus metrics, the pollers expose /metrics on a standalone endpoint, the receiver on its flask app
+METRICS_HOST = '127.0.0.1'  # the poller metrics endpoint listening address
+METRICS_PORT = 9105  # the poller metrics endpoint port, None to disable
+
 # Assurance thresholds
 BW_LOW = 100.0  # in Bytes, total bandwidth transmitted and received
 HEALTH_LOW = 8  # minimum health score, range 1-10
 SNR = 60.0  # minimum SNR
 COUNTER_MAX = 3  # number of consecutive time intervals when the quality is low to trigger alert
 TIME_INTERVAL = 5  # length of time in minutes
+BATCH_EVALUATION = True  # evaluate the thresholds for all the clients in one vectorized pass for each sweep
+THRESHOLD_PROFILES_FILE = 'threshold_profiles.json'  # per location, SSID, AP thresholds, reloaded when modified
+THRESHOLD_CACHE_SIZE = 100000  # maximum number of cached (location, ssid, ap) threshold lookups
+
+# Baseline anomaly alerts, instead of the thresholds: alert when a metric drops below the client own baseline
+BASELINE_ALERTS = False  # True to alert on the deviation from the client baseline
+BASELINE_MAX_CLIENTS = 100000  # maximum number of clients with a baseline, the least recently updated are dropped
+BASELINE_ALPHA = 0.05  # weight of each new sample in the moving average and variance
+BASELINE_DEVIATION = 3.0  # number of standard deviations below the baseline for an anomaly
+BASELINE_WARMUP = 12  # number of samples to learn the baseline, before the anomalies are detected
+BASELINE_MIN_STD = (0.5, 2.0, 1.0, 1000.0)  # minimum standard deviation: health, snr, data rate, total data
+BASELINE_CHECKPOINT_FILE = 'client_baselines.npz'  # saved after each sweep, loaded at startup
 
 # Webex bot info
 WEBEX_TEAMS_URL = 'https://webexapis.com'
 WHATSOP_BOT_AUTH = 'Bearer ' + 'token'
 WHATSOP_BOT_ID = 'bot_id'
 WHATSOP_ROOM = 'Wireless Clients Monitoring'
+WEBEX_ROOM_CACHE_TTL = 3600  # in seconds, refresh the room name to room id cache
+WEBEX_ROOM_MISS_REFRESH = 60  # in seconds, minimum cache age to refresh when a room name is not found
+WEBEX_RATE_LIMITS = {'webex-messages': 100}  # Webex Teams messages posted/minute, shared by all the processes
+NOTIFY_COALESCE_WINDOW = 30  # in seconds, the alerts received within the window are sent together
+NOTIFY_GROUP_BY = 'access_point'  # digest cards for the clients with the same 'access_point', 'ssid' or 'location'
+NOTIFY_DIGEST_MIN = 2  # minimum number of clients in a group for a digest card
+NOTIFY_MAX_RETRIES = 5  # maximum number of retries for each notification card
+NOTIFY_RETRY_BACKOFF = 2  # in seconds, wait before the first retry, doubled for each retry
 
 # PythonAnywhere Receiver Info
 WEBHOOK_RECEIVER_URL = 'receiver_url'
 WEBHOOK_HEADER = {'content-type': 'application/json', 'Authorization': 'Basic http_basic_auth'}
+WEBHOOK_BATCH_URL = WEBHOOK_RECEIVER_URL + '/batch'  # batch endpoint, JSON array or NDJSON of client reports
+REPORT_BATCHING = True  # send the client reports in batches, to the {WEBHOOK_BATCH_URL}
+REPORT_BATCH_SIZE = 200  # maximum number of client reports in each batch
+REPORT_BATCH_MAX_AGE = 10  # in seconds, maximum time a client report is buffered before sent
+REPORT_BUFFER_MAX = 20000  # maximum number of buffered client reports, the oldest reports are dropped
+REPORT_MAX_ATTEMPTS = 5  # maximum number of attempts to send each client report
+REPORT_ENCODING = 'json'  # 'json' or 'msgpack', JSON is used if the msgpack package is not installed
+REPORT_COMPRESSION = 'zstd'  # 'zstd', 'gzip' or 'identity', gzip is used if the zstandard package is not installed
+REPORT_COMPRESSION_MIN_SIZE = 1024  # in bytes, the smaller client reports requests are not compressed
 
 # Wireless clients use case
 WIRELESS_FOLDER = 'wireless_clients'
+SAMPLE_RETENTION_DAYS = 30  # number of days of samples kept for each client, in {WIRELESS_FOLDER}/history
+SAMPLE_COMPACT_INTERVAL = 6 * 60  # in minutes, the receiver applies the retention time this often
+INGEST_QUEUE_SIZE = 10000  # maximum number of received reports waiting to be saved
+INGEST_BATCH_SIZE = 500  # maximum number of reports saved in one batch
+INGEST_FSYNC = True  # sync the saved report files to disk, and their folders once for each batch
+INGEST_RETRY_AFTER = 5  # in seconds, Retry-After sent to the poller when the queue is full
+INGEST_MAX_BODY_SIZE = 64 * 1024 * 1024  # in bytes, maximum decompressed client reports request size
+STATUS_INDEX_SIZE = 100000  # maximum number of clients in the in-memory last status index, used by the bot
+STATUS_SNAPSHOT_INTERVAL = 60  # in seconds, save the last status index snapshot, if updated
+
+# Webex Teams bot webhook handling
+BOT_WORKERS = 4  # number of threads handling the bot messages
+BOT_QUEUE_SIZE = 1000  # maximum number of webhook events waiting to be handled
+BOT_DEDUP_WINDOW = 600  # in seconds, the webhook events for the same message id are handled once
+BOT_RETRY_AFTER = 5  # in seconds, Retry-After sent to Webex Teams when the queue is full
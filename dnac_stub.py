@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+# Local stub Cisco DNA Center and Webex Teams, with synthetic wireless clients, to run the application offline.
+# Start it with: python dnac_stub.py --clients 1000 --port 8080
+# and set DNAC_URL = 'http://127.0.0.1:8080' and WEBEX_TEAMS_URL = 'http://127.0.0.1:8080' in config.py
+# The API responses can be delayed, and fail with 500 or 429, to test the application under load.
+# Some clients can be listed without their connection info, to test the fallback to the client detail.
+
+import json
+import time
+import random
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from config import WHATSOP_ROOM
+
+STUB_TOKEN = 'stub-token'
+
+# the API endpoints with the simulated latency and failures, the auth token is always returned
+CLIENT_DETAIL_PATH = '/dna/intent/api/v1/client-detail'
+ENRICHMENT_PATHS = ('/dna/intent/api/v1/user-enrichment-details', '/dna/intent/api/v1/client-enrichment-details')
+CLIENTS_PATH = '/dna/data/api/v1/clients'
+ROOMS_PATHS = ('/rooms', '/v1/rooms')
+MESSAGES_PATHS = ('/messages', '/v1/messages')
+
+
+def get_client_mac(index):
+    """
+    This function will return the MAC address of the synthetic client with the {index}
+    :param index: client index
+    :return: client MAC address
+    """
+    return '02:00:00:%02x:%02x:%02x' % ((index >> 16) & 0xff, (index >> 8) & 0xff, index & 0xff)
+
+
+def get_client_username(index):
+    """
+    This function will return the username of the synthetic client with the {index}
+    :param index: client index
+    :return: client username
+    """
+    return 'user%05d' % index
+
+
+def generate_client(index, seed=0):
+    """
+    This function will generate the metrics for the synthetic client with the {index}
+    :param index: client index
+    :param seed: random seed, change it to generate new metrics for all the clients
+    :return: dict with the client metrics
+    """
+    rand = random.Random(seed * 1000003 + index)
+    return {
+        'mac_address': get_client_mac(index),
+        'username': get_client_username(index),
+        'health': rand.randint(1, 10),
+        'snr': float(rand.randint(10, 70)),
+        'data_rate': float(rand.choice([6, 54, 144, 300, 866])),
+        'tx_bytes': float(rand.randint(0, 10 ** 7)),
+        'rx_bytes': float(rand.randint(0, 10 ** 7)),
+        'ssid': 'ssid-%d' % (index % 4),
+        'access_point': 'ap-%03d' % (index % 200),
+        'location': 'Global/Site-%d/Building-%d/Floor-%d' % (index % 5, index % 10, index % 3)
+    }
+
+
+def build_client_detail(client):
+    """
+    This function will build the client-detail response for the synthetic {client}
+    :param client: the client metrics
+    :return: client-detail response
+    """
+    return {
+        'detail': {
+            'hostMac': client['mac_address'],
+            'hostName': client['username'],
+            'hostType': 'WIRELESS',
+            'healthScore': [
+                {'healthType': 'OVERALL', 'reason': '', 'score': client['health']},
+                {'healthType': 'ONBOARDED', 'reason': '', 'score': 4},
+                {'healthType': 'CONNECTED', 'reason': '', 'score': client['health']}
+            ],
+            'txBytes': str(client['tx_bytes']),
+            'rxBytes': str(client['rx_bytes']),
+            'clientConnection': client['access_point'],
+            'snr': str(client['snr']),
+            'dataRate': str(client['data_rate']),
+            'location': client['location'],
+            'ssid': client['ssid']
+        }
+    }
+
+
+def build_client_summary(client, incomplete=False):
+    """
+    This function will build the clients list entry for the synthetic {client}
+    :param client: the client metrics
+    :param incomplete: list the client without the connection info, the client detail is required
+    :return: clients list entry
+    """
+    summary = {
+        'macAddress': client['mac_address'],
+        'username': client['username'],
+        'type': 'Wireless',
+        'health': {'overallScore': client['health']},
+        'connection': {
+            'apName': client['access_point'],
+            'ssid': client['ssid'],
+            'snr': client['snr'],
+            'dataRate': client['data_rate']
+        },
+        'traffic': {'txBytes': client['tx_bytes'], 'rxBytes': client['rx_bytes']},
+        'siteHierarchy': client['location']
+    }
+    if incomplete:
+        del summary['connection']
+    return summary
+
+
+class StubDnacHandler(BaseHTTPRequestHandler):
+    """
+    HTTP request handler for the stub Cisco DNA Center API
+    """
+
+    def log_message(self, format, *args):
+        # no access log, the stub is used for load tests
+        pass
+
+    def send_json(self, payload, status_code=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def find_client(self, mac_address):
+        index = self.server.client_index.get(str(mac_address).lower())
+        if index is None:
+            return None
+        return generate_client(index, self.server.seed)
+
+    def simulate_failure(self, path):
+        """
+        This function will delay the response, and send a simulated 500 or 429 failure, by the server settings
+        :param path: the request path
+        :return: True if a failure was sent
+        """
+        server = self.server
+        server.count_call(path)
+        if server.latency:
+            time.sleep(server.latency * (0.5 + random.random()))  # uniform, average {latency}
+        chance = random.random()
+        if chance < server.throttle_rate:
+            server.count_call('throttled')
+            body = json.dumps({'error': 'too many requests'}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Retry-After', str(server.retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return True
+        if chance < server.throttle_rate + server.error_rate:
+            server.count_call('errors')
+            self.send_json({'error': 'internal server error'}, 500)
+            return True
+        return False
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def post_message(self):
+        message = self.read_json()
+        if not isinstance(message, dict):
+            self.send_json({'message': 'body not valid'}, 400)
+            return
+        if message.get('roomId') not in self.server.room_titles:
+            self.send_json({'message': 'room not found'}, 404)
+            return
+        message_id = self.server.add_message(message)
+        self.send_json({'id': message_id, 'roomId': message['roomId'], 'created': time.strftime(
+            '%Y-%m-%dT%H:%M:%SZ', time.gmtime())})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == '/dna/system/api/v1/auth/token':
+            self.send_json({'Token': STUB_TOKEN})
+        elif path in MESSAGES_PATHS:
+            if not self.headers.get('authorization'):
+                self.send_json({'message': 'unauthorized'}, 401)
+            elif not self.simulate_failure(path):
+                self.post_message()
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_GET(self):
+        split_path = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(split_path.query).items()}
+        if split_path.path in ROOMS_PATHS:
+            if not self.headers.get('authorization'):
+                self.send_json({'message': 'unauthorized'}, 401)
+            elif not self.simulate_failure(split_path.path):
+                self.send_json({'items': [{'id': room_id, 'title': title, 'type': 'group'}
+                                          for room_id, title in self.server.room_titles.items()]})
+        elif self.headers.get('x-auth-token') != STUB_TOKEN:
+            self.send_json({'error': 'unauthorized'}, 401)
+        elif self.simulate_failure(split_path.path):
+            return
+        elif split_path.path == CLIENT_DETAIL_PATH:
+            client = self.find_client(query.get('macAddress'))
+            self.send_json(build_client_detail(client) if client is not None else {'detail': {}})
+        elif split_path.path in ENRICHMENT_PATHS:
+            entity_value = self.headers.get('entity_value', '')
+            index = self.server.username_index.get(entity_value, self.server.client_index.get(entity_value.lower()))
+            if index is None:
+                self.send_json([{'userDetails': {}, 'connectedDevice': []}])
+            else:
+                client = generate_client(index, self.server.seed)
+                self.send_json([{'userDetails': {'id': client['mac_address'], 'hostType': 'WIRELESS',
+                                                 'userId': client['username']}, 'connectedDevice': []}])
+        elif split_path.path == CLIENTS_PATH:
+            offset = int(query.get('offset', 1))
+            limit = int(query.get('limit', 100))
+            indexes = range(offset - 1, min(offset - 1 + limit, self.server.client_count))
+            clients = [build_client_summary(generate_client(index, self.server.seed),
+                                            self.server.is_incomplete(index)) for index in indexes]
+            self.send_json({'response': clients, 'page': {'offset': offset, 'limit': limit, 'count': len(clients)}})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    The stub Cisco DNA Center and Webex Teams server, with the synthetic clients, the Webex Teams rooms,
+    the received messages and the API call counters
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, client_count, seed=0, latency=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, rooms=None, incomplete_every=0):
+        super().__init__(server_address, StubDnacHandler)
+        self.client_count = client_count
+        self.seed = seed
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.incomplete_every = incomplete_every
+        self.client_index = {get_client_mac(index): index for index in range(client_count)}
+        self.username_index = {get_client_username(index): index for index in range(client_count)}
+        rooms = rooms if rooms is not None else [WHATSOP_ROOM]
+        self.room_titles = {'stub-room-%d' % index: title for index, title in enumerate(rooms)}
+        self.messages = []  # list of (monotonic time received, message)
+        self.call_counts = {}
+        self._lock = threading.Lock()
+
+    def is_incomplete(self, index):
+        # every {incomplete_every}th client is listed without the connection info
+        return self.incomplete_every > 0 and index % self.incomplete_every == self.incomplete_every - 1
+
+    def count_call(self, name):
+        with self._lock:
+            self.call_counts[name] = self.call_counts.get(name, 0) + 1
+
+    def add_message(self, message):
+        """
+        This function will save the Webex Teams {message} posted to a room
+        :param message: the message
+        :return: the message id
+        """
+        with self._lock:
+            self.messages.append((time.monotonic(), message))
+            return 'stub-message-%d' % len(self.messages)
+
+    def get_stats(self):
+        """
+        This function will return the stub statistics
+        :return: dict with the API calls for each path, the simulated failures 'throttled' and 'errors',
+        and the number of Webex Teams messages received
+        """
+        with self._lock:
+            stats = dict(self.call_counts)
+            stats['messages'] = len(self.messages)
+        return stats
+
+
+def create_stub_server(client_count, host='127.0.0.1', port=0, seed=0, latency=0.0, error_rate=0.0,
+                       throttle_rate=0.0, retry_after=1, rooms=None, incomplete_every=0):
+    """
+    This function will create the stub Cisco DNA Center and Webex Teams server,
+    with {client_count} synthetic wireless clients
+    :param client_count: number of synthetic clients
+    :param host: the listening address
+    :param port: the listening port, 0 to select a free port
+    :param seed: random seed for the client metrics
+    :param latency: average API response delay in seconds
+    :param error_rate: fraction of the API calls failed with 500
+    :param throttle_rate: fraction of the API calls failed with 429
+    :param retry_after: the Retry-After seconds returned with 429
+    :param rooms: the Webex Teams room names, default the notification room
+    :param incomplete_every: every {incomplete_every}th client is listed without the connection info, 0 for none
+    :return: the HTTP server
+    """
+    return StubServer((host, port), client_count, seed, latency, error_rate, throttle_rate, retry_after, rooms,
+                      incomplete_every)
+
+
+def start_stub_server(client_count, host='127.0.0.1', port=0, seed=0, **settings):
+    """
+    This function will start the stub Cisco DNA Center and Webex Teams server in a background thread
+    :param client_count: number of synthetic clients
+    :param host: the listening address
+    :param port: the listening port, 0 to select a free port
+    :param seed: random seed for the client metrics
+    :param settings: the latency, error_rate, throttle_rate, retry_after, rooms and incomplete_every,
+    see create_stub_server()
+    :return: the HTTP server, the server base url
+    """
+    server = create_stub_server(client_count, host, port, seed, **settings)
+    thread = threading.Thread(target=server.serve_forever, name='dnac-stub', daemon=True)
+    thread.start()
+    return server, 'http://%s:%s' % server.server_address[:2]
+
+
+def main():
+    """
+    This application will run the stub Cisco DNA Center server, until interrupted
+    """
+    parser = argparse.ArgumentParser(description='Stub Cisco DNA Center and Webex Teams with synthetic wireless '
+                                                 'clients')
+    parser.add_argument('--clients', type=int, default=1000, help='number of synthetic clients')
+    parser.add_argument('--host', default='127.0.0.1', help='listening address')
+    parser.add_argument('--port', type=int, default=8080, help='listening port')
+    parser.add_argument('--latency', type=float, default=0.0, help='average API response delay in msec')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the API calls failed with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='fraction of the API calls failed with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='the Retry-After seconds returned with 429')
+    parser.add_argument('--incomplete-every', type=int, default=0,
+                        help='list every Nth client without the connection info, 0 for none')
+    args = parser.parse_args()
+
+    server = create_stub_server(args.clients, args.host, args.port, latency=args.latency / 1000.0,
+                                error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                                retry_after=args.retry_after, incomplete_every=args.incomplete_every)
+    print('Stub Cisco DNA Center and Webex Teams with', args.clients, 'clients, listening on',
+          server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
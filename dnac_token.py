@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import logging
+import threading
+
+from config import DNAC_TOKEN_LIFETIME, DNAC_TOKEN_REFRESH_MARGIN
+
+
+def get_error_status_code(error):
+    """
+    This function will find the HTTP status code of the response that caused the exception {error}
+    It supports the requests HTTPError and the dnacentersdk ApiError
+    :param error: the exception raised by the API call
+    :return: the HTTP status code, None if the exception was not caused by a HTTP response
+    """
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        response = getattr(error, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+    return status_code
+
+
+def is_unauthorized(error):
+    """
+    This function will check if the exception {error} was caused by a HTTP 401 response
+    :param error: the exception raised by the API call
+    :return: True if the API call returned 401, False otherwise
+    """
+    return get_error_status_code(error) == 401
+
+
+class DnacTokenManager:
+    """
+    Cisco DNA Center token shared by all the callers.
+    The token is created by the {create_token} function on first use, cached, and refreshed
+    {refresh_margin} minutes before the {lifetime} minutes expiration.
+    Concurrent callers wait for a single refresh, instead of each one creating a new token.
+    The token may be a JWT token string, or any object holding the authentication, like a DNACenterAPI object.
+    """
+
+    def __init__(self, create_token, lifetime=DNAC_TOKEN_LIFETIME, refresh_margin=DNAC_TOKEN_REFRESH_MARGIN):
+        """
+        :param create_token: function called without arguments, returns a new token
+        :param lifetime: token lifetime in minutes
+        :param refresh_margin: number of minutes before the expiration when the token is refreshed
+        """
+        self._create_token = create_token
+        self._valid_time = (lifetime - refresh_margin) * 60
+        self._lock = threading.Lock()
+        self._token = None
+        self._refresh_time = 0.0
+        self.refresh_count = 0
+
+    def _is_valid(self):
+        return self._token is not None and time.monotonic() < self._refresh_time
+
+    def get_token(self):
+        """
+        This function will return the cached token, refreshing it if close to expiration
+        :return: Cisco DNA Center token
+        """
+        token = self._token
+        if self._is_valid():
+            return token
+        with self._lock:
+            # another caller may have refreshed the token while waiting for the lock
+            if not self._is_valid():
+                self._token = self._create_token()
+                self._refresh_time = time.monotonic() + self._valid_time
+                self.refresh_count += 1
+                logging.info('Cisco DNA Center token refreshed, count: %s', self.refresh_count)
+            return self._token
+
+    def invalidate(self, token):
+        """
+        This function will invalidate the {token}, if it is still the cached token
+        :param token: the token rejected by Cisco DNA Center
+        :return: none
+        """
+        with self._lock:
+            if self._token is token:
+                self._token = None
+
+    def call(self, function, *args):
+        """
+        This function will call {function} with the {args} and the token as the last argument.
+        If the call returns 401, the token is refreshed and the call is retried once.
+        :param function: the API call function
+        :param args: the API call arguments, without the token
+        :return: the API call response
+        """
+        token = self.get_token()
+        try:
+            return function(*args, token)
+        except Exception as error:
+            if not is_unauthorized(error):
+                raise
+            logging.warning('Cisco DNA Center token rejected, re-authenticate')
+            self.invalidate(token)
+            return function(*args, self.get_token())
@@ -27,19 +27,27 @@ import json
 import datetime
 import os
 import time
+import logging
 
-from flask import Flask, request, abort, send_from_directory
+from flask import Flask, request, abort, send_from_directory, jsonify, Response
 from flask_basicauth import BasicAuth
 
 
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
 
 import wireless_teams_bot
+from sample_store import SampleStore, sample_to_dict
+from ingest_queue import IngestQueue, write_reports, validate_report
+from status_index import StatusIndex
+from bot_dispatcher import BotDispatcher, QUEUE_FULL
+from report_codec import decode_request, decompress, get_accept_headers, UnsupportedEncoding
+from app_metrics import REGISTRY, QUEUE_DEPTH, CONTENT_TYPE, collect_stats
+from structured_logging import create_file_handler, start_async_logging
 
 from config import WEBHOOKD_BOT_AUTH, WEBEX_TEAMS_URL, WEBHOOKD_TEAMS_ROOM, WEBHOOKD_BOT_ID
 from config import WEBHOOK_USERNAME, WEBHOOK_PASSWORD, WEBHOOK_URL
 
-from config import WIRELESS_FOLDER
+from config import WIRELESS_FOLDER, INGEST_RETRY_AFTER, BOT_RETRY_AFTER
 
 os.environ['TZ'] = 'America/Los_Angeles'  # define the timezone for PST
 time.tzset()  # adjust the timezone, more info https://help.pythonanywhere.com/pages/SettingTheTimezone/
@@ -55,6 +63,17 @@ app.config['BASIC_AUTH_PASSWORD'] = WEBHOOK_PASSWORD
 
 basic_auth = BasicAuth(app)
 
+# wireless clients history, one append-only sample file for each client
+sample_store = SampleStore()
+sample_store.compact_all()  # apply the retention time at startup
+
+# the last status for each client, in memory for the bot lookups, warm-loaded from the last snapshot
+status_index = StatusIndex()
+status_index.start_snapshots()
+
+# the received wireless clients reports are saved in batches, by a background writer
+ingest_queue = IngestQueue(lambda reports: write_reports(reports, sample_store, status_index=status_index))
+
 
 @app.route('/')  # create a homepage for testing the flask framework
 @basic_auth.required
@@ -66,43 +85,168 @@ def index():
 @basic_auth.required
 def wireless_clients():
     if request.method == 'POST':
-        print('Wireless Clients Data Received')
-        webhook_json = request.json
-
-        # print the received notification
-        print('Payload: ')
-        print(webhook_json)
-
-        wireless_filename = webhook_json['username'] + '.json'
-        # save to a file, create new file if not existing, append to existing file
-        with open(WIRELESS_FOLDER + '/' + wireless_filename, 'w') as filehandle:
-            filehandle.write('%s\n' % json.dumps(webhook_json))
+        # the report is JSON or MessagePack, optionally compressed, the supported formats are returned if not
+        try:
+            webhook_json = decode_request(request.get_data(), request.content_type, request.content_encoding)
+        except UnsupportedEncoding as error:
+            return str(error), 415, get_accept_headers()
+        except ValueError as error:
+            return 'Wireless Clients Data Not Valid: %s' % error, 400
+
+        # the username is used as file name, the report is validated before queued
+        error = validate_report(webhook_json)
+        if error:
+            return 'Wireless Clients Data Not Valid: %s' % error, 400
+
+        # queue the report, saved by the background writer, ask the poller to retry later if the queue is full
+        if not ingest_queue.put(webhook_json):
+            return 'Wireless Clients Data Queue Full', 503, {'Retry-After': str(INGEST_RETRY_AFTER)}
 
         return 'Wireless Clients Data Received', 202
     else:
         return 'Method not supported', 405
 
 
+def parse_report_batch():
+    """
+    This function will parse the request body, optionally compressed: a JSON or MessagePack array of client reports,
+    or NDJSON with one report per line
+    :return: list of tuples with the report and the parsing error message, None if parsed
+    """
+    if request.mimetype == 'application/x-ndjson':
+        body = decompress(request.get_data(), request.content_encoding).decode('utf-8', 'replace')
+        reports = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                reports.append((json.loads(line), None))
+            except ValueError:
+                reports.append((None, 'JSON not valid'))
+        return reports
+    reports = decode_request(request.get_data(), request.content_type, request.content_encoding)
+    if not isinstance(reports, list):
+        raise ValueError('JSON array required')
+    return [(report, None) for report in reports]
+
+
+@app.route('/wireless_clients/batch', methods=['POST'])  # API endpoint to receive a batch of wireless client reports
+@basic_auth.required
+def wireless_clients_batch():
+    try:
+        reports = parse_report_batch()
+    except UnsupportedEncoding as error:
+        return str(error), 415, get_accept_headers()
+    except ValueError as error:
+        return 'Wireless Clients Data Not Valid: %s' % error, 400
+
+    # one result for each report, in the request order, the sender retries the reports with the 503 status
+    results = []
+    accepted_count = 0
+    full_count = 0
+    for report, error in reports:
+        error = error or validate_report(report)
+        if error:
+            results.append({'status': 400, 'error': error})
+        elif ingest_queue.put(report):
+            results.append({'status': 202})
+            accepted_count += 1
+        else:
+            results.append({'status': 503, 'error': 'Queue full'})
+            full_count += 1
+
+    response = {'accepted': accepted_count, 'results': results}
+    headers = {'Retry-After': str(INGEST_RETRY_AFTER)} if full_count else {}
+    if accepted_count == len(results):
+        return jsonify(response), 202
+    if full_count == len(results):
+        return jsonify(response), 503, headers
+    return jsonify(response), 207, headers
+
+
+@app.route('/wireless_clients/history', methods=['GET'])  # API endpoint to query the wireless client history
+@basic_auth.required
+def wireless_clients_history():
+    # select the client by username or MAC address, the time window start and end are in epoch msec
+    username = request.args.get('username')
+    mac_address = request.args.get('mac_address')
+    try:
+        start_time = int(request.args['start']) if 'start' in request.args else None
+        end_time = int(request.args['end']) if 'end' in request.args else None
+    except ValueError:
+        return 'Start and end time must be epoch msec integers', 400
+    try:
+        if username:
+            samples = sample_store.query(username, start_time, end_time)
+        elif mac_address:
+            samples = sample_store.query_by_mac(mac_address, start_time, end_time)
+        else:
+            return 'Username or MAC address required', 400
+    except ValueError as error:
+        return 'Wireless Clients History Query Not Valid: %s' % error, 400
+    return jsonify([sample_to_dict(sample) for sample in samples]), 200
+
+
+@app.route('/metrics', methods=['GET'])  # Prometheus metrics, the queues and the bot outbound API calls
+@basic_auth.required
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE), 200
+
+
 @app.route('/wireless_teams', methods=['POST'])  # Webhook for Webex Teams Bot for wireless client notification
 def wireless_client_webhook():
     if request.method == 'POST':
-        print('Wireless Teams Webhook Received')
         webhook_json = request.json
 
-        # print the received notification
-        print('Payload: ')
-        print(webhook_json)
-
-        # save to a file, create new file if not existing, append to existing file
-        with open(WIRELESS_FOLDER + '/wireless_teams_detailed.log', 'a') as filehandle:
-            filehandle.write('%s\n' % json.dumps(webhook_json))
-
-        # send the message to the bot function
-        status = wireless_teams_bot.message_handler(webhook_json)
+        # queue the message for the bot workers, acknowledge the webhook without waiting for the bot reply
+        status = bot_dispatcher.submit(webhook_json)
+        if status == QUEUE_FULL:
+            return 'Webhook Queue Full', 503, {'Retry-After': str(BOT_RETRY_AFTER)}
         return 'Webhook Received', 202
     else:
         return 'Method not supported', 405
 
 
+@app.route('/wireless_teams/stats', methods=['GET'])  # API endpoint for the bot queue depth and latency
+@basic_auth.required
+def wireless_teams_stats():
+    return jsonify(bot_dispatcher.get_stats()), 200
+
+
+def handle_bot_message(webhook_json):
+    """
+    This function will process one Webex Teams webhook event, in a bot worker thread
+    :param webhook_json: the Webex Teams webhook event
+    :return: none
+    """
+    # save to the webhook log file, written by the background log listener
+    webhook_logger.info(json.dumps(webhook_json))
+
+    # send the message to the bot function
+    wireless_teams_bot.message_handler(webhook_json, status_index)
+
+
+# the Webex Teams webhook events, one JSON object per line, appended to a rotated file by a background thread
+webhook_logger = logging.getLogger('wireless_teams.webhooks')
+webhook_logger.setLevel(logging.INFO)
+webhook_logger.propagate = False
+webhook_file_handler = create_file_handler(WIRELESS_FOLDER + '/wireless_teams_detailed.log')
+webhook_file_handler.setFormatter(logging.Formatter('%(message)s'))
+start_async_logging(webhook_logger, [webhook_file_handler])
+
+# the Webex Teams bot messages are handled by a pool of worker threads, de-duplicated by message id
+bot_dispatcher = BotDispatcher(handle_bot_message)
+
+# the receiver queues and the status index, collected on each /metrics request
+QUEUE_DEPTH.set_function(ingest_queue.depth, queue='ingest')
+QUEUE_DEPTH.set_function(lambda: bot_dispatcher.get_stats()['queue_depth'], queue='bot')
+REGISTRY.add_collector(lambda: collect_stats('wireless_ingest', {
+    'written': ingest_queue.written_count, 'batches': ingest_queue.batch_count,
+    'rejected': ingest_queue.rejected_count, 'status_index_clients': len(status_index)},
+    ('written', 'batches', 'rejected')))
+REGISTRY.add_collector(lambda: collect_stats('wireless_bot', bot_dispatcher.get_stats(),
+                                             ('received', 'duplicates', 'rejected', 'handled', 'errors')))
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import threading
+import requests
+
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import HTTP_POOL_MAXSIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from config import HTTP_RETRY_TOTAL, HTTP_RETRY_BACKOFF
+
+from app_metrics import HTTP_RETRIES, record_status_code
+
+# only the idempotent calls are retried, a POST may have been processed before the failure
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class CountingRetry(Retry):
+    """
+    urllib3 Retry, counting each retry in the HTTP_RETRIES metric, by host and reason
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # raises MaxRetryError when the retries are exhausted, the retry is counted only if it will happen
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        host = getattr(_pool, 'host', None) or 'unknown'
+        HTTP_RETRIES.inc(host=host, reason=str(response.status) if response is not None else 'error')
+        return retry
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def create_session(pool_maxsize=HTTP_POOL_MAXSIZE, retry_total=HTTP_RETRY_TOTAL, retry_backoff=HTTP_RETRY_BACKOFF):
+    """
+    This function will create a requests Session with a keep-alive connection pool,
+    retrying the idempotent calls with exponential backoff
+    :param pool_maxsize: maximum number of connections kept open to the host
+    :param retry_total: maximum number of retries
+    :param retry_backoff: backoff factor in seconds, the retries wait backoff * 2 ^ (retry number - 1)
+    :return: requests Session
+    """
+    retry = CountingRetry(total=retry_total, backoff_factor=retry_backoff, status_forcelist=RETRY_STATUS_CODES,
+                          allowed_methods=IDEMPOTENT_METHODS, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(url):
+    """
+    This function will return the requests Session for the upstream host of the {url}
+    One Session is created for each scheme and host, and shared by all the callers
+    :param url: the request url
+    :return: requests Session
+    """
+    split_url = urlsplit(url)
+    host_key = (split_url.scheme, split_url.netloc)
+    session = _sessions.get(host_key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host_key)
+            if session is None:
+                session = create_session()
+                _sessions[host_key] = session
+    return session
+
+
+def request(method, url, **kwargs):
+    """
+    This function will send the HTTP request using the pooled Session for the {url} host
+    The default connect and read timeouts are used if {timeout} is not provided
+    :param method: HTTP method
+    :param url: the request url
+    :param kwargs: the requests arguments
+    :return: requests Response
+    """
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    response = get_session(url).request(method, url, **kwargs)
+    # the status code of the API call, for the @instrumented functions returning the JSON
+    record_status_code(response.status_code)
+    return response
+
+
+def get(url, **kwargs):
+    """
+    This function will send a GET request using the pooled Session for the {url} host
+    :param url: the request url
+    :param kwargs: the requests arguments
+    :return: requests Response
+    """
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """
+    This function will send a POST request using the pooled Session for the {url} host
+    :param url: the request url
+    :param kwargs: the requests arguments
+    :return: requests Response
+    """
+    return request('POST', url, **kwargs)
+
+
+def close_sessions():
+    """
+    This function will close all the pooled Sessions and their connections
+    :return: none
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
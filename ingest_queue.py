@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import json
+import queue
+import logging
+import threading
+
+from config import WIRELESS_FOLDER
+from config import INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_FSYNC
+
+from sample_store import report_to_sample
+
+
+def validate_report(report):
+    """
+    This function will check the wireless client {report} format, before queued
+    :param report: the client report, with the username and details
+    :return: None if valid, or the error message
+    """
+    if not isinstance(report, dict):
+        return 'Report is not an object'
+    if not isinstance(report.get('username'), str) or not report['username']:
+        return 'Username required'
+    if os.path.basename(report['username']) != report['username'] or report['username'].startswith('.'):
+        return 'Username not valid'  # the username is used as file name
+    details = report.get('details')
+    if not isinstance(details, dict):
+        return 'Details required'
+    if not isinstance(details.get('timestamp'), str):
+        return 'Timestamp required'
+    return None
+
+
+def _fsync_folder(folder):
+    # sync the folder entries, the files created or replaced in the folder
+    folder_fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(folder_fd)
+    finally:
+        os.close(folder_fd)
+
+
+def write_reports(reports, sample_store, folder=WIRELESS_FOLDER, fsync=INGEST_FSYNC, status_index=None):
+    """
+    This function will save a batch of wireless client {reports}:
+     - the last report for each client, to the {folder}/<username>.json file, and to the {status_index}
+     - all the reports, appended to the client history in the {sample_store}, compacted when due
+    Each file is written once for the batch, and if {fsync}, each file written is synced to disk,
+    then the two folders are synced once for the batch
+    :param reports: list of client reports
+    :param sample_store: the client history SampleStore
+    :param folder: the folder for the last report files
+    :param fsync: sync the files to disk
+    :param status_index: optional StatusIndex, the last status used by the bot
+    :return: none
+    """
+    last_reports = {}
+    client_samples = {}
+    for report in reports:
+        # one report not valid is skipped, the other reports of the batch are saved
+        error = validate_report(report)
+        if error:
+            logging.warning('Wireless client report not valid: %s, report: %s', error, report)
+            continue
+        try:
+            sample = report_to_sample(report)
+        except (KeyError, TypeError, ValueError):
+            logging.warning('Wireless client report not valid: %s', report)
+            continue
+        last_reports[report['username']] = report
+        client_samples.setdefault(report['username'], []).append(sample)
+
+    for username, report in list(last_reports.items()):
+        try:
+            # save the last report to a file, replace the existing file, used by the bot for the client status
+            with open(os.path.join(folder, username + '.json'), 'w') as filehandle:
+                filehandle.write('%s\n' % json.dumps(report))
+                if fsync:
+                    filehandle.flush()
+                    os.fsync(filehandle.fileno())
+            sample_store.append(username, client_samples[username], report['details'].get('mac_address'),
+                                fsync=fsync)
+        except (OSError, ValueError):
+            logging.exception('Wireless client report not saved, username: %s', username)
+            del last_reports[username]
+
+    if fsync and last_reports:
+        # the new files are durable once their folder entries are synced, one folder sync for the batch
+        try:
+            _fsync_folder(folder)
+            _fsync_folder(sample_store.folder)
+        except OSError:
+            logging.exception('Wireless client folders not synced: %s, %s', folder, sample_store.folder)
+
+    if status_index is not None:
+        status_index.update(last_reports.values())
+
+    # the retention time, applied by the writer thread while the receiver is running
+    sample_store.compact_if_due()
+
+
+class IngestQueue:
+    """
+    Bounded in-memory queue of wireless client reports, saved by a background writer thread.
+    The writer takes all the queued reports, up to {batch_size}, and saves them as one batch.
+    When the queue is full, put() returns False, and the caller should ask the sender to retry later.
+    """
+
+    def __init__(self, write_batch, maxsize=INGEST_QUEUE_SIZE, batch_size=INGEST_BATCH_SIZE):
+        """
+        :param write_batch: function called with a list of reports, by the writer thread
+        :param maxsize: maximum number of queued reports
+        :param batch_size: maximum number of reports in each batch
+        """
+        self._write_batch = write_batch
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.written_count = 0
+        self.batch_count = 0
+        self.rejected_count = 0
+        self._thread = threading.Thread(target=self._writer_loop, name='ingest-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, report):
+        """
+        This function will queue the {report}, without waiting
+        :param report: the client report
+        :return: True if queued, False if the queue is full
+        """
+        try:
+            self._queue.put_nowait(report)
+            return True
+        except queue.Full:
+            self.rejected_count += 1
+            return False
+
+    def depth(self):
+        """
+        This function will return the number of queued reports
+        :return: queue depth
+        """
+        return self._queue.qsize()
+
+    def _writer_loop(self):
+        while True:
+            report = self._queue.get()
+            if report is None:
+                self._queue.task_done()
+                return
+            batch = [report]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    report = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if report is None:
+                    stop = True
+                    break
+                batch.append(report)
+            try:
+                self._write_batch(batch)
+                self.written_count += len(batch)
+                self.batch_count += 1
+            except Exception:
+                logging.exception('Failed to save %s wireless client reports', len(batch))
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def join(self):
+        """
+        This function will wait until all the queued reports are saved
+        :return: none
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        This function will save the queued reports and stop the writer thread
+        :return: none
+        """
+        self._queue.put(None)
+        self._thread.join()
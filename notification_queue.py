@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import logging
+import threading
+
+from collections import OrderedDict, deque
+
+from config import NOTIFY_COALESCE_WINDOW, NOTIFY_GROUP_BY, NOTIFY_DIGEST_MIN, NOTIFY_MAX_RETRIES
+from config import NOTIFY_RETRY_BACKOFF, WEBEX_RATE_LIMITS, RATE_LIMIT_DB
+
+from rate_limiter import RateLimiter, parse_retry_after
+from adaptive_cards import render_digest_card
+
+WEBEX_MESSAGES = 'webex-messages'  # the rate limited Webex Teams endpoint
+
+# the Webex Teams responses retried, after the Retry-After time for 429, with backoff for the others
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class NotificationQueue:
+    """
+    Outbound queue of the Webex Teams notifications, sent by a background thread.
+    The alerts received within {window} seconds of the first one are coalesced: the clients with the same
+    {group_by} metric (access point, SSID or location) are sent in one digest card when there are at least
+    {digest_min} of them, the other clients in their own card.
+    The cards are posted within the Webex Teams rate limit. A 429 response blocks the posts for the Retry-After
+    time, the other failed posts are retried with exponential backoff, up to {max_retries} times.
+    The delivery latency, from the alert to the posted card, is recorded for each client.
+    """
+
+    def __init__(self, send_card, build_card, build_digest=render_digest_card, window=NOTIFY_COALESCE_WINDOW,
+                 group_by=NOTIFY_GROUP_BY, digest_min=NOTIFY_DIGEST_MIN, max_retries=NOTIFY_MAX_RETRIES,
+                 retry_backoff=NOTIFY_RETRY_BACKOFF, rate_limiter=None):
+        """
+        :param send_card: function called with the card message, returns the Webex Teams response
+        :param build_card: function called with the client state, returns the client card message JSON
+        :param build_digest: function called with (group_by, group value, client states), returns the digest card JSON
+        :param window: time in seconds the alerts are coalesced
+        :param group_by: the metrics field the digest cards are grouped by: access_point, ssid or location
+        :param digest_min: minimum number of clients in a group for a digest card
+        :param max_retries: maximum number of retries for each card
+        :param retry_backoff: time in seconds before the first retry, doubled for each retry
+        :param rate_limiter: optional RateLimiter, default with the WEBEX_RATE_LIMITS
+        """
+        self._send_card = send_card
+        self._build_card = build_card
+        self._build_digest = build_digest
+        self.window = window
+        self.group_by = group_by
+        self.digest_min = digest_min
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.rate_limiter = rate_limiter or RateLimiter(WEBEX_RATE_LIMITS, RATE_LIMIT_DB)
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()  # username -> (alert time, client state copy)
+        self._window_start = None
+        self._closed = False
+        self._latencies = deque(maxlen=1000)
+        self._stats = {'alerts': 0, 'cards': 0, 'digests': 0, 'retries': 0, 'failed': 0}
+        self._thread = threading.Thread(target=self._sender_loop, name='notification-sender', daemon=True)
+        self._thread.start()
+
+    def submit(self, client_state):
+        """
+        This function will queue the notification for the client {client_state}, without waiting
+        A client already queued in this window is notified once, with the last metrics
+        :param client_state: the client state, with the last collected metrics
+        :return: none
+        """
+        alert = dict(client_state, metrics=dict(client_state['metrics']))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Notification queue closed')
+            self._stats['alerts'] += 1
+            first_time = self._pending.pop(client_state['username'], (time.monotonic(), None))[0]
+            self._pending[client_state['username']] = (first_time, alert)
+            if self._window_start is None:
+                self._window_start = time.monotonic()
+                self._condition.notify()
+
+    def _sender_loop(self):
+        while True:
+            with self._condition:
+                while self._window_start is None and not self._closed:
+                    self._condition.wait()
+                if self._window_start is None:
+                    return
+                # coalesce the alerts until the end of the window, or until closed
+                while not self._closed:
+                    remaining = self._window_start + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending = list(self._pending.values())
+                self._pending = OrderedDict()
+                self._window_start = None
+            try:
+                self._send_window(pending)
+            except Exception:
+                logging.exception('Webex Teams notifications failed')
+
+    def _send_window(self, pending):
+        groups = OrderedDict()
+        for alert_time, client_state in pending:
+            group_value = client_state['metrics'].get(self.group_by)
+            groups.setdefault(group_value, []).append((alert_time, client_state))
+        for group_value, alerts in groups.items():
+            if len(alerts) >= self.digest_min and group_value is not None:
+                card = self._build_digest(self.group_by, group_value, [client_state for _, client_state in alerts])
+                if self._post(card):
+                    self._record_delivery(alerts, digest=True)
+            else:
+                for alert in alerts:
+                    if self._post(self._build_card(alert[1])):
+                        self._record_delivery([alert], digest=False)
+        # the counters and the latency are also exported by the /metrics endpoint
+        stats = self.get_stats()
+        logging.debug('Webex Teams notifications, cards: %s, digests: %s, alerts: %s, failed: %s, '
+                      'latency p50: %.3f, p99: %.3f seconds', stats['cards'], stats['digests'], stats['alerts'],
+                      stats['failed'], stats.get('latency_p50', 0), stats.get('latency_p99', 0))
+
+    def _post(self, card):
+        """
+        This function will post the {card}, within the rate limit, with the retries
+        :param card: card message
+        :return: True if posted
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(WEBEX_MESSAGES)
+            try:
+                response = self._send_card(card)
+                status_code = response.status_code
+            except Exception as error:
+                logging.warning('Webex Teams notification post failed: %s', error)
+                response, status_code = None, None
+            if status_code is not None and status_code < 300:
+                return True
+            if status_code is not None and status_code not in RETRY_STATUS_CODES:
+                logging.error('Webex Teams notification not posted, status: %s', status_code)
+                break
+            if attempt == self.max_retries:
+                break
+            with self._condition:
+                self._stats['retries'] += 1
+            if status_code == 429:
+                self.rate_limiter.block(WEBEX_MESSAGES, parse_retry_after(response.headers.get('Retry-After')))
+            else:
+                time.sleep(self.retry_backoff * 2 ** attempt)
+        with self._condition:
+            self._stats['failed'] += 1
+        return False
+
+    def _record_delivery(self, alerts, digest):
+        now = time.monotonic()
+        with self._condition:
+            self._stats['digests' if digest else 'cards'] += 1
+            for alert_time, client_state in alerts:
+                self._latencies.append(now - alert_time)
+        # one line for each posted card, a digest card lists its clients on the same line
+        print('Webex Teams notification message posted for the client: ',
+              ', '.join(client_state['username'] for _, client_state in alerts))
+
+    def get_stats(self):
+        """
+        This function will return the notification statistics
+        :return: dict with the counters, the queued alerts and the delivery latency in seconds, from the alert
+        to the posted card, over the last 1000 alerts
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['queued'] = len(self._pending)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p99'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+    def close(self):
+        """
+        This function will send the queued notifications now, and stop the sender thread
+        :return: none
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import math
+import time
+import heapq
+import itertools
+import threading
+
+from config import DNAC_RATE_LIMITS
+from config import SCHEDULE_FAST_FACTOR, SCHEDULE_SLOW_FACTOR, SCHEDULE_STABLE_POLLS, SCHEDULE_BUDGET_SHARE
+
+
+def get_schedule_budget(share=SCHEDULE_BUDGET_SHARE):
+    """
+    This function will return the client detail calls/minute the scheduler can plan,
+    a {share} of the Cisco DNA Center client-detail rate limit, the rest is left for the other callers
+    :param share: the share of the rate limit
+    :return: calls/minute
+    """
+    return DNAC_RATE_LIMITS['client-detail'] * share
+
+
+class PollScheduler:
+    """
+    Per-client poll schedule, a heap of the clients keyed by their next due time.
+    The clients are polled on absolute deadlines: the next deadline is the previous deadline plus the client
+    interval, not the poll end time, so the cadence does not drift by the poll duration.
+    The first deadlines are spread across the interval, instead of polling all the clients at once.
+    The clients with the alert counter above zero are polled {fast_factor} times the interval, the clients
+    with {stable_polls} consecutive good polls {slow_factor} times the interval.
+    The planned calls/minute stay within the {budget}: the base interval is stretched if the clients can not be
+    polled every {interval} seconds, and a client is polled faster only if the budget allows it.
+    """
+
+    def __init__(self, client_states, interval, budget=None, fast_factor=SCHEDULE_FAST_FACTOR,
+                 slow_factor=SCHEDULE_SLOW_FACTOR, stable_polls=SCHEDULE_STABLE_POLLS, clock=time.monotonic):
+        """
+        :param client_states: list of client states
+        :param interval: the polling interval in seconds
+        :param budget: client detail calls/minute for all the clients, default get_schedule_budget()
+        :param fast_factor: the interval multiplier for the clients with the alert counter above zero
+        :param slow_factor: the interval multiplier for the stable clients
+        :param stable_polls: number of consecutive good polls for a stable client
+        :param clock: function returning the current time in seconds
+        """
+        self.budget = budget if budget is not None else get_schedule_budget()
+        self.fast_factor = fast_factor
+        self.slow_factor = slow_factor
+        self.stable_polls = stable_polls
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._heap = []  # (due time, sequence, username)
+        self._sequence = itertools.count()
+        self._client_states = {}
+        self._intervals = {}  # username -> the client interval in seconds
+        self._good_polls = {}  # username -> number of consecutive good polls
+        self.base_interval = float(interval)
+        self.planned_rate = 0.0  # calls/minute
+        self.add_clients(client_states)
+
+    def add_clients(self, client_states):
+        """
+        This function will schedule the {client_states}, the first deadlines spread across the base interval
+        The base interval is stretched, for all the clients, if needed to stay within the budget
+        :param client_states: list of client states
+        :return: none
+        """
+        with self._condition:
+            new_states = [client_state for client_state in client_states
+                          if client_state['username'] not in self._client_states]
+            if not new_states:
+                return
+            client_count = len(self._client_states) + len(new_states)
+            base_interval = max(self.base_interval, client_count * 60.0 / self.budget)
+            for username in self._intervals:
+                # stretched as the base interval, from the next poll, the deadlines already scheduled are kept
+                self._intervals[username] *= base_interval / self.base_interval
+            self.base_interval = base_interval
+            now = self._clock()
+            step = self.base_interval / len(new_states)
+            for index, client_state in enumerate(new_states):
+                username = client_state['username']
+                self._client_states[username] = client_state
+                self._intervals[username] = self.base_interval
+                self._good_polls[username] = 0
+                heapq.heappush(self._heap, (now + index * step, next(self._sequence), username))
+            self._update_rate()
+            self._condition.notify()
+
+    def _update_rate(self):
+        self.planned_rate = sum(60.0 / interval for interval in self._intervals.values())
+
+    def _select_interval(self, username, breaching):
+        if breaching:
+            self._good_polls[username] = 0
+            interval = self.base_interval * self.fast_factor
+        else:
+            self._good_polls[username] += 1
+            if self._good_polls[username] >= self.stable_polls:
+                interval = self.base_interval * self.slow_factor
+            else:
+                interval = self.base_interval
+        current = self._intervals[username]
+        # a faster interval only if the planned calls/minute stay within the budget
+        for candidate in (interval, self.base_interval, current):
+            if candidate >= current or self.planned_rate - 60.0 / current + 60.0 / candidate <= self.budget:
+                return candidate
+        return current
+
+    def reschedule(self, client_state, due_time, breaching):
+        """
+        This function will schedule the next poll of the client {client_state}, polled for the {due_time}
+        The next deadline is {due_time} plus the client interval, the deadlines already missed are skipped
+        :param client_state: client state
+        :param due_time: the deadline of the poll
+        :param breaching: True if the client alert counter is above zero, polled faster
+        :return: the next deadline
+        """
+        username = client_state['username']
+        with self._condition:
+            interval = self._select_interval(username, breaching)
+            self.planned_rate += 60.0 / interval - 60.0 / self._intervals[username]
+            self._intervals[username] = interval
+            next_due = due_time + interval
+            now = self._clock()
+            if next_due <= now:
+                # late, for example waiting for the rate limit, keep the deadlines aligned and skip the missed ones
+                next_due += math.ceil((now - next_due) / interval) * interval
+            heapq.heappush(self._heap, (next_due, next(self._sequence), username))
+            self._condition.notify()
+        return next_due
+
+    def wait_due(self, timeout=None):
+        """
+        This function will wait until at least one client is due, or the {timeout}
+        :param timeout: maximum time to wait in seconds, wait until a client is due if None
+        :return: list of (client state, due time) for the clients due, removed from the schedule until rescheduled
+        """
+        end_time = None if timeout is None else self._clock() + timeout
+        with self._condition:
+            while True:
+                now = self._clock()
+                if self._heap and self._heap[0][0] <= now:
+                    due_clients = []
+                    while self._heap and self._heap[0][0] <= now:
+                        due_time, _, username = heapq.heappop(self._heap)
+                        due_clients.append((self._client_states[username], due_time))
+                    return due_clients
+                wait_time = self._heap[0][0] - now if self._heap else None
+                if end_time is not None:
+                    if now >= end_time:
+                        return []
+                    wait_time = end_time - now if wait_time is None else min(wait_time, end_time - now)
+                self._condition.wait(wait_time)
+
+    def get_interval(self, username):
+        """
+        This function will return the current interval of the client {username}
+        :param username: client username
+        :return: interval in seconds
+        """
+        return self._intervals[username]
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
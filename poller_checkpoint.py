@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import json
+import zlib
+import struct
+import logging
+import threading
+
+from config import POLLER_CHECKPOINT_FILE
+
+from client_sample import ClientSample, decode_json
+
+# each checkpoint frame: payload length, payload CRC32, sequence number, and the payload
+FRAME_HEADER = struct.Struct('<IIQ')
+
+# the payload: the length of the strings and the health scores tables, the JSON arrays of the distinct strings
+# and the distinct health scores, and one fixed-size record for each client: the username, MAC address,
+# AP, location and SSID string indexes, -1 for None, the alert counter, the health scores index,
+# NO_METRICS if no sample, and the total data, SNR and data rate, NaN for None
+PAYLOAD_HEADER = struct.Struct('<II')
+CLIENT_RECORD = struct.Struct('<iiiiiiiddd')
+NO_METRICS = -2
+NAN = float('nan')
+
+
+def _read_frames(filehandle):
+    # yields the end offset, sequence number and payload of each valid frame, stops at the first frame not valid,
+    # the last frame is partial if the write was interrupted
+    offset = 0
+    while True:
+        header = filehandle.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        length, crc, sequence = FRAME_HEADER.unpack(header)
+        payload = filehandle.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        offset += FRAME_HEADER.size + length
+        yield offset, sequence, payload
+
+
+def _float(value):
+    return NAN if value is None else value
+
+
+def pack_states(sequence, states):
+    """
+    This function will pack the client {states} to a checkpoint frame
+    :param sequence: the frame sequence number
+    :param states: dict with the username -> (mac_address, alert_count, metrics)
+    :return: the frame bytes
+    """
+    strings = {}
+    health_scores = {}
+    records = []
+
+    def index(value):
+        # the AP, location, SSID and health scores repeat across the clients, stored once
+        return strings.setdefault(value, len(strings)) if value is not None else -1
+
+    for username, (mac_address, alert_count, metrics) in states.items():
+        if metrics is None:
+            records.append(CLIENT_RECORD.pack(index(username), index(mac_address), alert_count, -1, -1, -1,
+                                              NO_METRICS, NAN, NAN, NAN))
+        else:
+            records.append(CLIENT_RECORD.pack(index(username), index(mac_address), alert_count,
+                                              index(metrics.access_point), index(metrics.location),
+                                              index(metrics.ssid),
+                                              health_scores.setdefault(metrics.health_scores, len(health_scores)),
+                                              _float(metrics.total_data), _float(metrics.snr),
+                                              _float(metrics.data_rate)))
+    strings_json = json.dumps(list(strings), separators=(',', ':')).encode('utf-8')
+    health_scores_json = json.dumps(list(health_scores), separators=(',', ':')).encode('utf-8')
+    payload = b''.join([PAYLOAD_HEADER.pack(len(strings_json), len(health_scores_json)), strings_json,
+                        health_scores_json] + records)
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload), sequence) + payload
+
+
+def unpack_states(payload):
+    """
+    This function will unpack the client states from a checkpoint frame {payload}
+    :param payload: the frame payload
+    :return: dict with the username -> (mac_address, alert_count, metrics)
+    """
+    strings_length, health_scores_length = PAYLOAD_HEADER.unpack_from(payload)
+    offset = PAYLOAD_HEADER.size
+    strings = decode_json(payload[offset:offset + strings_length]) + [None]  # index -1 is None
+    offset += strings_length
+    health_scores = [tuple(tuple(score) for score in scores)
+                     for scores in decode_json(payload[offset:offset + health_scores_length])]
+    offset += health_scores_length
+    # the client health is the overall score, same as parsed from the client detail and the clients list
+    client_health = [dict(scores).get('OVERALL') for scores in health_scores]
+    states = {}
+    for username, mac_address, alert_count, access_point, location, ssid, scores, total_data, snr, data_rate in \
+            CLIENT_RECORD.iter_unpack(memoryview(payload)[offset:]):
+        metrics = None
+        if scores != NO_METRICS:
+            metrics = ClientSample(client_health[scores], None if total_data != total_data else total_data,
+                                   strings[access_point], None if snr != snr else snr,
+                                   None if data_rate != data_rate else data_rate, strings[location], strings[ssid],
+                                   health_scores[scores])
+        states[strings[username]] = (strings[mac_address], alert_count, metrics)
+    return states
+
+
+class PollerCheckpoint:
+    """
+    Crash-safe checkpoint of the poller state for each client: the MAC address, the alert counter and the last
+    sample, so a restarted poller resumes the alert counters where they stopped.
+    The first checkpoint is a snapshot of all the clients, replaced atomically. The next checkpoints append only
+    the changed clients to the log file, synced to disk. When the log is larger than the snapshot, the snapshot
+    is written again and the log truncated. Each frame has a CRC and a sequence number: at load, a partial frame
+    is discarded, and the log frames already included in the snapshot are skipped.
+    The pollers record() a copy of each client state when the client poll is complete, save() writes the
+    recorded copies, so the alert counter and the sample are consistent while the other clients are polled.
+    """
+
+    def __init__(self, path=POLLER_CHECKPOINT_FILE):
+        """
+        :param path: the snapshot file, the log file is {path}.log
+        """
+        self.path = path
+        self.log_path = path + '.log'
+        self._sequence = 0
+        self._snapshot_size = 0
+        self._log_size = 0
+        self._lock = threading.Lock()
+        self._states = {}  # username -> (mac_address, alert_count, metrics) as last recorded
+        self._written = {}  # username -> (mac_address, alert_count, metrics) as last checkpointed
+
+    def load(self):
+        """
+        This function will load the checkpoint, the snapshot and the log frames written after the snapshot.
+        A partial frame at the end of the log, from an interrupted write, is truncated.
+        :return: dict with the username -> (mac_address, alert_count, metrics)
+        """
+        entries = {}
+        snapshot_sequence = -1
+        try:
+            with open(self.path, 'rb') as filehandle:
+                for offset, sequence, payload in _read_frames(filehandle):
+                    entries = unpack_states(payload)
+                    snapshot_sequence = self._sequence = sequence
+                    self._snapshot_size = offset
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self.log_path, 'r+b') as filehandle:
+                valid_size = 0
+                for offset, sequence, payload in _read_frames(filehandle):
+                    valid_size = offset
+                    if sequence > snapshot_sequence:
+                        entries.update(unpack_states(payload))
+                        self._sequence = max(self._sequence, sequence)
+                if valid_size < os.fstat(filehandle.fileno()).st_size:
+                    logging.warning('Poller checkpoint log not valid after %s bytes, truncated', valid_size)
+                    filehandle.truncate(valid_size)
+                self._log_size = valid_size
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def restore(self, client_states):
+        """
+        This function will load the checkpoint and restore the alert counter and the last sample of the
+        {client_states}, updated in place. The current MAC address, from the identity cache or the configuration,
+        is kept: the checkpoint MAC address is used only if the client has none. If the MAC addresses differ,
+        the checkpoint is for another device, the alert counter and the last sample are not restored.
+        The clients not in the checkpoint are not changed.
+        :param client_states: the client states
+        :return: number of clients restored
+        """
+        entries = self.load()
+        restored = 0
+        for client_state in client_states:
+            entry = entries.get(client_state['username'])
+            if entry is None:
+                continue
+            mac_address, alert_count, metrics = entry
+            if not client_state['mac_address']:
+                client_state['mac_address'] = mac_address
+            elif mac_address and mac_address.lower() != client_state['mac_address'].lower():
+                logging.info('Client MAC address changed since the poller checkpoint, username: %s',
+                             client_state['username'])
+                continue
+            client_state['alert_count'] = alert_count
+            client_state['metrics'] = metrics
+            self._written[client_state['username']] = (client_state['mac_address'], alert_count, metrics)
+            restored += 1
+        for client_state in client_states:
+            self.record(client_state)
+        return restored
+
+    def record(self, client_state):
+        """
+        This function will record a copy of the {client_state}, saved by the next checkpoint.
+        Called by the poller thread when the client poll is complete, the client state is not being updated.
+        :param client_state: the client state
+        :return: none
+        """
+        state = (client_state['mac_address'], client_state['alert_count'], client_state['metrics'])
+        with self._lock:
+            self._states[client_state['username']] = state
+
+    def save(self, client_states=None):
+        """
+        This function will checkpoint the recorded client states changed since the last checkpoint,
+        or all the recorded client states when the snapshot is written
+        :param client_states: optional client states recorded first, when no client poll is in progress
+        :return: number of clients written
+        """
+        for client_state in client_states or ():
+            self.record(client_state)
+        with self._lock:
+            states = dict(self._states)
+        dirty = {}
+        for username, state in states.items():
+            written = self._written.get(username)
+            # the metrics are replaced by each sample, compared by identity
+            if written is None or written[:2] != state[:2] or written[2] is not state[2]:
+                dirty[username] = state
+        if not dirty:
+            return 0
+        self._sequence += 1
+        if not self._snapshot_size or self._log_size >= self._snapshot_size:
+            # the snapshot includes only the clients recorded by this poller
+            self._write_snapshot(states)
+            self._written = states
+            return len(states)
+        frame = pack_states(self._sequence, dirty)
+        with open(self.log_path, 'ab') as filehandle:
+            filehandle.write(frame)
+            filehandle.flush()
+            os.fsync(filehandle.fileno())
+        self._log_size += len(frame)
+        self._written.update(dirty)
+        return len(dirty)
+
+    def _write_snapshot(self, states):
+        frame = pack_states(self._sequence, states)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as filehandle:
+            filehandle.write(frame)
+            filehandle.flush()
+            os.fsync(filehandle.fileno())
+        os.replace(temp_path, self.path)
+        # the log frames are included in the snapshot, skipped at load if the truncate is interrupted
+        with open(self.log_path, 'wb'):
+            pass
+        self._snapshot_size = len(frame)
+        self._log_size = 0
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import logging
+import sqlite3
+import functools
+import threading
+
+from email.utils import parsedate_to_datetime
+
+from config import DNAC_RATE_LIMITS, RATE_LIMIT_DB, RATE_LIMIT_MAX_RETRIES
+
+from dnac_token import get_error_status_code
+
+
+def parse_retry_after(retry_after, default=60.0):
+    """
+    This function will parse the value of a Retry-After header, in seconds or as a HTTP date
+    :param retry_after: the Retry-After header value, may be None
+    :param default: number of seconds to use if the header is missing or not valid
+    :return: number of seconds to wait
+    """
+    if retry_after is None:
+        return default
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+def get_error_retry_after(error, default=60.0):
+    """
+    This function will find the Retry-After of the response that caused the exception {error}
+    :param error: the exception raised by the API call
+    :param default: number of seconds to use if the header is missing or not valid
+    :return: number of seconds to wait
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    return parse_retry_after(headers.get('Retry-After'), default)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter, with one bucket for each API endpoint.
+    The buckets are stored in a SQLite database, shared by all the processes on the same host.
+    Each bucket holds up to {calls per minute} tokens, refilled continuously.
+    A 429 response blocks the bucket for the Retry-After time.
+    The time each call waited is recorded, see get_wait_stats().
+    """
+
+    def __init__(self, rate_limits=DNAC_RATE_LIMITS, db_path=RATE_LIMIT_DB):
+        """
+        :param rate_limits: dict with the endpoint -> API calls/minute, the endpoints not included are not limited
+        :param db_path: the SQLite database file
+        """
+        self.rate_limits = dict(rate_limits)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS buckets (endpoint TEXT PRIMARY KEY, tokens REAL, '
+                               'updated REAL, blocked_until REAL)')
+
+    def _connect(self):
+        # one connection for each thread, sqlite3 connections can not be shared across threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _take_token(self, endpoint, calls_per_minute):
+        """
+        This function will take a token from the {endpoint} bucket, if available
+        :return: 0 if a token was taken, the number of seconds to wait for the next token otherwise
+        """
+        connection = self._connect()
+        now = time.time()
+        refill_rate = calls_per_minute / 60.0
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated, blocked_until FROM buckets WHERE endpoint = ?',
+                                     (endpoint,)).fetchone()
+            if row is None:
+                tokens, blocked_until = float(calls_per_minute), 0.0
+            else:
+                tokens = min(float(calls_per_minute), row[0] + max(0.0, now - row[1]) * refill_rate)
+                blocked_until = row[2]
+            if now < blocked_until:
+                # the bucket is not refilled while blocked after a 429 response
+                connection.execute('COMMIT')
+                return blocked_until - now
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait_time = 0.0
+            else:
+                wait_time = (1.0 - tokens) / refill_rate
+            connection.execute('INSERT OR REPLACE INTO buckets (endpoint, tokens, updated, blocked_until) '
+                               'VALUES (?, ?, ?, ?)', (endpoint, tokens, now, blocked_until))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait_time
+
+    def _record_wait(self, endpoint, wait_time):
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, {'calls': 0, 'waits': 0, 'wait_seconds': 0.0,
+                                                      'max_wait_seconds': 0.0, 'blocked': 0, 'retries': 0})
+            stats['calls'] += 1
+            if wait_time is not None:
+                stats['waits'] += 1
+                stats['wait_seconds'] += wait_time
+                stats['max_wait_seconds'] = max(stats['max_wait_seconds'], wait_time)
+
+    def acquire(self, endpoint):
+        """
+        This function will wait until the rate limit for the {endpoint} allows a new API call
+        :param endpoint: the API endpoint
+        :return: number of seconds waited
+        """
+        calls_per_minute = self.rate_limits.get(endpoint)
+        if calls_per_minute is None:
+            return 0.0
+        start_time = time.monotonic()
+        wait_time = self._take_token(endpoint, calls_per_minute)
+        if wait_time == 0:
+            self._record_wait(endpoint, None)
+            return 0.0
+        while wait_time > 0:
+            time.sleep(wait_time)
+            wait_time = self._take_token(endpoint, calls_per_minute)
+        waited = time.monotonic() - start_time
+        self._record_wait(endpoint, waited)
+        logging.debug('Rate limit wait for %s: %.3f seconds', endpoint, waited)
+        return waited
+
+    def block(self, endpoint, retry_after):
+        """
+        This function will block all the API calls to the {endpoint}, from all the processes,
+        for {retry_after} seconds, after a 429 response
+        :param endpoint: the API endpoint
+        :param retry_after: number of seconds to wait
+        :return: none
+        """
+        connection = self._connect()
+        blocked_until = time.time() + retry_after
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # a single token is left when the block ends, to probe the endpoint before any burst
+            connection.execute('INSERT OR IGNORE INTO buckets (endpoint, tokens, updated, blocked_until) '
+                               'VALUES (?, 0, ?, 0)', (endpoint, time.time()))
+            connection.execute('UPDATE buckets SET tokens = 1, updated = ?, blocked_until = MAX(blocked_until, ?) '
+                               'WHERE endpoint = ?', (blocked_until, blocked_until, endpoint))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        with self._stats_lock:
+            if endpoint in self._stats:
+                self._stats[endpoint]['blocked'] += 1
+        logging.warning('Rate limited by %s, retry after %.1f seconds', endpoint, retry_after)
+
+    def call(self, endpoint, function, *args, **kwargs):
+        """
+        This function will call {function} within the rate limit for the {endpoint}
+        If the call returns 429, the endpoint is blocked for the Retry-After time and the call is retried,
+        up to RATE_LIMIT_MAX_RETRIES times
+        :param endpoint: the API endpoint
+        :param function: the API call function
+        :return: the API call response
+        """
+        retries = 0
+        while True:
+            self.acquire(endpoint)
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if get_error_status_code(error) != 429 or retries >= RATE_LIMIT_MAX_RETRIES:
+                    raise
+                retries += 1
+                with self._stats_lock:
+                    if endpoint in self._stats:
+                        self._stats[endpoint]['retries'] += 1
+                self.block(endpoint, get_error_retry_after(error))
+
+    def get_wait_stats(self):
+        """
+        This function will return the rate limit wait statistics, for each endpoint
+        :return: dict with the endpoint -> calls, waits, wait_seconds, max_wait_seconds, blocked, retries
+        """
+        with self._stats_lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    This function will return the Cisco DNA Center rate limiter shared by all the API calls in this process
+    :return: RateLimiter
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def set_rate_limiter(rate_limiter):
+    """
+    This function will replace the Cisco DNA Center rate limiter shared by all the API calls in this process,
+    used by the load tests against the stub Cisco DNA Center
+    :param rate_limiter: RateLimiter
+    :return: none
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = rate_limiter
+
+
+def rate_limited(endpoint):
+    """
+    Decorator to call the decorated API call function within the rate limit for the {endpoint}
+    :param endpoint: the API endpoint
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return get_rate_limiter().call(endpoint, function, *args, **kwargs)
+        return wrapper
+    return decorator
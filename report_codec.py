@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import io
+import zlib
+import json
+import logging
+
+from config import REPORT_ENCODING, REPORT_COMPRESSION, REPORT_COMPRESSION_MIN_SIZE, INGEST_MAX_BODY_SIZE
+
+# optional binary encoding and compression, the plain JSON and gzip are always available
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+IDENTITY = 'identity'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+# in order of preference, JSON with zstd compression is the smallest body, MessagePack the fastest to encode
+CONTENT_TYPES = [content_type for content_type, module in ((JSON_TYPE, json), (MSGPACK_TYPE, msgpack)) if module]
+CONTENT_ENCODINGS = [encoding for encoding, module in ((ZSTD, zstandard), (GZIP, zlib), (IDENTITY, zlib)) if module]
+
+ENCODING_NAMES = {'json': JSON_TYPE, 'msgpack': MSGPACK_TYPE}
+
+
+class UnsupportedEncoding(ValueError):
+    """
+    The request body content type or content encoding is not supported by the receiver
+    """
+
+
+def parse_header_list(value):
+    """
+    This function will parse a comma separated header value, as the Accept or Accept-Encoding headers
+    :param value: the header value
+    :return: list of the lowercase values, without parameters
+    """
+    return [item.split(';')[0].strip().lower() for item in (value or '').split(',') if item.strip()]
+
+
+def encode_body(payload, content_type=JSON_TYPE):
+    """
+    This function will serialize the {payload} to the {content_type}
+    :param payload: the reports, or any JSON serializable object
+    :param content_type: JSON_TYPE or MSGPACK_TYPE
+    :return: bytes
+    """
+    if content_type == MSGPACK_TYPE:
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def decode_body(body, content_type=JSON_TYPE):
+    """
+    This function will parse the {body} serialized as {content_type}
+    :param body: bytes
+    :param content_type: JSON_TYPE or MSGPACK_TYPE
+    :return: the payload
+    """
+    if content_type == MSGPACK_TYPE:
+        if msgpack is None:
+            raise UnsupportedEncoding('Content type not supported: %s' % content_type)
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except (msgpack.UnpackException, ValueError) as error:
+            raise ValueError('MessagePack not valid: %s' % error)
+    if content_type not in (JSON_TYPE, None, ''):
+        raise UnsupportedEncoding('Content type not supported: %s' % content_type)
+    return json.loads(body)
+
+
+def compress(body, content_encoding):
+    """
+    This function will compress the {body} using the {content_encoding}
+    :param body: bytes
+    :param content_encoding: GZIP, ZSTD or IDENTITY
+    :return: bytes
+    """
+    if content_encoding == GZIP:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 for the gzip header
+        return compressor.compress(body) + compressor.flush()
+    if content_encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+
+def decompress(body, content_encoding, max_size=INGEST_MAX_BODY_SIZE):
+    """
+    This function will decompress the {body} compressed using the {content_encoding}
+    :param body: bytes
+    :param content_encoding: GZIP, ZSTD or IDENTITY, the Content-Encoding header value
+    :param max_size: maximum decompressed size, a larger body is not valid
+    :return: bytes
+    """
+    content_encoding = (content_encoding or IDENTITY).lower()
+    if content_encoding == IDENTITY:
+        return body
+    if content_encoding == GZIP:
+        decompressor = zlib.decompressobj(47)  # wbits 47 to accept the gzip or zlib header
+        try:
+            data = decompressor.decompress(body, max_size + 1)
+        except zlib.error as error:
+            raise ValueError('Gzip data not valid: %s' % error)
+        if not decompressor.eof and len(data) <= max_size:
+            raise ValueError('Gzip data truncated')
+    elif content_encoding == ZSTD and zstandard is not None:
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body)) as reader:
+                chunks = []
+                data_size = 0
+                while data_size <= max_size:
+                    chunk = reader.read(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    data_size += len(chunk)
+                data = b''.join(chunks)
+        except zstandard.ZstdError as error:
+            raise ValueError('Zstd data not valid: %s' % error)
+    else:
+        raise UnsupportedEncoding('Content encoding not supported: %s' % content_encoding)
+    if len(data) > max_size:
+        raise ValueError('Decompressed body larger than %s bytes' % max_size)
+    return data
+
+
+def decode_request(body, content_type, content_encoding):
+    """
+    This function will decompress and parse a request body
+    :param body: bytes
+    :param content_type: the Content-Type header value
+    :param content_encoding: the Content-Encoding header value
+    :return: the payload
+    """
+    content_type = parse_header_list(content_type)
+    return decode_body(decompress(body, content_encoding), content_type[0] if content_type else JSON_TYPE)
+
+
+def get_accept_headers():
+    """
+    This function will return the headers advertising the content types and encodings accepted by the receiver
+    :return: dict with the Accept and Accept-Encoding headers
+    """
+    return {'Accept': ', '.join(CONTENT_TYPES), 'Accept-Encoding': ', '.join(CONTENT_ENCODINGS)}
+
+
+class ReportEncoder:
+    """
+    Request body encoding for the client reports, sent to the webhook receiver.
+    Starts with the configured content type and compression, if available locally, and falls back to
+    the formats advertised by the receiver when it answers 415 Unsupported Media Type.
+    The bodies smaller than {min_size} are not compressed.
+    """
+
+    def __init__(self, encoding=REPORT_ENCODING, compression=REPORT_COMPRESSION,
+                 min_size=REPORT_COMPRESSION_MIN_SIZE):
+        """
+        :param encoding: 'json' or 'msgpack'
+        :param compression: 'zstd', 'gzip' or 'identity'
+        :param min_size: minimum body size in bytes to compress
+        """
+        content_type = ENCODING_NAMES.get(encoding, JSON_TYPE)
+        if content_type not in CONTENT_TYPES:
+            logging.warning('Report encoding %s not available, using JSON', encoding)
+            content_type = JSON_TYPE
+        if compression not in CONTENT_ENCODINGS:
+            logging.warning('Report compression %s not available, using gzip', compression)
+            compression = GZIP
+        self.content_type = content_type
+        self.content_encoding = compression
+        self.min_size = min_size
+
+    def encode(self, payload):
+        """
+        This function will serialize and compress the {payload}
+        :param payload: the reports
+        :return: tuple with the body bytes, and the Content-Type and Content-Encoding headers
+        """
+        body = encode_body(payload, self.content_type)
+        headers = {'Content-Type': self.content_type}
+        if self.content_encoding != IDENTITY and len(body) >= self.min_size:
+            body = compress(body, self.content_encoding)
+            headers['Content-Encoding'] = self.content_encoding
+        return body, headers
+
+    def negotiate(self, response_headers):
+        """
+        This function will select the formats accepted by the receiver, from the 415 response headers
+        :param response_headers: the response headers, with the Accept and Accept-Encoding headers
+        :return: True if the formats changed, and the request should be sent again
+        """
+        accepted_types = parse_header_list(response_headers.get('Accept')) or [JSON_TYPE]
+        accepted_encodings = parse_header_list(response_headers.get('Accept-Encoding')) or [IDENTITY]
+        content_type = next((item for item in CONTENT_TYPES if item in accepted_types), JSON_TYPE)
+        content_encoding = next((item for item in CONTENT_ENCODINGS if item in accepted_encodings), IDENTITY)
+        changed = (content_type, content_encoding) != (self.content_type, self.content_encoding)
+        if changed:
+            logging.info('Report format changed to %s, %s', content_type, content_encoding)
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        return changed
+
+
+def merge_headers(header, body_headers):
+    """
+    This function will add the {body_headers} to the request {header}, replacing the existing values
+    :param header: the request header, as WEBHOOK_HEADER
+    :param body_headers: the Content-Type and Content-Encoding headers
+    :return: the new header dict
+    """
+    replaced = set(key.lower() for key in body_headers)
+    merged = {key: value for key, value in header.items() if key.lower() not in replaced}
+    merged.update(body_headers)
+    return merged
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import time
+import logging
+import threading
+
+from config import REPORT_BATCH_SIZE, REPORT_BATCH_MAX_AGE, REPORT_BUFFER_MAX, REPORT_MAX_ATTEMPTS
+
+import http_transport
+from report_codec import ReportEncoder, merge_headers
+from app_metrics import instrumented
+
+# per-report status returned by the batch endpoint
+REPORT_ACCEPTED = 202
+REPORT_NOT_VALID = 400
+REPORT_RETRY = 503
+
+UNSUPPORTED_MEDIA_TYPE = 415
+
+# the request body format, shared by all the senders, changed if the receiver does not support it
+REPORT_ENCODER = ReportEncoder()
+
+
+@instrumented('webhook-reports')
+def post_reports(payload, webhook_url, header, encoder=REPORT_ENCODER):
+    """
+    This function will send the {payload}, encoded and compressed by the {encoder}, using the POST method,
+    to the {webhook_url}. The request is sent again, once, with the formats the receiver supports, if rejected
+    with 415 Unsupported Media Type
+    :param payload: one client report, or a list of client reports
+    :param webhook_url: destination url
+    :param header: header required
+    :param encoder: the ReportEncoder
+    :return: requests Response
+    """
+    body, body_headers = encoder.encode(payload)
+    response = http_transport.post(webhook_url, data=body, headers=merge_headers(header, body_headers), verify=False)
+    if response.status_code == UNSUPPORTED_MEDIA_TYPE and encoder.negotiate(response.headers):
+        body, body_headers = encoder.encode(payload)
+        response = http_transport.post(webhook_url, data=body, headers=merge_headers(header, body_headers),
+                                       verify=False)
+    return response
+
+
+def post_report_batch(reports, webhook_url, header):
+    """
+    This function will send the {reports} as one array, using the POST method, to the {webhook_url}
+    :param reports: list of client reports
+    :param webhook_url: the batch endpoint url
+    :param header: header required
+    :return: list with the status for each report
+    """
+    response = post_reports(reports, webhook_url, header)
+    if response.status_code == REPORT_RETRY:
+        return [REPORT_RETRY] * len(reports)
+    response.raise_for_status()
+    return [result['status'] for result in response.json()['results']]
+
+
+class ReportSender:
+    """
+    Client reports buffer, sent to the webhook receiver batch endpoint by a background thread, when {max_count}
+    reports are buffered, or when the oldest buffered report is {max_age} seconds old. Adding a report does not
+    wait for the network, the buffer is limited to {max_buffer} reports, the oldest reports are dropped.
+    The reports the receiver could not queue, or not sent because of a connection error, are buffered again
+    and retried with the next batch, up to {max_attempts} times. The reports not valid are dropped.
+    """
+
+    def __init__(self, webhook_url, header, max_count=REPORT_BATCH_SIZE, max_age=REPORT_BATCH_MAX_AGE,
+                 max_buffer=REPORT_BUFFER_MAX, max_attempts=REPORT_MAX_ATTEMPTS, send_batch=post_report_batch):
+        """
+        :param webhook_url: the batch endpoint url
+        :param header: header required
+        :param max_count: number of buffered reports that triggers a flush
+        :param max_age: age in seconds of the oldest buffered report that triggers a flush
+        :param max_buffer: maximum number of buffered reports, the oldest reports are dropped
+        :param max_attempts: maximum number of attempts to send each report
+        :param send_batch: function called with (reports, webhook_url, header), returns the status for each report
+        """
+        self.webhook_url = webhook_url
+        self.header = header
+        self.max_count = max_count
+        self.max_age = max_age
+        self.max_buffer = max_buffer
+        self.max_attempts = max_attempts
+        self._send_batch = send_batch
+        self._buffer = []  # list of [report, attempts]
+        self._oldest_time = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._timer = None
+        self._flush_event = threading.Event()
+        self.sent_count = 0
+        self.dropped_count = 0
+
+    def add(self, report):
+        """
+        This function will buffer the {report}, the buffer is sent by the background thread when full
+        :param report: the client report
+        :return: none
+        """
+        with self._lock:
+            self._buffer.append([report, 0])
+            if len(self._buffer) > self.max_buffer:
+                # drop the oldest report
+                del self._buffer[0]
+                self.dropped_count += 1
+            if self._oldest_time is None:
+                self._oldest_time = time.monotonic()
+            full = len(self._buffer) >= self.max_count
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._sender_loop, name='report-sender', daemon=True)
+                self._timer.start()
+        if full:
+            self._flush_event.set()
+
+    def depth(self):
+        """
+        This function will return the number of buffered reports
+        :return: buffer depth
+        """
+        with self._lock:
+            return len(self._buffer)
+
+    def _sender_loop(self):
+        while True:
+            self._flush_event.wait(min(1.0, self.max_age))
+            self._flush_event.clear()
+            with self._lock:
+                expired = self._oldest_time is not None and (len(self._buffer) >= self.max_count or
+                                                             time.monotonic() - self._oldest_time >= self.max_age)
+            if expired:
+                try:
+                    self.flush()
+                except Exception:
+                    logging.exception('Wireless client reports flush failed')
+
+    def flush(self):
+        """
+        This function will send all the buffered reports, in batches of up to {max_count} reports
+        :return: number of reports accepted by the receiver
+        """
+        with self._send_lock:
+            with self._lock:
+                pending = self._buffer
+                self._buffer = []
+                self._oldest_time = None
+            accepted = 0
+            dropped = 0
+            retry = []
+            for start in range(0, len(pending), self.max_count):
+                batch = pending[start:start + self.max_count]
+                try:
+                    statuses = self._send_batch([report for report, attempts in batch], self.webhook_url,
+                                                self.header)
+                except Exception as error:
+                    logging.warning('Wireless client reports batch not sent: %s', error)
+                    statuses = [REPORT_RETRY] * len(batch)
+                if len(statuses) < len(batch):
+                    # the reports without a status in the response are retried
+                    logging.warning('Wireless client reports batch, %s statuses for %s reports', len(statuses),
+                                    len(batch))
+                    statuses = list(statuses) + [REPORT_RETRY] * (len(batch) - len(statuses))
+                for (report, attempts), status in zip(batch, statuses):
+                    if status == REPORT_ACCEPTED:
+                        accepted += 1
+                    elif status == REPORT_RETRY and attempts + 1 < self.max_attempts:
+                        retry.append([report, attempts + 1])
+                    else:
+                        dropped += 1
+                        logging.warning('Wireless client report dropped, status: %s, username: %s', status,
+                                        report.get('username'))
+            with self._lock:
+                self.sent_count += accepted
+                self.dropped_count += dropped
+            if retry:
+                self._requeue(retry)
+            return accepted
+
+    def _requeue(self, retry):
+        with self._lock:
+            self._buffer = retry + self._buffer
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                # drop the oldest reports
+                del self._buffer[:overflow]
+                self.dropped_count += overflow
+            if self._buffer and self._oldest_time is None:
+                self._oldest_time = time.monotonic()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import json
+import mmap
+import time
+import fcntl
+import struct
+import threading
+import functools
+import contextlib
+
+from config import WIRELESS_FOLDER, SAMPLE_RETENTION_DAYS, SAMPLE_COMPACT_INTERVAL
+
+# one fixed-size record for each sample:
+# timestamp in epoch msec, health score, snr, data rate, total data (tx + rx bytes)
+# the missing values are stored as NaN
+SAMPLE_RECORD = struct.Struct('<qfffd')
+SAMPLE_FIELDS = ('timestamp', 'health', 'snr', 'data_rate', 'total_data')
+NAN = float('nan')
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_report_time(timestamp):
+    """
+    This function will convert the report timestamp, local time '%Y-%m-%d %H:%M:%S', to epoch msec
+    :param timestamp: the report timestamp
+    :return: epoch time including msec
+    """
+    # cached, the reports of a poller sweep share the same timestamp
+    return int(time.mktime(time.strptime(timestamp, '%Y-%m-%d %H:%M:%S')) * 1000)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def report_to_sample(report):
+    """
+    This function will convert the wireless client report {report}, sent by the poller, to a sample
+    :param report: the client report, with the username and details
+    :return: tuple with the timestamp, health score, snr, data rate, total data
+    """
+    details = report['details']
+    client_health = NAN
+    for score in details.get('health_score') or []:
+        if score.get('healthType') == 'OVERALL':
+            client_health = _to_float(score.get('score'))
+    return (parse_report_time(details['timestamp']), client_health, _to_float(details.get('snr')),
+            _to_float(details.get('data_rate')), _to_float(details.get('total_data')))
+
+
+class SampleStore:
+    """
+    Append-only time-series store, with one file of fixed-size binary records for each client.
+    The records are appended in time order, so the file is its own time index: a time window is found
+    with a binary search over the memory-mapped file. A sample older than the last one marks the file
+    as unsorted, it is sorted again by compact(), queries scan the whole file until then.
+    The appends and the compactions hold a file lock on {folder}/.lock, so the receiver and the backfill
+    (client_backfill.py) can write the same folder: the other process waits, no sample is lost.
+    """
+
+    def __init__(self, folder=WIRELESS_FOLDER + '/history', retention_days=SAMPLE_RETENTION_DAYS,
+                 compact_interval=SAMPLE_COMPACT_INTERVAL):
+        """
+        :param folder: the folder for the sample files
+        :param retention_days: number of days of samples kept by compact()
+        :param compact_interval: time in minutes between the compactions by compact_if_due()
+        """
+        self.folder = folder
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval * 60
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(folder, '.lock')
+        self._last_timestamps = {}  # username -> (file size, last timestamp)
+        self._last_compact_time = time.monotonic()
+        # the MAC address index, the JSON snapshot and the "<mac address>\t<username>" lines appended since
+        self._mac_index_path = os.path.join(folder, 'mac_index.json')
+        self._mac_log_path = os.path.join(folder, 'mac_index.log')
+        self._mac_index = self._load_mac_index()
+
+    def _sample_path(self, username):
+        # the username is used as file name, it can not include a path
+        if not username or os.path.basename(username) != username or username.startswith('.'):
+            raise ValueError('Username not valid: %r' % username)
+        return os.path.join(self.folder, username + '.dat')
+
+    def _unsorted_path(self, username):
+        return os.path.join(self.folder, username + '.unsorted')
+
+    def _load_mac_index(self):
+        try:
+            with open(self._mac_index_path, 'r') as filehandle:
+                mac_index = json.load(filehandle)
+        except (FileNotFoundError, ValueError):
+            mac_index = {}
+        try:
+            with open(self._mac_log_path, 'r') as filehandle:
+                for line in filehandle:
+                    mac_address, separator, username = line.rstrip('\n').partition('\t')
+                    if separator and username:  # the last line is partial if the write was interrupted
+                        mac_index[mac_address] = username
+        except FileNotFoundError:
+            pass
+        return mac_index
+
+    def _update_mac_index(self, username, mac_address):
+        # one line appended for each new MAC address, the index is written again by compact_all()
+        mac_address = mac_address.lower()
+        if self._mac_index.get(mac_address) == username:
+            return
+        self._mac_index[mac_address] = username
+        with open(self._mac_log_path, 'a') as filehandle:
+            filehandle.write('%s\t%s\n' % (mac_address, username))
+
+    def _save_mac_index(self):
+        temp_path = self._mac_index_path + '.tmp'
+        with open(temp_path, 'w') as filehandle:
+            json.dump(self._mac_index, filehandle)
+        os.replace(temp_path, self._mac_index_path)
+        if os.path.exists(self._mac_log_path):
+            os.remove(self._mac_log_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # the thread lock, and the file lock shared with the other processes writing the folder
+        with self._lock, open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_file_size(self, username):
+        try:
+            return os.path.getsize(self._sample_path(username))
+        except FileNotFoundError:
+            return 0
+
+    def _get_last_timestamp(self, username):
+        # the cached timestamp is used if the file was not written by another process since
+        file_size = self._get_file_size(username)
+        cached = self._last_timestamps.get(username)
+        if cached is not None and cached[0] == file_size:
+            return cached[1]
+        last_sample = self.latest(username)
+        return last_sample[0] if last_sample is not None else 0
+
+    def append(self, username, samples, mac_address=None, fsync=False):
+        """
+        This function will append the {samples} to the {username} sample file
+        :param username: client username
+        :param samples: list of tuples with the timestamp, health score, snr, data rate, total data
+        :param mac_address: optional client MAC address, to query the samples by MAC address
+        :param fsync: sync the sample file to disk
+        :return: none
+        """
+        if not samples:
+            return
+        sample_path = self._sample_path(username)  # the username is validated before the MAC address is indexed
+        with self._locked():
+            if mac_address:
+                self._update_mac_index(username, mac_address)
+            last_timestamp = self._get_last_timestamp(username)
+            in_order = True
+            records = []
+            for sample in samples:
+                if sample[0] < last_timestamp:
+                    in_order = False
+                last_timestamp = max(last_timestamp, sample[0])
+                records.append(SAMPLE_RECORD.pack(*sample))
+            with open(sample_path, 'ab') as filehandle:
+                filehandle.write(b''.join(records))
+                if fsync:
+                    filehandle.flush()
+                    os.fsync(filehandle.fileno())
+            if not in_order:
+                open(self._unsorted_path(username), 'a').close()
+            self._last_timestamps[username] = (self._get_file_size(username), last_timestamp)
+
+    def append_report(self, report):
+        """
+        This function will append the wireless client report {report}, sent by the poller
+        :param report: the client report, with the username and details
+        :return: none
+        """
+        self.append(report['username'], [report_to_sample(report)], report['details'].get('mac_address'))
+
+    def latest(self, username):
+        """
+        This function will return the last sample appended for the {username}
+        :param username: client username
+        :return: tuple with the timestamp, health score, snr, data rate, total data, None if no sample
+        """
+        try:
+            with open(self._sample_path(username), 'rb') as filehandle:
+                filehandle.seek(0, os.SEEK_END)
+                file_size = filehandle.tell() - filehandle.tell() % SAMPLE_RECORD.size
+                if file_size == 0:
+                    return None
+                filehandle.seek(file_size - SAMPLE_RECORD.size)
+                return SAMPLE_RECORD.unpack(filehandle.read(SAMPLE_RECORD.size))
+        except FileNotFoundError:
+            return None
+
+    def query(self, username, start_time=None, end_time=None):
+        """
+        This function will return the {username} samples in the time window [start_time, end_time]
+        :param username: client username
+        :param start_time: optional window start, epoch msec
+        :param end_time: optional window end, epoch msec
+        :return: list of tuples with the timestamp, health score, snr, data rate, total data
+        """
+        start_time = start_time if start_time is not None else -2 ** 63
+        end_time = end_time if end_time is not None else 2 ** 63 - 1
+        try:
+            filehandle = open(self._sample_path(username), 'rb')
+        except FileNotFoundError:
+            return []
+        with filehandle:
+            file_size = os.fstat(filehandle.fileno()).st_size
+            count = file_size // SAMPLE_RECORD.size
+            if count == 0:
+                return []
+            with mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ) as samples:
+                if os.path.exists(self._unsorted_path(username)):
+                    all_samples = SAMPLE_RECORD.iter_unpack(samples[:count * SAMPLE_RECORD.size])
+                    return sorted(sample for sample in all_samples if start_time <= sample[0] <= end_time)
+                # binary search of the first sample in the time window
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    if struct.unpack_from('<q', samples, middle * SAMPLE_RECORD.size)[0] < start_time:
+                        low = middle + 1
+                    else:
+                        high = middle
+                window = []
+                for index in range(low, count):
+                    sample = SAMPLE_RECORD.unpack_from(samples, index * SAMPLE_RECORD.size)
+                    if sample[0] > end_time:
+                        break
+                    window.append(sample)
+                return window
+
+    def query_by_mac(self, mac_address, start_time=None, end_time=None):
+        """
+        This function will return the samples for the client with the {mac_address}, in the time window
+        :param mac_address: client MAC address
+        :param start_time: optional window start, epoch msec
+        :param end_time: optional window end, epoch msec
+        :return: list of tuples with the timestamp, health score, snr, data rate, total data
+        """
+        username = self._mac_index.get(mac_address.lower())
+        if username is None:
+            return []
+        return self.query(username, start_time, end_time)
+
+    def compact(self, username):
+        """
+        This function will rewrite the {username} sample file, sorted by time and without the samples
+        older than the retention time. The file is replaced atomically.
+        :param username: client username
+        :return: number of samples kept
+        """
+        retention_time = int((time.time() - self.retention_days * 86400) * 1000)
+        with self._locked():
+            if not os.path.exists(self._unsorted_path(username)):
+                # sorted, the file is rewritten only if its first sample is older than the retention time
+                first_samples = self.query(username, end_time=retention_time - 1)
+                if not first_samples:
+                    return self._get_file_size(username) // SAMPLE_RECORD.size
+            samples = self.query(username, retention_time)
+            temp_path = self._sample_path(username) + '.tmp'
+            with open(temp_path, 'wb') as filehandle:
+                filehandle.write(b''.join(SAMPLE_RECORD.pack(*sample) for sample in samples))
+            os.replace(temp_path, self._sample_path(username))
+            if os.path.exists(self._unsorted_path(username)):
+                os.remove(self._unsorted_path(username))
+            self._last_timestamps[username] = (len(samples) * SAMPLE_RECORD.size, samples[-1][0] if samples else 0)
+        return len(samples)
+
+    def compact_all(self):
+        """
+        This function will compact all the sample files, to apply the retention time
+        :return: number of sample files compacted
+        """
+        usernames = [filename[:-4] for filename in os.listdir(self.folder) if filename.endswith('.dat')]
+        for username in usernames:
+            self.compact(username)
+        with self._locked():
+            self._mac_index.update(self._load_mac_index())  # including the MAC addresses indexed by other processes
+            self._save_mac_index()
+        self._last_compact_time = time.monotonic()
+        return len(usernames)
+
+    def compact_if_due(self):
+        """
+        This function will compact all the sample files, if the last compaction is older than {compact_interval},
+        called by the receiver ingest writer, so the retention time is applied while the receiver is running
+        :return: number of sample files compacted, None if not due
+        """
+        if time.monotonic() - self._last_compact_time < self.compact_interval:
+            return None
+        return self.compact_all()
+
+
+def sample_to_dict(sample):
+    """
+    This function will convert the {sample} tuple to a dict, the missing values are None
+    :param sample: tuple with the timestamp, health score, snr, data rate, total data
+    :return: dict with the sample fields
+    """
+    return {field: (None if value != value else value) for field, value in zip(SAMPLE_FIELDS, sample)}
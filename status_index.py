@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import json
+import mmap
+import logging
+import threading
+
+from collections import OrderedDict
+
+from config import WIRELESS_FOLDER, STATUS_INDEX_SIZE, STATUS_SNAPSHOT_INTERVAL
+
+
+def read_status_file(username, folder=WIRELESS_FOLDER):
+    """
+    This function will read the last client report saved to the {folder}/<username>.json file
+    :param username: client username
+    :param folder: the folder for the last report files
+    :return: the client report, None if not found
+    """
+    if not username or os.path.basename(username) != username or username.startswith('.'):
+        return None
+    try:
+        with open(os.path.join(folder, username + '.json'), 'r') as filehandle:
+            return json.load(filehandle)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logging.warning('Wireless client status file not valid, username: %s', username)
+        return None
+
+
+class StatusIndex:
+    """
+    In-memory index of the last report for each client, updated by the ingestion, used by the bot lookups.
+    The parsed reports are kept in a LRU dict, bounded to {maxsize} clients.
+    At startup the index is warm-loaded from the snapshot file, one "<username>\t<report JSON>" line for each
+    client: the file is memory-mapped and only the line offsets are indexed, each report is parsed when first
+    looked up. The clients not in memory or in the snapshot are read from the {folder}/<username>.json file.
+    """
+
+    def __init__(self, folder=WIRELESS_FOLDER, maxsize=STATUS_INDEX_SIZE, snapshot_path=None):
+        """
+        :param folder: the folder for the last report files
+        :param maxsize: maximum number of clients in memory, and in the snapshot
+        :param snapshot_path: the snapshot file, default {folder}/status_snapshot.ndjson
+        """
+        self.folder = folder
+        self.maxsize = maxsize
+        self.snapshot_path = snapshot_path or os.path.join(folder, 'status_snapshot.ndjson')
+        self._lock = threading.Lock()
+        self._reports = OrderedDict()  # username -> report, least recently used first
+        self._snapshot = None  # the memory-mapped snapshot
+        self._snapshot_offsets = {}  # username -> (start, end) of the report JSON in the snapshot
+        self._dirty = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        """
+        This function will memory-map the snapshot file and index the report offsets
+        :return: number of clients in the snapshot
+        """
+        try:
+            filehandle = open(self.snapshot_path, 'rb')
+        except FileNotFoundError:
+            return 0
+        with filehandle:
+            if os.fstat(filehandle.fileno()).st_size == 0:
+                return 0
+            snapshot = mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = {}
+        start = 0
+        size = len(snapshot)
+        while start < size:
+            end = snapshot.find(b'\n', start)
+            if end < 0:
+                end = size  # last line not terminated, the snapshot write was interrupted
+            separator = snapshot.find(b'\t', start, end)
+            if separator > start:
+                offsets[snapshot[start:separator].decode('utf-8')] = (separator + 1, end)
+            start = end + 1
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+            self._snapshot = snapshot
+            self._snapshot_offsets = offsets
+        return len(offsets)
+
+    def _read_snapshot(self, username):
+        offsets = self._snapshot_offsets.get(username)
+        if offsets is None:
+            return None
+        try:
+            return json.loads(self._snapshot[offsets[0]:offsets[1]])
+        except ValueError:
+            logging.warning('Wireless client status snapshot entry not valid, username: %s', username)
+            return None
+
+    def _store(self, username, report):
+        self._reports[username] = report
+        self._reports.move_to_end(username)
+        while len(self._reports) > self.maxsize:
+            self._reports.popitem(last=False)
+
+    def update(self, reports):
+        """
+        This function will update the index with the last {reports}, called by the ingestion
+        :param reports: list of client reports
+        :return: none
+        """
+        with self._lock:
+            for report in reports:
+                self._store(report['username'], report)
+                self._snapshot_offsets.pop(report['username'], None)
+            self._dirty = True
+
+    def get(self, username):
+        """
+        This function will return the last report for the {username}
+        :param username: client username
+        :return: the client report, None if no data was collected
+        """
+        with self._lock:
+            report = self._reports.get(username)
+            if report is not None:
+                self._reports.move_to_end(username)
+                return report
+            report = self._read_snapshot(username)
+            if report is not None:
+                self._store(username, report)
+                return report
+        report = read_status_file(username, self.folder)
+        if report is not None:
+            with self._lock:
+                if username not in self._reports:
+                    self._store(username, report)
+        return report
+
+    def __len__(self):
+        with self._lock:
+            return len(self._reports.keys() | self._snapshot_offsets.keys())
+
+    def save_snapshot(self):
+        """
+        This function will save the index to the snapshot file, replaced atomically, and memory-map it again
+        The clients only in the snapshot are kept, up to {maxsize} clients, the least recently used are dropped
+        :return: number of clients saved
+        """
+        with self._lock:
+            lines = [username.encode('utf-8') + b'\t' + self._snapshot[start:end] + b'\n'
+                     for username, (start, end) in self._snapshot_offsets.items() if username not in self._reports]
+            lines.extend(username.encode('utf-8') + b'\t' + json.dumps(report).encode('utf-8') + b'\n'
+                         for username, report in self._reports.items())
+            self._dirty = False
+        lines = lines[-self.maxsize:]
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as filehandle:
+            filehandle.write(b''.join(lines))
+            filehandle.flush()
+            os.fsync(filehandle.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # the new snapshot includes all the reports in memory, the parsed reports are kept
+        self.load_snapshot()
+        with self._lock:
+            for username in self._reports:
+                self._snapshot_offsets.pop(username, None)
+        return len(lines)
+
+    def _snapshot_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            if self._dirty:
+                try:
+                    self.save_snapshot()
+                except OSError:
+                    logging.exception('Wireless client status snapshot not saved')
+
+    def start_snapshots(self, interval=STATUS_SNAPSHOT_INTERVAL):
+        """
+        This function will start the background thread saving the snapshot every {interval} seconds, if updated
+        :param interval: time in seconds between two snapshots
+        :return: none
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._snapshot_loop, args=(interval,), name='status-snapshot',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop_snapshots(self):
+        """
+        This function will stop the background snapshots, and save the last snapshot if updated
+        :return: none
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._dirty:
+            self.save_snapshot()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from config import LOG_MODE, LOG_FILE, LOG_LEVEL, LOG_FORMAT, LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from config import LOG_ROTATE_WHEN, LOG_QUEUE_SIZE, LOG_SAMPLE_BURST, LOG_SAMPLE_INTERVAL
+
+from app_metrics import REGISTRY
+
+TEXT_FORMAT = '%(asctime)s.%(msecs)03d %(levelname)s %(module)s - %(funcName)s: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# the LogRecord attributes, the other attributes are the {extra} fields, added to the JSON records
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# maximum number of message templates tracked by the sampling filter
+SAMPLING_MAX_KEYS = 10000
+
+LOG_DROPPED = REGISTRY.counter('wireless_log_records_dropped_total', 'Log records dropped, the log queue was full')
+LOG_SUPPRESSED = REGISTRY.counter('wireless_log_records_sampled_total',
+                                  'Repetitive log records not written, above the sampling burst')
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatter for one JSON object per log record: time, level, logger, module, function, thread, message,
+    the {extra} fields and the exception
+    """
+
+    def format(self, record):
+        entry = {
+            'time': '%s.%03d' % (self.formatTime(record, DATE_FORMAT), record.msecs),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'function': record.funcName,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate limit for the repetitive log records below {level}: for each logger and message template,
+    up to {burst} records are accepted every {interval} seconds.
+    The first record accepted in the next interval has the number of records dropped, {suppressed}.
+    """
+
+    def __init__(self, burst=LOG_SAMPLE_BURST, interval=LOG_SAMPLE_INTERVAL, level=logging.WARNING):
+        """
+        :param burst: maximum number of records for each message template and interval
+        :param interval: the interval in seconds
+        :param level: the records at this level and above are always accepted
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.level = level
+        self._windows = {}  # (logger, message template) -> [interval start, accepted, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                if window is None and len(self._windows) >= SAMPLING_MAX_KEYS:
+                    self._windows.clear()
+                if window is not None and window[2]:
+                    record.suppressed = window[2]
+                self._windows[key] = [record.created, 1, 0]
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+        LOG_SUPPRESSED.inc()
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the calling thread: the records are dropped when the queue is full.
+    Only the message is rendered by the calling thread, the records are formatted and written by the listener
+    """
+
+    def __init__(self, log_queue, maxsize):
+        """
+        :param log_queue: the SimpleQueue read by the listener
+        :param maxsize: maximum number of queued records
+        """
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+
+    def prepare(self, record):
+        # the arguments are rendered now, they may change before the listener formats the record
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record):
+        # SimpleQueue, without the locking of the bounded queue.Queue, the size is checked before
+        if self.queue.qsize() >= self.maxsize:
+            LOG_DROPPED.inc()
+            return
+        self.queue.put(record)
+
+
+class LogListener(QueueListener):
+    """
+    QueueListener that can be stopped more than once, by the application and at exit
+    """
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def create_file_handler(filename, rotation=LOG_ROTATION, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                        when=LOG_ROTATE_WHEN):
+    """
+    This function will create the log file handler, rotated by size or time
+    :param filename: the log file
+    :param rotation: 'size' or 'time'
+    :param max_bytes: the file size that triggers the rotation, for the size rotation
+    :param backup_count: number of rotated files kept
+    :param when: the rotation time, for the time rotation, see TimedRotatingFileHandler
+    :return: the file handler
+    """
+    if rotation == 'time':
+        return TimedRotatingFileHandler(filename, when=when, backupCount=backup_count, delay=True)
+    return RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+
+
+def start_async_logging(logger, handlers, queue_size=LOG_QUEUE_SIZE, sampling_filter=None):
+    """
+    This function will send the {logger} records to a bounded queue, written to the {handlers} by a background
+    listener thread. The listener is stopped, and the queued records written, when the application exits
+    :param logger: the logger
+    :param handlers: list of handlers used by the listener
+    :param queue_size: maximum number of queued records, the new records are dropped when full
+    :param sampling_filter: optional SamplingFilter, applied before the records are queued
+    :return: the LogListener
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue, queue_size)
+    if sampling_filter is not None:
+        queue_handler.addFilter(sampling_filter)
+    listener = LogListener(log_queue, *handlers, respect_handler_level=True)
+    logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def setup_logging(filename=LOG_FILE, mode=LOG_MODE, level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """
+    This function will configure the application logging, to the {filename}
+     - 'sync' {mode}: logging.basicConfig, the text records written by the calling threads
+     - 'async' {mode}: the records are queued, and written by a background listener, in JSON or text,
+       to a rotated file, the repetitive records below WARNING are sampled
+    :param filename: the log file
+    :param mode: 'async' or 'sync'
+    :param level: the root logger level
+    :param log_format: 'json' or 'text', for the async mode
+    :return: the LogListener, None for the sync mode
+    """
+    if mode == 'sync':
+        logging.basicConfig(filename=filename, level=level, format=TEXT_FORMAT, datefmt=DATE_FORMAT)
+        return None
+    file_handler = create_file_handler(filename)
+    if log_format == 'json':
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT, DATE_FORMAT))
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    return start_async_logging(root_logger, [file_handler], sampling_filter=SamplingFilter())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+
+# Bulk collection against the local stub Cisco DNA Center: python -m pytest test_client_bulk.py
+
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rate_limiter
+import client_bulk
+import client_monitoring
+from config import DNAC_RATE_LIMITS
+from dnac_stub import start_stub_server, generate_client, get_client_mac, get_client_username, STUB_TOKEN
+from dnac_stub import CLIENTS_PATH, CLIENT_DETAIL_PATH
+from client_poller import create_client_state, run_sweep
+
+
+@pytest.fixture
+def stub_dnac(tmp_path, monkeypatch):
+    # 250 synthetic clients, every 10th client listed without the connection info
+    server, base_url = start_stub_server(250, incomplete_every=10)
+    monkeypatch.setattr(client_bulk, 'DNAC_URL', base_url)
+    monkeypatch.setattr(client_monitoring, 'DNAC_URL', base_url)
+    # the stub is not rate limited, the rate limit buckets are kept out of the working folder
+    monkeypatch.setattr(rate_limiter, '_rate_limiter', rate_limiter.RateLimiter(
+        {endpoint: 10 ** 9 for endpoint in DNAC_RATE_LIMITS}, os.path.join(str(tmp_path), 'rate_limits.sqlite')))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_page(offset, limit):
+    return client_bulk.get_clients_page(offset, limit, STUB_TOKEN)
+
+
+def get_detail(mac_address, timestamp):
+    return client_monitoring.get_client_detail(mac_address, timestamp, STUB_TOKEN)
+
+
+def test_collect_client_health_pages_until_the_last_page(stub_dnac):
+    # client 239 is listed without the connection info, the collection reads all the pages
+    mac_addresses = [get_client_mac(index).upper() for index in (0, 150, 239, 248)]
+    client_metrics = client_bulk.collect_client_health(get_page, mac_addresses, page_size=100)
+
+    assert stub_dnac.get_stats()[CLIENTS_PATH] == 3
+    assert sorted(client_metrics) == [get_client_mac(index) for index in (0, 150, 248)]
+    client = generate_client(150)
+    metrics = client_metrics[get_client_mac(150)]
+    assert metrics['client_health'] == client['health']
+    assert metrics['snr'] == client['snr']
+    assert metrics['total_data'] == client['tx_bytes'] + client['rx_bytes']
+    assert metrics['access_point'] == client['access_point']
+
+
+def test_collect_client_health_stops_when_all_clients_found(stub_dnac):
+    client_metrics = client_bulk.collect_client_health(get_page, [get_client_mac(index) for index in (1, 2)],
+                                                       page_size=100)
+
+    assert stub_dnac.get_stats()[CLIENTS_PATH] == 1
+    assert len(client_metrics) == 2
+
+
+def test_sweep_falls_back_to_client_detail_for_incomplete_clients(stub_dnac):
+    indexes = (0, 9, 120, 129, 248)  # clients 9 and 129 are listed without the connection info
+    client_states = [create_client_state(get_client_username(index), get_client_mac(index)) for index in indexes]
+
+    def get_bulk(mac_addresses):
+        return client_bulk.collect_client_health(get_page, mac_addresses, page_size=100)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        run_sweep(client_states, get_detail, executor, get_bulk=get_bulk)
+
+    stats = stub_dnac.get_stats()
+    assert stats[CLIENTS_PATH] == 3
+    assert stats[CLIENT_DETAIL_PATH] == 2
+    for index, client_state in zip(indexes, client_states):
+        client = generate_client(index)
+        assert client_state['metrics']['client_health'] == client['health']
+        assert client_state['metrics']['ssid'] == client['ssid']
+        assert client_state['metrics']['access_point'] == client['access_point']
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import os
+import re
+import json
+import fnmatch
+import logging
+import threading
+
+from collections import namedtuple
+
+from config import BW_LOW, HEALTH_LOW, COUNTER_MAX, SNR
+from config import THRESHOLD_PROFILES_FILE, THRESHOLD_CACHE_SIZE
+
+Thresholds = namedtuple('Thresholds', ['health_low', 'snr_low', 'bw_low', 'counter_max'])
+
+DEFAULT_THRESHOLDS = Thresholds(HEALTH_LOW, SNR, BW_LOW, COUNTER_MAX)
+
+# the rule keys matched to the client, and the thresholds set by the rule
+MATCH_FIELDS = ('location', 'ssid', 'ap')
+THRESHOLD_FIELDS = Thresholds._fields
+
+
+def split_location(location):
+    """
+    This function will split the Cisco DNA Center site hierarchy {location} into its levels
+    :param location: site hierarchy, for example 'Global/San Jose/Building 24/Floor 1'
+    :return: tuple of the lowercase levels
+    """
+    return tuple(level.strip().lower() for level in (location or '').split('/') if level.strip())
+
+
+class _LocationNode:
+    __slots__ = ('children', 'ssid_rules')
+
+    def __init__(self):
+        self.children = {}  # next location level -> node
+        self.ssid_rules = {}  # ssid, None for any ssid -> _ApRules
+
+
+class _ApRules:
+    __slots__ = ('exact', 'patterns', 'any_ap')
+
+    def __init__(self):
+        self.exact = {}  # ap name -> rule thresholds
+        self.patterns = []  # list of (compiled pattern, rule thresholds), in the file order
+        self.any_ap = None
+
+    def add_pattern(self, pattern, thresholds):
+        self.patterns.append((re.compile(fnmatch.translate(pattern), re.IGNORECASE), thresholds))
+
+    def match(self, ap_name):
+        matched = []
+        if self.any_ap is not None:
+            matched.append(self.any_ap)
+        if ap_name:
+            # the first matching pattern
+            for pattern, thresholds in self.patterns:
+                if pattern.match(ap_name):
+                    matched.append(thresholds)
+                    break
+        exact = self.exact.get(ap_name.lower()) if ap_name else None
+        if exact is not None:
+            matched.append(exact)
+        return matched
+
+
+def parse_rule(rule):
+    """
+    This function will validate one threshold profile {rule}
+    :param rule: dict with the optional location, ssid, ap match keys and the thresholds
+    :return: tuple with the location levels, the ssid, the ap name or pattern, and the dict of thresholds
+    """
+    if not isinstance(rule, dict):
+        raise ValueError('Rule is not an object: %r' % (rule,))
+    unknown = set(rule) - set(MATCH_FIELDS) - set(THRESHOLD_FIELDS) - {'name'}
+    if unknown:
+        raise ValueError('Rule keys not valid: %s' % ', '.join(sorted(unknown)))
+    for field in MATCH_FIELDS:
+        if rule.get(field) is not None and not isinstance(rule[field], str):
+            raise ValueError('Rule %s is not a string: %r' % (field, rule[field]))
+    thresholds = {}
+    for field in THRESHOLD_FIELDS:
+        if field in rule:
+            try:
+                thresholds[field] = int(rule[field]) if field == 'counter_max' else float(rule[field])
+            except (TypeError, ValueError):
+                raise ValueError('Rule %s is not a number: %r' % (field, rule[field]))
+    if not thresholds:
+        raise ValueError('Rule without thresholds: %r' % (rule,))
+    ssid = rule.get('ssid')
+    ap_name = rule.get('ap')
+    return split_location(rule.get('location')), ssid, ap_name.lower() if ap_name else None, thresholds
+
+
+class ProfileSet:
+    """
+    Threshold rules compiled once into a lookup structure: a prefix trie on the location levels,
+    each trie node with a hash map by SSID, and for each SSID a hash map of the AP names plus the compiled
+    AP name patterns. A lookup walks the location levels, it does not scan all the rules.
+    The thresholds of all the matching rules are merged, the most specific rule wins for each threshold:
+    deeper location, then SSID over any SSID, then AP name over AP pattern over any AP.
+    The lookups are cached by (location, ssid, ap).
+    """
+
+    def __init__(self, rules, defaults=DEFAULT_THRESHOLDS, cache_size=THRESHOLD_CACHE_SIZE):
+        """
+        :param rules: list of dict rules, with the optional location prefix, ssid, ap name or pattern,
+        and one or more of the health_low, snr_low, bw_low, counter_max thresholds
+        :param defaults: the thresholds when no rule matches
+        :param cache_size: maximum number of cached lookups
+        """
+        self.defaults = defaults
+        self.cache_size = cache_size
+        self.rule_count = len(rules)
+        self._root = _LocationNode()
+        self._cache = {}
+        for rule in rules:
+            levels, ssid, ap_name, thresholds = parse_rule(rule)
+            node = self._root
+            for level in levels:
+                node = node.children.setdefault(level, _LocationNode())
+            ap_rules = node.ssid_rules.setdefault(ssid, _ApRules())
+            if ap_name is None:
+                ap_rules.any_ap = dict(ap_rules.any_ap or {}, **thresholds)
+            elif any(character in ap_name for character in '*?['):
+                ap_rules.add_pattern(ap_name, thresholds)
+            else:
+                ap_rules.exact[ap_name] = dict(ap_rules.exact.get(ap_name, {}), **thresholds)
+
+    def _match(self, location, ssid, ap_name):
+        merged = self.defaults._asdict()
+        node = self._root
+        levels = split_location(location)
+        for depth in range(len(levels) + 1):
+            # the rules for any SSID first, overridden by the rules for this SSID
+            for rule_ssid in ((None,) if ssid is None else (None, ssid)):
+                ap_rules = node.ssid_rules.get(rule_ssid)
+                if ap_rules is not None:
+                    for thresholds in ap_rules.match(ap_name):
+                        merged.update(thresholds)
+            if depth == len(levels):
+                break
+            node = node.children.get(levels[depth])
+            if node is None:
+                break
+        return Thresholds(**merged)
+
+    def get_thresholds(self, location, ssid, ap_name):
+        """
+        This function will return the thresholds for a client connected at the {location}, {ssid} and {ap_name}
+        :param location: the client location, site hierarchy
+        :param ssid: the client SSID
+        :param ap_name: the access point name
+        :return: Thresholds
+        """
+        key = (location, ssid, ap_name)
+        thresholds = self._cache.get(key)
+        if thresholds is None:
+            thresholds = self._match(location, ssid, ap_name)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = thresholds
+        return thresholds
+
+
+class ThresholdProfiles:
+    """
+    The threshold profiles loaded from the JSON file {path}, a list of rules, for example:
+        [{"name": "warehouse", "location": "Global/San Jose/Warehouse", "snr_low": 20, "health_low": 5},
+         {"location": "Global/San Jose", "ssid": "scanners", "ap": "wh-ap-*", "bw_low": 10, "counter_max": 5}]
+    The file is loaded again when modified, checked by reload_if_changed(), without restarting the poller.
+    A file not valid is logged and the previous profiles are kept. No file means the global thresholds.
+    """
+
+    def __init__(self, path=THRESHOLD_PROFILES_FILE, defaults=DEFAULT_THRESHOLDS):
+        """
+        :param path: the profiles JSON file
+        :param defaults: the thresholds when no rule matches
+        """
+        self.path = path
+        self.defaults = defaults
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._profile_set = ProfileSet([], defaults)
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """
+        This function will load the profiles file again, if modified since the last load
+        :return: True if the profiles changed
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            if mtime is None:
+                profile_set = ProfileSet([], self.defaults)
+            else:
+                try:
+                    with open(self.path, 'r') as filehandle:
+                        rules = json.load(filehandle)
+                    if not isinstance(rules, list):
+                        raise ValueError('Profiles file is not a list of rules')
+                    profile_set = ProfileSet(rules, self.defaults)
+                except (OSError, ValueError, TypeError) as error:
+                    logging.error('Threshold profiles not valid, keeping the previous profiles: %s', error)
+                    self._mtime = mtime
+                    return False
+            self._mtime = mtime
+            # replaced in one assignment, the lookups in progress use the previous profiles
+            self._profile_set = profile_set
+        logging.info('Threshold profiles loaded, %s rules', profile_set.rule_count)
+        print('\nThreshold profiles loaded:', profile_set.rule_count, 'rules')
+        return True
+
+    def get_thresholds(self, location, ssid, ap_name):
+        """
+        This function will return the thresholds for a client connected at the {location}, {ssid} and {ap_name}
+        :param location: the client location, site hierarchy
+        :param ssid: the client SSID
+        :param ap_name: the access point name
+        :return: Thresholds
+        """
+        return self._profile_set.get_thresholds(location, ssid, ap_name)
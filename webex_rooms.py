@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+Copyright (c) 2020 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+
+"""
+
+__author__ = "Gabriel Zapodeanu TME, ENB"
+__email__ = "gzapodea@cisco.com"
+__version__ = "0.1.0"
+__copyright__ = "Copyright (c) 2020 Cisco and/or its affiliates."
+__license__ = "Cisco Sample Code License, Version 1.1"
+
+
+import json
+import time
+import logging
+import threading
+
+from config import WHATSOP_BOT_AUTH, WEBEX_TEAMS_URL
+from config import WEBEX_ROOM_CACHE_TTL, WEBEX_ROOM_MISS_REFRESH
+
+import http_transport
+from adaptive_cards import with_room_id
+from app_metrics import instrumented
+
+# Webex Teams returns 404 for an unknown room id, 400 for a malformed one
+UNKNOWN_ROOM_STATUS_CODES = (400, 404)
+
+_rooms = {}  # Webex Teams room name -> room id
+_rooms_time = 0.0  # monotonic time of the last refresh, 0 if never refreshed
+_rooms_lock = threading.Lock()
+
+
+@instrumented('webex-rooms')
+def get_rooms_page(url):
+    """
+    This function will return one page of the Webex Teams spaces the bot is a member of
+    :param url: the page url
+    :return: the Webex Teams response
+    """
+    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
+    return http_transport.get(url, headers=header, verify=False)
+
+
+def list_rooms():
+    """
+    This function will list all the Webex Teams spaces the bot is a member of
+    Call to Webex Teams - /rooms, following the Link header pagination
+    :return: dict with the Webex Teams room name -> room id
+    """
+    rooms = {}
+    url = WEBEX_TEAMS_URL + '/v1/rooms' + '?sortBy=lastactivity&max=1000'
+    while url:
+        space_response = get_rooms_page(url)
+        space_response.raise_for_status()
+        for spaces in space_response.json()['items']:
+            # rooms are sorted by last activity, keep the most recently active room for a duplicated name
+            rooms.setdefault(spaces['title'], spaces['id'])
+        url = space_response.links.get('next', {}).get('url')
+    return rooms
+
+
+def refresh_rooms():
+    """
+    This function will refresh the Webex Teams room directory cache
+    :return: none
+    """
+    global _rooms, _rooms_time
+    rooms = list_rooms()
+    with _rooms_lock:
+        _rooms = rooms
+        _rooms_time = time.monotonic()
+    logging.info('Webex Teams room directory refreshed, %s rooms', len(rooms))
+
+
+def get_room_id(room_name):
+    """
+    This function will find the Webex Teams space id based on the {room_name}, using the room directory cache
+    The cache is refreshed when older than WEBEX_ROOM_CACHE_TTL seconds, or when the room is not found
+    and the cache is older than WEBEX_ROOM_MISS_REFRESH seconds
+    :param room_name: The Webex Teams room name
+    :return: the Webex Teams room Id, None if not found
+    """
+    cache_age = time.monotonic() - _rooms_time
+    room_id = _rooms.get(room_name)
+    if _rooms_time == 0.0 or cache_age > WEBEX_ROOM_CACHE_TTL or (
+            room_id is None and cache_age > WEBEX_ROOM_MISS_REFRESH):
+        refresh_rooms()
+        room_id = _rooms.get(room_name)
+    return room_id
+
+
+def invalidate_room(room_name):
+    """
+    This function will remove the {room_name} from the room directory cache, and force a refresh on the next lookup
+    :param room_name: The Webex Teams room name
+    :return: none
+    """
+    global _rooms_time
+    with _rooms_lock:
+        _rooms.pop(room_name, None)
+        _rooms_time = 0.0
+
+
+@instrumented('webex-messages')
+def post_message(body):
+    """
+    This function will post the message JSON {body}, with the roomId, to Webex Teams
+    Call to Webex Teams - /messages
+    :param body: the message JSON
+    :return: the Webex Teams response
+    """
+    url = WEBEX_TEAMS_URL + '/messages'
+    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
+    return http_transport.post(url, data=body, headers=header, verify=False)
+
+
+def post_room_body(room_name, body):
+    """
+    This function will post the message JSON {body}, without the roomId, to the Webex Teams space with the {room_name}
+    If the post fails because the cached room id is unknown, the room is invalidated, looked up again,
+    and the post is retried once
+    :param room_name: The Webex Teams room name
+    :param body: the message JSON, as rendered by the adaptive_cards module, the roomId is added
+    :return: the Webex Teams response
+    """
+    response = post_message(with_room_id(body, get_room_id(room_name)))
+    if response.status_code in UNKNOWN_ROOM_STATUS_CODES:
+        logging.warning('Webex Teams post failed for the room: %s, status: %s', room_name, response.status_code)
+        invalidate_room(room_name)
+        response = post_message(with_room_id(body, get_room_id(room_name)))
+    return response
+
+
+def post_room_payload(room_name, payload):
+    """
+    This function will post the message {payload} to the Webex Teams space with the {room_name}
+    :param room_name: The Webex Teams room name
+    :param payload: the message payload, the roomId is added
+    :return: the Webex Teams response
+    """
+    payload = {key: value for key, value in payload.items() if key != 'roomId'}
+    return post_room_body(room_name, json.dumps(payload))
@@ -28,15 +28,18 @@ __license__ = "Cisco Sample Code License, Version 1.1"
 import json
 import os
 import time
+import logging
 
-import requests
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
 
-from config import DNAC_URL
 from config import WHATSOP_BOT_AUTH, WEBEX_TEAMS_URL, WHATSOP_ROOM, WHATSOP_BOT_ID
-from config import WIRELESS_FOLDER
-from config import WHATSOP_ROOM
+
+import http_transport
+import webex_rooms
+from status_index import read_status_file
+from adaptive_cards import render_status_card, with_room_id
+from app_metrics import instrumented
 
 os.environ['TZ'] = 'America/Los_Angeles'  # define the timezone for PST
 time.tzset()  # adjust the timezone, more info https://help.pythonanywhere.com/pages/SettingTheTimezone/
@@ -44,7 +47,7 @@ time.tzset()  # adjust the timezone, more info https://help.pythonanywhere.com/p
 urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
 
 
-def message_handler(teams_message):
+def message_handler(teams_message, status_index=None):
     """
     This function will process all the messages addressed to the bot.
     It will:
@@ -52,116 +55,51 @@ def message_handler(teams_message):
      - read the message from teams
      - respond to the message
     :param teams_message: the initial notifications message the bot is informed there is a new message
+    :param status_index: optional StatusIndex with the last client reports, the files are read if not provided
     :return: status of the message process engine
     """
-    # parse and select the message id
+    # parse and select the message id, and the room id where the message was posted
     message_id = teams_message['data']['id']
+    room_id = teams_message['data'].get('roomId')
     message_info = get_bot_message_by_id(message_id, WHATSOP_BOT_ID)
-    print('Teams message content: ' + str(message_info))
+    logging.info('Teams message content: %s', message_info)
     if str.lower(message_info) in ["whatsop help", "whatsop manage"]:  # convert the message to lower case
         post_menu = '<p>I can help you with: <br/><strong>client status</strong> - Enter @WhatsOp + wireless username + status'
-        post_room_markdown_message(WHATSOP_ROOM, post_menu)
-    elif 'status' in str.lower(message_info):
+        post_room_markdown_message(WHATSOP_ROOM, post_menu, room_id)
+    elif 'status' in str.lower(message_info) and len(message_info.split(' ')) > 1:
         username = message_info.split(' ')[1]
 
-        # attempt to open the file with the user name, if not available, reply user not found
-        try:
-            with open(WIRELESS_FOLDER + '/' + username + '.json', 'r') as filehandle:
-                user_txt = filehandle.read()
-                user_info = json.loads(user_txt)
-
-                # parse the user data
-                client_mac = user_info['details']['mac_address']
-                location = user_info['details']['location']
-                ap_name = user_info['details']['access_point']
-                ssid = user_info['details']['ssid']
-                client_health = user_info['details']['health_score'][0]['score']
-                snr = user_info['details']['snr']
-                timestamp = user_info['details']['timestamp']
-
-                # prepare card message
-                # find the Webex Teams space id
-                space_id = get_room_id(WHATSOP_ROOM)
-
-                card_message = {
-                    "roomId": space_id,
-                    "markdown": "Wireless Client Status",
-                    "attachments": [
-                        {
-                            "contentType": "application/vnd.microsoft.card.adaptive",
-                            "content": {
-                                "$schema": "http://adaptivecards.io/schemas/adaptive-card.json",
-                                "type": "AdaptiveCard",
-                                "version": "1.0",
-                                "body": [
-                                    {
-                                        "type": "TextBlock",
-                                        "text": "Wireless Client Status",
-                                        "weight": "bolder",
-                                        "size": "large"
-                                    },
-                                    {
-                                        "type": "TextBlock",
-                                        "text": "Last collected status for this client, " + str(timestamp) + ":",
-                                        "wrap": True
-                                    },
-                                    {
-                                        "type": "FactSet",
-                                        "facts": [
-                                            {
-                                                "title": "Username: ",
-                                                "value": username
-                                            },
-                                            {
-                                                "title": "MAC Address:",
-                                                "value": client_mac
-                                            },
-                                            {
-                                                "title": "Location:",
-                                                "value": location
-                                            },
-                                            {
-                                                "title": "Access Point:",
-                                                "value": ap_name
-                                            },
-                                            {
-                                                "title": "SSID:",
-                                                "value": ssid
-                                            },
-                                            {
-                                                "title": "Health Score:",
-                                                "value": str(client_health)
-                                            },
-                                            {
-                                                "title": "SNR:",
-                                                "value": str(snr)
-                                            }
-                                        ]
-                                    }
-                                ],
-                                "actions": [
-                                    {
-                                        "type": "Action.openURL",
-                                        "title": "Cisco DNA Center Client 360",
-                                        "url": DNAC_URL + '/dna/assurance/client/details?macAddress=' + client_mac
-                                    }
-                                ]
-                            }
-                        }
-                    ]
-                }
-
-                post_room_card_message(card_message)
-
-        except:
-            # file not found for user post teams message
+        # find the last collected report for the user, if not available, reply user not found
+        if status_index is not None:
+            user_info = status_index.get(username)
+        else:
+            user_info = read_status_file(username)
+        if user_info is None:
             post_menu = '<p>No data was collected for this user: <br/><strong>' + username + '</strong>'
-            post_room_markdown_message(WHATSOP_ROOM, post_menu)
+            post_room_markdown_message(WHATSOP_ROOM, post_menu, room_id)
+            return
+
+        # prepare card message
+        try:
+            card_message = render_status_card(username, user_info['details'])
+        except (KeyError, IndexError, TypeError):
+            logging.warning('Wireless client status not valid, username: %s', username)
+            post_menu = '<p>The data collected for this user is not complete: <br/><strong>' + username + '</strong>'
+            post_room_markdown_message(WHATSOP_ROOM, post_menu, room_id)
+            return
+
+        # reply in the space the message was posted, if not known, post to the space using the room directory
+        # cache, the room is looked up again if the cached room id is unknown
+        if room_id is None:
+            webex_rooms.post_room_body(WHATSOP_ROOM, card_message)
+        else:
+            post_room_card_message(with_room_id(card_message, room_id))
     else:
         post_menu = '<p>I can help you with: <br/><strong>client status</strong> - Enter wireless username + " status"'
-        post_room_markdown_message(WHATSOP_ROOM, post_menu)
+        post_room_markdown_message(WHATSOP_ROOM, post_menu, room_id)
 
 
+@instrumented('webex-message-details')
 def get_bot_message_by_id(message_id, bot_id):
     """
     This function will get the message content using the {message_id}
@@ -171,7 +109,7 @@ def get_bot_message_by_id(message_id, bot_id):
     """
     url = WEBEX_TEAMS_URL + '/messages/' + message_id
     header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    response = requests.get(url, headers=header, verify=False)
+    response = http_transport.get(url, headers=header, verify=False)
     response_json = response.json()
     all_people = response_json['mentionedPeople']
     for people in all_people:
@@ -180,63 +118,49 @@ def get_bot_message_by_id(message_id, bot_id):
     return None
 
 
-def post_room_markdown_message(space_name, message):
+def post_room_markdown_message(space_name, message, room_id=None):
     """
     This function will post a markdown {message} to the Webex Teams space with the {space_name}
-    Call to function get_space_id(space_name) to find the space_id
+    If the {room_id} is known, for example from the webhook payload, the message is posted to it directly,
+    otherwise the room id is found using the room directory cache
     Followed by API call /messages
     :param space_name: the Webex Teams space name
     :param message: the text of the markdown message to be posted in the space
+    :param room_id: optional Webex Teams room Id
     :return: none
     """
-    space_id = get_room_id(space_name)
-    payload = {'roomId': space_id, 'markdown': message}
-    url = WEBEX_TEAMS_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    if room_id is None:
+        webex_rooms.post_room_payload(space_name, {'markdown': message})
+        return
+    payload = {'roomId': room_id, 'markdown': message}
+    webex_rooms.post_message(json.dumps(payload))
 
 
 def get_room_id(room_name):
     """
-    This function will find the Webex Teams space id based on the {space_name}
-    Call to Webex Teams - /rooms
+    This function will find the Webex Teams space id based on the {space_name}, using the room directory cache
     :param room_name: The Webex Teams room name
     :return: the Webex Teams room Id
     """
-    room_id = None
-    url = WEBEX_TEAMS_URL + '/rooms' + '?max=1000'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    space_response = requests.get(url, headers=header, verify=False)
-    space_list_json = space_response.json()
-    space_list = space_list_json['items']
-    for spaces in space_list:
-        if spaces['title'] == room_name:
-            room_id = spaces['id']
-    return room_id
+    return webex_rooms.get_room_id(room_name)
 
 
 def post_room_message(space_name, message):
     """
     This function will post the {message} to the Webex Teams space with the {space_name}
-    Call to function get_space_id(space_name) to find the space_id
+    The room id is found using the room directory cache
     Followed by API call /messages
     :param space_name: the Webex Teams space name
     :param message: the text of the message to be posted in the space
     :return: none
     """
-    space_id = get_room_id(space_name)
-    payload = {'roomId': space_id, 'text': message}
-    url = WEBEX_TEAMS_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    webex_rooms.post_room_payload(space_name, {'text': message})
 
 
 def post_room_card_message(card_message):
     """
     This function will post a adaptive card message {card_message} to the Webex Teams space with the {space_name}
-    :param card_message: card message
+    :param card_message: card message JSON, rendered by the adaptive_cards module, with the roomId
     :return: none
     """
-    url = WEBEX_TEAMS_URL + '/messages'
-    header = {'content-type': 'application/json', 'authorization': WHATSOP_BOT_AUTH}
-    requests.post(url, data=json.dumps(card_message), headers=header, verify=False)
+    webex_rooms.post_message(card_message)